@@ -0,0 +1,433 @@
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, defaultdict
+from dataclasses import asdict, dataclass, fields
+from typing import Any, Dict, Iterator, Mapping, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import RunnableConfig
+
+from open_deep_research.rate_limiting import get_llm_limiter_metrics
+from open_deep_research.response_cache import RESPONSE_CACHE_HIT_KEY
+from open_deep_research.router import get_router_metrics
+
+# USD per million tokens: (input, cached input, output). Model names are matched by
+# substring, longest first, so Azure deployment names containing the model name work.
+MODEL_PRICES: Dict[str, Tuple[float, float, float]] = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "o3-mini": (1.10, 0.55, 4.40),
+    "o4-mini": (1.10, 0.275, 4.40),
+    "o3": (2.00, 0.50, 8.00),
+    "claude-3-5-haiku": (0.80, 0.08, 4.00),
+    "claude-3-5-sonnet": (3.00, 0.30, 15.00),
+    "claude-3-7-sonnet": (3.00, 0.30, 15.00),
+    "claude-sonnet-4": (3.00, 0.30, 15.00),
+    "claude-opus-4": (15.00, 1.50, 75.00),
+}
+
+# Surcharge on the input price for tokens written to the prompt cache (Anthropic, 5 minute lifetime)
+CACHE_WRITE_PRICE_FACTOR = 1.25
+
+# Name of the report section the current task works on, set by the section nodes
+current_section: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_section", default=None)
+
+# Id of the report the current task works on, set by the report nodes from their state (see track_report)
+current_report: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_report", default=None)
+
+
+def get_model_price(model: Optional[str]) -> Optional[Tuple[float, float, float]]:
+    """Look up the price of a model, None if unknown."""
+    if not model:
+        return None
+    for name in sorted(MODEL_PRICES, key=len, reverse=True):
+        if name in model:
+            return MODEL_PRICES[name]
+    return None
+
+
+@dataclass
+class UsageStats:
+    """Accumulated usage of a group of LLM or search calls."""
+    calls: int = 0
+    retries: int = 0 # Failed attempts, retried or raised
+    latency: float = 0.0 # Seconds spent in calls
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0 # Input tokens read from the provider's prompt cache
+    cache_creation_tokens: int = 0 # Input tokens written to the provider's prompt cache
+    cost: float = 0.0 # USD, for models listed in MODEL_PRICES
+    unpriced_calls: int = 0 # LLM calls of models without a price
+    queries: int = 0 # Search queries
+    results: int = 0 # Search results returned after processing
+    streamed_calls: int = 0 # LLM calls that streamed their output
+    time_to_first_token: float = 0.0 # Seconds until the first token, summed over streamed calls
+    response_cache_hits: int = 0 # LLM calls answered by the response cache, at no cost
+
+    def add(self, other: "UsageStats"):
+        for item in fields(self):
+            setattr(self, item.name, getattr(self, item.name) + getattr(other, item.name))
+
+
+class RunUsage:
+    """Usage of one report of a graph thread, grouped by node, section and model or search API.
+
+    Its clock starts with the report and can be paused while the report waits for the
+    user (see pause), so that budgets and deadlines only count the time spent working.
+    Its id, clock and spend totals are kept in the graph state as a snapshot, from
+    which a report resumed in another process gets them back (see track_report).
+    """
+
+    def __init__(self, thread_id: Optional[str] = None, report_id: Optional[str] = None, started_at: Optional[float] = None):
+        self.thread_id = thread_id
+        self.report_id = report_id or uuid.uuid4().hex
+        self.started_at = time.time() if started_at is None else started_at
+        self.paused = 0.0 # Seconds the clock was paused
+        self._paused_at: Optional[float] = None
+        self.llm = UsageStats()
+        self.search = UsageStats()
+        self.groups: Dict[str, Dict[str, UsageStats]] = defaultdict(lambda: defaultdict(UsageStats))
+        self.budget: Dict[str, Any] = {} # Level and pressure of the report budget, set by govern_budget
+        self.grading: Counter = Counter() # Counters of the section grading cascade, see record_grading
+        self._lock = threading.RLock()
+
+    def pause(self):
+        """Stop the clock of the report, e.g. while waiting for human feedback (no-op if stopped)."""
+        with self._lock:
+            if self._paused_at is None:
+                self._paused_at = time.time()
+
+    def resume(self):
+        """Restart the clock stopped by pause."""
+        with self._lock:
+            if self._paused_at is not None:
+                self.paused += time.time() - self._paused_at
+                self._paused_at = None
+
+    def elapsed(self) -> float:
+        """Seconds since the start of the report, without the time the clock was paused."""
+        with self._lock:
+            return (self._paused_at or time.time()) - self.started_at - self.paused
+
+    def record(self, kind: str, stats: UsageStats, node: Optional[str], section: Optional[str], name: Optional[str]):
+        """Add the usage of a call of the given kind ("llm" or "search")."""
+        with self._lock:
+            (self.llm if kind == "llm" else self.search).add(stats)
+            self.groups[f"{kind}_by_node"][node or "unknown"].add(stats)
+            if section:
+                self.groups[f"{kind}_by_section"][section].add(stats)
+            self.groups[f"{kind}_by_model" if kind == "llm" else f"{kind}_by_api"][name or "unknown"].add(stats)
+
+    def record_grading(self, *counters: str):
+        """Count events of the section grading cascade (graded, escalated, agreed, ...)."""
+        with self._lock:
+            self.grading.update(counters)
+
+    def grading_stats(self) -> Dict[str, Any]:
+        """Grading cascade counters with the escalation rate and the agreement rate of escalated grades."""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self.grading)
+        graded = stats.get("graded", 0)
+        compared = stats.get("agreed", 0) + stats.get("disagreed", 0)
+        stats["escalation_rate"] = stats.get("escalated", 0) / graded if graded else 0.0
+        stats["agreement_rate"] = stats.get("agreed", 0) / compared if compared else 0.0
+        return stats
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Id, clock and spend totals of the report, kept in the graph state under ``report_usage``."""
+        with self._lock:
+            return {
+                "report_id": self.report_id,
+                "thread_id": self.thread_id,
+                "started_at": self.started_at,
+                "paused": self.paused,
+                "paused_at": self._paused_at,
+                "updated_at": time.time(),
+                "llm": asdict(self.llm),
+                "search": asdict(self.search),
+                "grading": dict(self.grading),
+            }
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Mapping[str, Any]) -> "RunUsage":
+        """Usage of a report rebuilt from its snapshot, without the groups by node, section and model."""
+        usage = cls(snapshot.get("thread_id"), snapshot["report_id"], snapshot["started_at"])
+        usage.paused = snapshot.get("paused", 0.0)
+        usage._paused_at = snapshot.get("paused_at")
+        for kind in ("llm", "search"):
+            totals = snapshot.get(kind) or {}
+            setattr(usage, kind, UsageStats(**{item.name: totals[item.name] for item in fields(UsageStats) if item.name in totals}))
+        usage.grading.update(snapshot.get("grading") or {})
+        return usage
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "thread_id": self.thread_id,
+                "report_id": self.report_id,
+                "elapsed": self.elapsed(),
+                "paused": self.paused,
+                "llm": asdict(self.llm),
+                # share of the input tokens billed at the cached price
+                "llm_cache_hit_rate": self.llm.cached_tokens / self.llm.input_tokens if self.llm.input_tokens else 0.0,
+                "search": asdict(self.search),
+                "budget": dict(self.budget),
+                "grading": self.grading_stats(),
+                **{
+                    group: {key: asdict(stats) for key, stats in by_key.items()}
+                    for group, by_key in self.groups.items()
+                },
+            }
+
+    def export_json(self, path: str):
+        """Write the usage of the run to a JSON file."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+def merge_report_usage(left: Optional[Dict[str, Any]], right: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """State reducer of report usage snapshots (see RunUsage.snapshot).
+
+    A snapshot of another report replaces the current one. Snapshots of the same
+    report, written by parallel branches, are merged: the totals only grow, so the
+    largest of each is kept, with the clock of the latest snapshot.
+    """
+    if not left or not right or left["report_id"] != right["report_id"]:
+        return right or left or {}
+    latest = right if right["updated_at"] >= left["updated_at"] else left
+    merged = dict(latest)
+    for kind in ("llm", "search", "grading"):
+        totals = {**left.get(kind, {}), **right.get(kind, {})}
+        merged[kind] = {key: max(left.get(kind, {}).get(key, 0), right.get(kind, {}).get(key, 0)) for key in totals}
+    return merged
+
+
+# Usage of the most recent reports by id, and id of the current report of each thread.
+# The reports of the graph state are rebuilt from their snapshots once dropped.
+MAX_RUN_USAGES = 256
+_RUN_USAGES: "OrderedDict[str, RunUsage]" = OrderedDict()
+_THREAD_REPORTS: "OrderedDict[Optional[str], str]" = OrderedDict()
+_RUN_USAGES_LOCK = threading.Lock()
+
+
+def _store_run_usage(usage: RunUsage, current: bool = True) -> RunUsage:
+    _RUN_USAGES[usage.report_id] = usage
+    _RUN_USAGES.move_to_end(usage.report_id)
+    if current:
+        _THREAD_REPORTS[usage.thread_id] = usage.report_id
+        _THREAD_REPORTS.move_to_end(usage.thread_id)
+    while len(_RUN_USAGES) > MAX_RUN_USAGES:
+        _RUN_USAGES.popitem(last=False)
+    while len(_THREAD_REPORTS) > MAX_RUN_USAGES:
+        _THREAD_REPORTS.popitem(last=False)
+    return usage
+
+
+def get_run_usage(thread_id: Optional[str]) -> RunUsage:
+    """Get the usage accounting of the latest report started in a graph thread.
+
+    Used for calls made outside the report nodes (see track_report). Runs without a
+    thread id share the same latest report.
+    """
+    with _RUN_USAGES_LOCK:
+        usage = _RUN_USAGES.get(_THREAD_REPORTS.get(thread_id, ""))
+        return _store_run_usage(usage or RunUsage(thread_id))
+
+
+def start_run_usage(thread_id: Optional[str]) -> RunUsage:
+    """Start the usage accounting of a new report of a graph thread, with a fresh id, budget and clock."""
+    with _RUN_USAGES_LOCK:
+        return _store_run_usage(RunUsage(thread_id))
+
+
+def _config_thread_id(config: Optional[RunnableConfig]) -> Optional[str]:
+    return ((config or {}).get("configurable") or {}).get("thread_id")
+
+
+def get_config_usage(config: Optional[RunnableConfig]) -> RunUsage:
+    """Get the usage accounting of the report a runnable config belongs to.
+
+    This is the report the current node works on (see track_report), or else the
+    latest report started in the thread of the config.
+    """
+    thread_id = _config_thread_id(config)
+    report_id = current_report.get()
+    if report_id is not None:
+        with _RUN_USAGES_LOCK:
+            usage = _RUN_USAGES.get(report_id)
+        if usage is not None and usage.thread_id == thread_id:
+            return usage
+    return get_run_usage(thread_id)
+
+
+def start_config_usage(config: Optional[RunnableConfig]) -> RunUsage:
+    """Start the usage accounting of a new report in the thread of a runnable config."""
+    return start_run_usage(_config_thread_id(config))
+
+
+def track_report(state: Mapping[str, Any], config: Optional[RunnableConfig] = None) -> RunUsage:
+    """Attribute the calls of the running node to the report of its graph state.
+
+    Report nodes call it first, like they set current_section: the report is found
+    by the id of the ``report_usage`` snapshot its start_report node wrote to the
+    state, so concurrent runs without a thread id keep their own budgets and
+    clocks. A report the process does not hold (resumed after a restart, or
+    dropped from memory) is rebuilt from the snapshot, with the spend totals,
+    start time and pause time recorded in the state.
+
+    Args:
+        state: Graph state of the node, with the ``report_usage`` snapshot
+        config: Runnable config of the node, for states without a snapshot
+
+    Returns:
+        RunUsage: Usage accounting of the report
+    """
+    snapshot = state.get("report_usage")
+    if not snapshot:
+        return get_config_usage(config)
+    with _RUN_USAGES_LOCK:
+        usage = _RUN_USAGES.get(snapshot["report_id"])
+        if usage is None:
+            usage = _store_run_usage(RunUsage.from_snapshot(snapshot), current=False)
+    current_report.set(usage.report_id)
+    return usage
+
+
+def export_run_usage(config: Optional[RunnableConfig], export_dir: Optional[str]) -> Dict[str, Any]:
+    """Get the usage of the current report as a dict, and write it to ``<export_dir>/<thread_id>-<report_id>.json`` if set.
+
+    The process-wide queue-wait metrics of the model deployment limiters are included
+    under ``llm_limiters``, and the health of routed deployments under ``llm_routes``.
+    """
+    usage = {
+        **get_config_usage(config).to_dict(),
+        "llm_limiters": get_llm_limiter_metrics(),
+        "llm_routes": get_router_metrics(),
+    }
+    if export_dir:
+        os.makedirs(export_dir, exist_ok=True)
+        with open(os.path.join(export_dir, f"{usage['thread_id'] or 'default'}-{usage['report_id']}.json"), "w") as f:
+            json.dump(usage, f, indent=2)
+    return usage
+
+
+@contextlib.contextmanager
+def track_search(config: Optional[RunnableConfig], search_api: str, queries: list) -> Iterator[UsageStats]:
+    """Record the latency of a search, its queries and (set by the caller) its results."""
+    stats = UsageStats(calls=1, queries=len(queries))
+    start = time.perf_counter()
+    try:
+        yield stats
+    except BaseException:
+        stats.retries += 1
+        raise
+    finally:
+        stats.latency = time.perf_counter() - start
+        node = ((config or {}).get("metadata") or {}).get("langgraph_node")
+        get_config_usage(config).record("search", stats, node, current_section.get(), search_api)
+
+
+def _usage_of_call(thread_id: Optional[str]) -> RunUsage:
+    """Usage accounting of an LLM call starting in the current task, in the given thread."""
+    return get_config_usage({"configurable": {"thread_id": thread_id}})
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """Records tokens, prompt cache reads and writes, latency, failed attempts and cost of chat model calls.
+
+    For streamed calls the time from the start of the call to its first token is
+    recorded as well. Calls are attributed to the report the calling node works on
+    (see track_report), or else to the latest report of the thread, to the graph node
+    found in the run metadata, and to the section in ``current_section``. Calls
+    answered by the response cache are counted as hits, without tokens or cost.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._runs: Dict[UUID, tuple] = {}
+        self._first_tokens: Dict[UUID, float] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata: Optional[Dict[str, Any]] = None, invocation_params: Optional[Dict[str, Any]] = None, **kwargs: Any):
+        metadata = metadata or {}
+        params = invocation_params or {}
+        model = params.get("model") or params.get("model_name") or params.get("azure_deployment") or params.get("deployment_name")
+        with self._lock:
+            self._runs[run_id] = (
+                time.perf_counter(), _usage_of_call(metadata.get("thread_id")), metadata.get("langgraph_node"), current_section.get(), model
+            )
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any):
+        if run_id not in self._first_tokens:
+            with self._lock:
+                self._first_tokens.setdefault(run_id, time.perf_counter())
+
+    def _finish(self, run_id: UUID) -> Optional[tuple]:
+        with self._lock:
+            self._first_tokens.pop(run_id, None)
+            return self._runs.pop(run_id, None)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        first_token = self._first_tokens.get(run_id)
+        run = self._finish(run_id)
+        if run is None:
+            return
+        start, run_usage, node, section, model = run
+        stats = UsageStats(calls=1, latency=time.perf_counter() - start)
+        if first_token is not None:
+            stats.streamed_calls = 1
+            stats.time_to_first_token = first_token - start
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                if message is not None:
+                    # the model reported by the provider is more precise than a deployment name
+                    model = message.response_metadata.get("model_name") or message.response_metadata.get("model") or model
+                    if message.response_metadata.get(RESPONSE_CACHE_HIT_KEY):
+                        # the tokens of a cached response were paid for by the call that stored it
+                        stats.response_cache_hits = 1
+                        continue
+                usage = getattr(message, "usage_metadata", None) or {}
+                stats.input_tokens += usage.get("input_tokens", 0)
+                stats.output_tokens += usage.get("output_tokens", 0)
+                token_details = usage.get("input_token_details") or {}
+                stats.cached_tokens += token_details.get("cache_read", 0) or 0
+                stats.cache_creation_tokens += token_details.get("cache_creation", 0) or 0
+        price = get_model_price(model)
+        if price is None:
+            stats.unpriced_calls = 0 if stats.response_cache_hits else 1
+        else:
+            input_price, cached_price, output_price = price
+            stats.cost = (
+                (stats.input_tokens - stats.cached_tokens - stats.cache_creation_tokens) * input_price
+                + stats.cache_creation_tokens * input_price * CACHE_WRITE_PRICE_FACTOR
+                + stats.cached_tokens * cached_price
+                + stats.output_tokens * output_price
+            ) / 1_000_000
+        run_usage.record("llm", stats, node, section, model)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        run = self._finish(run_id)
+        if run is None:
+            return
+        start, run_usage, node, section, model = run
+        stats = UsageStats(retries=1, latency=time.perf_counter() - start)
+        run_usage.record("llm", stats, node, section, model)
+
+
+# Attached to every chat model created through get_chat_model
+USAGE_CALLBACK_HANDLER = UsageCallbackHandler()
@@ -0,0 +1,126 @@
+import dataclasses
+import logging
+import math
+from typing import Optional, TypeVar
+
+from langchain_core.runnables import RunnableConfig
+
+from open_deep_research.accounting import RunUsage, get_config_usage
+
+logger = logging.getLogger(__name__)
+
+# Spent shares of the report budget at which the research is trimmed, moved to the
+# economy model tier, and stopped
+BUDGET_TRIM_AT = 0.5
+BUDGET_ECONOMY_AT = 0.75
+BUDGET_EXHAUSTED_AT = 0.9
+
+# Names of the budget levels, by level
+BUDGET_LEVELS = ("full", "trimmed", "economy", "exhausted")
+
+ConfigurationT = TypeVar("ConfigurationT")
+
+
+def get_budget_pressure(
+    usage: RunUsage,
+    token_budget: Optional[float] = None,
+    cost_budget: Optional[float] = None,
+    time_budget: Optional[float] = None,
+) -> float:
+    """Largest spent share of the token, cost and wall-clock budgets of a report, 0 without budgets.
+
+    The wall clock does not count the time the report waited for the user.
+    """
+    shares = [0.0]
+    if token_budget:
+        shares.append((usage.llm.input_tokens + usage.llm.output_tokens) / float(token_budget))
+    if cost_budget:
+        shares.append(usage.llm.cost / float(cost_budget))
+    if time_budget:
+        shares.append(usage.elapsed() / float(time_budget))
+    return max(shares)
+
+
+def get_budget_level(pressure: float) -> int:
+    """Index in BUDGET_LEVELS of the level reached at a budget pressure."""
+    if pressure >= BUDGET_EXHAUSTED_AT:
+        return 3
+    if pressure >= BUDGET_ECONOMY_AT:
+        return 2
+    if pressure >= BUDGET_TRIM_AT:
+        return 1
+    return 0
+
+
+def govern_budget(configurable: ConfigurationT, config: Optional[RunnableConfig]) -> ConfigurationT:
+    """Scale the configuration of a node down to the budget the report has left.
+
+    The spend of the report so far (tokens, cost and elapsed time from the usage
+    accounting) is compared with ``token_budget``, ``cost_budget`` and ``time_budget``,
+    and the largest spent share selects a level:
+
+    - trimmed (BUDGET_TRIM_AT): half the queries, at most one reflection loop, adaptive
+      summarization
+    - economy (BUDGET_ECONOMY_AT): one query, no reflection, extractive compression
+      instead of LLM summaries, and the economy model replaces the planner and writer
+      (or supervisor and researcher) models if set
+    - exhausted (BUDGET_EXHAUSTED_AT): no more queries, sections are written from the
+      sources they already have
+
+    The level is re-evaluated by every node, recorded under ``budget`` in the usage of
+    the run and announced when it changes. Configurations without a budget are
+    returned unchanged.
+
+    Args:
+        configurable: Configuration of the node (WorkflowConfiguration or MultiAgentConfiguration)
+        config: Runnable config of the run, identifying its usage accounting
+
+    Returns:
+        A copy of the configuration adjusted to the budget level, or the configuration itself
+    """
+    token_budget = getattr(configurable, "token_budget", None)
+    cost_budget = getattr(configurable, "cost_budget", None)
+    time_budget = getattr(configurable, "time_budget", None)
+    if not (token_budget or cost_budget or time_budget):
+        return configurable
+
+    usage = get_config_usage(config)
+    pressure = get_budget_pressure(usage, token_budget, cost_budget, time_budget)
+    level = get_budget_level(pressure)
+    if usage.budget.get("level") != BUDGET_LEVELS[level]:
+        if level:
+            logger.warning("Report budget %.0f%% spent, research scaled down to the %s level", pressure * 100, BUDGET_LEVELS[level])
+        usage.budget["level"] = BUDGET_LEVELS[level]
+    usage.budget["pressure"] = pressure
+    if level == 0:
+        return configurable
+
+    names = {f.name for f in dataclasses.fields(configurable)}
+    changes = {}
+    number_of_queries = int(configurable.number_of_queries)
+    if level == 1:
+        changes["number_of_queries"] = max(1, math.ceil(number_of_queries / 2))
+        if "max_search_depth" in names:
+            changes["max_search_depth"] = min(int(configurable.max_search_depth), 1)
+        changes["summarization_policy"] = "adaptive"
+        return dataclasses.replace(configurable, **changes)
+
+    changes["number_of_queries"] = min(number_of_queries, 1) if level == 2 else 0
+    if "max_search_depth" in names:
+        changes["max_search_depth"] = 0
+    changes["summarization_policy"] = "adaptive"
+    changes["extractive_compression"] = "replace_summarization"
+    economy_model = getattr(configurable, "economy_model", None)
+    if economy_model:
+        if "writer_model" in names:
+            changes.update(
+                writer_provider=configurable.economy_provider,
+                writer_model=economy_model,
+                writer_model_kwargs=None,
+                planner_provider=configurable.economy_provider,
+                planner_model=economy_model,
+                planner_model_kwargs=None,
+            )
+        else:
+            changes.update(supervisor_model=economy_model, researcher_model=economy_model)
+    return dataclasses.replace(configurable, **changes)
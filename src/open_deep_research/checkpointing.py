@@ -0,0 +1,377 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import closing
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from open_deep_research.payloads import CompactSerializer, register_shared_text_loader
+
+logger = logging.getLogger(__name__)
+
+# Environment variable naming the SQLite file of the checkpointer of the bundled graphs
+CHECKPOINT_DB_ENV = "CHECKPOINT_DB_PATH"
+
+# Serialized values of at least this size are stored zlib-compressed
+CHECKPOINT_COMPRESS_MIN_BYTES = 1024
+
+# Pruning defaults: checkpoints kept per thread and namespace, days a thread is kept
+# after its last update, total stored size, hours during which an updated thread is
+# not deleted for the size limit, and seconds between two background prunes
+CHECKPOINT_MAX_PER_THREAD = 20
+CHECKPOINT_MAX_AGE_DAYS = 7.0
+CHECKPOINT_MAX_SIZE_MB = 512.0
+CHECKPOINT_KEEP_RECENT_HOURS = 24.0
+CHECKPOINT_PRUNE_INTERVAL = 3600.0
+
+
+class _StoredSerializer(CompactSerializer):
+    """CompactSerializer storing the shared texts it meets and compressing large values.
+
+    Shared texts are handed to ``put_shared_texts`` to be stored once by id, and values
+    of at least CHECKPOINT_COMPRESS_MIN_BYTES are zlib-compressed.
+    """
+
+    def __init__(self, put_shared_texts: Callable[[Dict[str, str]], None]):
+        super().__init__()
+        self.put_shared_texts = put_shared_texts
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        type_, data, shared = self.dumps_shared(obj)
+        if shared:
+            self.put_shared_texts(shared)
+        return _compress(type_, data)
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, data_ = data
+        if type_.endswith("+zlib"):
+            type_, data_ = type_[:-len("+zlib")], zlib.decompress(data_)
+        return super().loads_typed((type_, data_))
+
+
+def _compress(type_: str, data: bytes) -> Tuple[str, bytes]:
+    if len(data) >= CHECKPOINT_COMPRESS_MIN_BYTES:
+        return f"{type_}+zlib", zlib.compress(data)
+    return type_, data
+
+
+class SqliteCheckpointSaver(SqliteSaver):
+    """Durable checkpointer stored in SQLite (WAL mode), for resuming interrupted runs.
+
+    Checkpoints and writes are stored by langgraph's SqliteSaver, serialized with the
+    CompactSerializer: shared texts (e.g. the context handed to every section of a
+    fan-out) are stored once in ``shared_texts`` and referenced by id, and values
+    larger than CHECKPOINT_COMPRESS_MIN_BYTES are zlib-compressed. The last update of
+    each thread is kept in ``threads``, for pruning.
+
+    Nothing is deleted while checkpoints are written: prune_storage, or
+    prune_checkpoints from another process, is the maintenance routine, and
+    start_pruning runs it periodically in a background thread. The async methods run
+    the sync ones in a thread, so the saver serves both the sync and async graph APIs.
+
+    Args:
+        path: SQLite database file, created if missing
+        max_checkpoints_per_thread: Checkpoints kept per thread and namespace (all if None)
+        max_age_days: Days a thread is kept after its last update (forever if None)
+        max_size_mb: Upper bound of the stored size (unbounded if None)
+        keep_recent_hours: Hours during which an updated thread is not deleted for the size limit
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        max_checkpoints_per_thread: Optional[int] = CHECKPOINT_MAX_PER_THREAD,
+        max_age_days: Optional[float] = CHECKPOINT_MAX_AGE_DAYS,
+        max_size_mb: Optional[float] = CHECKPOINT_MAX_SIZE_MB,
+        keep_recent_hours: float = CHECKPOINT_KEEP_RECENT_HOURS,
+    ):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        super().__init__(sqlite3.connect(path, check_same_thread=False), serde=_StoredSerializer(self._put_shared_texts))
+        self.path = path
+        self.max_checkpoints_per_thread = max_checkpoints_per_thread
+        self.max_age_days = max_age_days
+        self.max_size_mb = max_size_mb
+        self.keep_recent_hours = keep_recent_hours
+        # Connection of the shared_texts and threads tables, written while SqliteSaver
+        # holds its lock (the serializer stores shared texts as it meets them)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._pruning: Optional[threading.Event] = None
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS shared_texts (id TEXT PRIMARY KEY, type TEXT, value BLOB, used_at REAL)"
+            )
+            self._connection.execute("CREATE TABLE IF NOT EXISTS threads (thread_id TEXT PRIMARY KEY, updated_at REAL)")
+        # the tables of SqliteSaver are needed by prune_checkpoints before the first checkpoint
+        self.setup()
+        register_shared_text_loader(self._load_shared_text)
+
+    def _put_shared_texts(self, shared: Dict[str, str]):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO shared_texts (id, type, value, used_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET used_at = excluded.used_at",
+                [(id, *_compress("text", text.encode()), now) for id, text in shared.items()],
+            )
+
+    def _load_shared_text(self, id: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection.execute("SELECT type, value FROM shared_texts WHERE id = ?", (id,)).fetchone()
+        if row is None:
+            return None
+        type_, data = row
+        return (zlib.decompress(data) if type_.endswith("+zlib") else data).decode()
+
+    def _touch(self, thread_id: str):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO threads (thread_id, updated_at) VALUES (?, ?) "
+                "ON CONFLICT (thread_id) DO UPDATE SET updated_at = excluded.updated_at",
+                (str(thread_id), time.time()),
+            )
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        saved = super().put(config, checkpoint, metadata, new_versions)
+        self._touch(saved["configurable"]["thread_id"])
+        return saved
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        super().put_writes(config, writes, task_id, task_path)
+        self._touch(config["configurable"]["thread_id"])
+
+    def delete_thread(self, thread_id: str) -> None:
+        super().delete_thread(thread_id)
+        with self._lock, self._connection:
+            _forget_thread(self._connection, str(thread_id))
+
+    def prune_storage(self) -> Dict[str, int]:
+        """Prune the database with the limits of the saver (see prune_checkpoints)."""
+        return prune_checkpoints(
+            self.path,
+            max_checkpoints_per_thread=self.max_checkpoints_per_thread,
+            max_age_days=self.max_age_days,
+            max_size_mb=self.max_size_mb,
+            keep_recent_hours=self.keep_recent_hours,
+        )
+
+    def start_pruning(self, interval: float = CHECKPOINT_PRUNE_INTERVAL):
+        """Run prune_storage every ``interval`` seconds in a daemon thread, from now on (no-op if running)."""
+        if self._pruning is not None:
+            return
+        self._pruning = stopped = threading.Event()
+
+        def run():
+            while not stopped.is_set():
+                try:
+                    deleted = self.prune_storage()
+                    if any(deleted.values()):
+                        logger.info("Pruned checkpoints of %s: %s", self.path, deleted)
+                except sqlite3.Error as e:
+                    logger.warning("Checkpoint pruning failed, retrying in %.0f s: %s", interval, e)
+                stopped.wait(interval)
+
+        threading.Thread(target=run, name="checkpoint-pruning", daemon=True).start()
+
+    def stop_pruning(self):
+        """Stop the background pruning started by start_pruning."""
+        if self._pruning is not None:
+            self._pruning.set()
+            self._pruning = None
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def _has_table(connection: sqlite3.Connection, table: str) -> bool:
+    return connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+
+def _forget_thread(connection: sqlite3.Connection, thread_id: str):
+    """Delete the update time of a thread and the sources (see SourceStore) no other thread refers to."""
+    connection.execute("DELETE FROM threads WHERE thread_id = ?", (thread_id,))
+    if _has_table(connection, "thread_sources"):
+        connection.execute(
+            "DELETE FROM sources WHERE ref IN (SELECT ref FROM thread_sources WHERE thread_id = ?) AND NOT EXISTS ("
+            "SELECT 1 FROM thread_sources AS other WHERE other.ref = sources.ref AND other.thread_id != ?)",
+            (thread_id, thread_id),
+        )
+        connection.execute("DELETE FROM thread_sources WHERE thread_id = ?", (thread_id,))
+
+
+def _delete_thread(connection: sqlite3.Connection, thread_id: str):
+    for table in ("checkpoints", "writes"):
+        connection.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+    _forget_thread(connection, thread_id)
+
+
+def _stored_size(connection: sqlite3.Connection) -> int:
+    queries = [
+        "SELECT SUM(LENGTH(checkpoint) + LENGTH(metadata)) FROM checkpoints",
+        "SELECT SUM(LENGTH(value)) FROM writes",
+        "SELECT SUM(LENGTH(value)) FROM shared_texts",
+    ]
+    if _has_table(connection, "sources"):
+        # search sources of the graph state, stored in the checkpoint database by default
+        queries.append("SELECT SUM(LENGTH(record)) FROM sources")
+    return sum(connection.execute(query).fetchone()[0] or 0 for query in queries)
+
+
+def prune_checkpoints(
+    path: str,
+    *,
+    max_checkpoints_per_thread: Optional[int] = CHECKPOINT_MAX_PER_THREAD,
+    max_age_days: Optional[float] = CHECKPOINT_MAX_AGE_DAYS,
+    max_size_mb: Optional[float] = CHECKPOINT_MAX_SIZE_MB,
+    keep_recent_hours: float = CHECKPOINT_KEEP_RECENT_HOURS,
+) -> Dict[str, int]:
+    """Delete expired threads, old checkpoints beyond the per-thread limit, and threads over the size limit.
+
+    Runs on its own connection to the database of a SqliteCheckpointSaver, so it can
+    run in a background thread or in another process while graphs write checkpoints.
+    The size limit only deletes the least recently updated threads that were not
+    updated within ``keep_recent_hours`` and whose latest checkpoint has no pending
+    writes (an interrupted or failed run, waiting to be resumed). The search sources
+    stored in the database count towards it, and those no remaining thread refers
+    to are deleted with the threads.
+
+    Args:
+        path: SQLite database file of the checkpointer
+        max_checkpoints_per_thread: Checkpoints kept per thread and namespace (all if None)
+        max_age_days: Days a thread is kept after its last update (forever if None)
+        max_size_mb: Upper bound of the stored size (unbounded if None)
+        keep_recent_hours: Hours during which an updated thread is not deleted for the size limit
+
+    Returns:
+        Dict[str, int]: Number of deleted threads and checkpoints
+    """
+    deleted = {"threads": 0, "checkpoints": 0}
+    now = time.time()
+    with closing(sqlite3.connect(path, timeout=30)) as connection, connection:
+        # threads checkpointed before they were tracked count as updated now
+        connection.execute(
+            "INSERT OR IGNORE INTO threads (thread_id, updated_at) SELECT DISTINCT thread_id, ? FROM checkpoints", (now,)
+        )
+
+        if max_age_days is not None:
+            cutoff = now - max_age_days * 86400
+            for (thread_id,) in connection.execute("SELECT thread_id FROM threads WHERE updated_at < ?", (cutoff,)).fetchall():
+                _delete_thread(connection, thread_id)
+                deleted["threads"] += 1
+            # shared texts are written again by every checkpoint referring to them
+            connection.execute("DELETE FROM shared_texts WHERE used_at < ?", (cutoff,))
+
+        if max_checkpoints_per_thread is not None:
+            for thread_id, checkpoint_ns in connection.execute(
+                "SELECT thread_id, checkpoint_ns FROM checkpoints GROUP BY thread_id, checkpoint_ns HAVING COUNT(*) > ?",
+                (max_checkpoints_per_thread,),
+            ).fetchall():
+                expired = [
+                    (thread_id, checkpoint_ns, checkpoint_id)
+                    for (checkpoint_id,) in connection.execute(
+                        "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                        "ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+                        (thread_id, checkpoint_ns, max_checkpoints_per_thread),
+                    ).fetchall()
+                ]
+                for table in ("checkpoints", "writes"):
+                    connection.executemany(
+                        f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", expired
+                    )
+                deleted["checkpoints"] += len(expired)
+
+        if max_size_mb is not None:
+            candidates = [
+                thread_id
+                for (thread_id,) in connection.execute(
+                    "SELECT thread_id FROM threads WHERE updated_at < ? AND thread_id NOT IN ("
+                    "SELECT writes.thread_id FROM writes JOIN ("
+                    "SELECT thread_id, checkpoint_ns, MAX(checkpoint_id) AS checkpoint_id FROM checkpoints "
+                    "GROUP BY thread_id, checkpoint_ns) AS latest "
+                    "ON writes.thread_id = latest.thread_id AND writes.checkpoint_ns = latest.checkpoint_ns "
+                    "AND writes.checkpoint_id = latest.checkpoint_id) "
+                    "ORDER BY updated_at",
+                    (now - keep_recent_hours * 3600,),
+                ).fetchall()
+            ]
+            while candidates and _stored_size(connection) > max_size_mb * 1024 * 1024:
+                _delete_thread(connection, candidates.pop(0))
+                deleted["threads"] += 1
+    return deleted
+
+
+_CHECKPOINTERS: Dict[str, SqliteCheckpointSaver] = {}
+
+
+def get_checkpointer(path: Optional[str] = None) -> Optional[SqliteCheckpointSaver]:
+    """Get the process-wide durable checkpointer stored at a path, pruned in the background.
+
+    Without a path the CHECKPOINT_DB_PATH environment variable is used; if it is unset
+    too, None is returned and the graph keeps the checkpointer given by its runtime
+    (e.g. the LangGraph server) or none.
+    """
+    path = path or os.environ.get(CHECKPOINT_DB_ENV)
+    if not path:
+        return None
+    path = os.path.abspath(os.path.expanduser(path))
+    if path not in _CHECKPOINTERS:
+        _CHECKPOINTERS[path] = SqliteCheckpointSaver(path)
+        _CHECKPOINTERS[path].start_pruning()
+    return _CHECKPOINTERS[path]
@@ -35,21 +35,54 @@ class WorkflowConfiguration:
     report_structure: str = DEFAULT_REPORT_STRUCTURE
     search_api: SearchAPI = SearchAPI.NONE
     search_api_config: Optional[Dict[str, Any]] = None
-    process_search_results: Literal["summarize", "split_and_rerank"] | None = None
+    process_search_results: Literal["summarize", "split_and_rerank", "lexical_rerank"] | None = None
     summarization_model_provider: str = "azure_openai"
     summarization_model: str = "shelle-wus-acceptance-gpt-4o-provisionedmanaged"
+    summarization_mode: Literal["online", "batch"] = "online" # "batch" uses the offline Batch API (non-interactive jobs only)
+    summarization_max_concurrency: int = 4 # Maximum number of concurrent summarization calls per model
+    summarization_batch_size: int = 1 # Number of short pages grouped into one summarization call
+    summarization_policy: Literal["adaptive", "always"] = "adaptive" # "adaptive" passes through, truncates or extracts pages that do not need the LLM
+    summarization_passthrough_max_tokens: int = 500 # Pages up to this size are used as they are
+    summarization_min_tokens: int = 2000 # Pages up to this size are compressed extractively instead of summarized
+    summarization_min_score: Optional[float] = None # Pages the search API scores below this are truncated
+    summarization_max_pages: Optional[int] = None # Maximum number of LLM summaries per search, further pages are extracted
+    embedding_model: str = "openai:text-embedding-3-small" # Embedding model used by split_and_rerank
+    embedding_cache_dir: Optional[str] = None # Directory for the persistent embedding cache (in-memory if unset)
+    lexical_rerank_method: Literal["bm25", "tfidf"] = "bm25" # Local scorer used by lexical_rerank
+    extractive_compression: Literal["none", "before_summarization", "replace_summarization"] = "none" # Local sentence extraction applied to raw page content
+    extractive_compression_max_tokens: int = 1000 # Budget of the extracted content per page (~4 characters per token)
     max_structured_output_retries: int = 3
+    llm_max_concurrency: int = 16 # Upper bound of concurrent calls per model deployment, lowered adaptively on 429s and timeouts
+    model_routes: Optional[Dict[str, Any]] = None # Deployments per route for the "router" provider, e.g. {"writer": [{"model": "azure_openai:gpt-4o-ptu", "weight": 3}, "azure_openai:gpt-4o-paygo"]}
+    response_cache_path: Optional[str] = None # SQLite file of the exact-match LLM response cache for structured calls with temperature 0 (off if unset)
     include_source_str: bool = False
-    
+    source_store_path: Optional[str] = None # SQLite file of the search sources referenced by the graph state (the CHECKPOINT_DB_PATH database if unset, else in-memory)
+    usage_export_dir: Optional[str] = None # Directory where the usage accounting of each report is written as <thread_id>-<report_id>.json
+    token_budget: Optional[int] = None # Maximum LLM tokens (input + output) per report, the research is scaled down as it is spent
+    cost_budget: Optional[float] = None # Maximum LLM cost per report in USD, for models listed in MODEL_PRICES
+    time_budget: Optional[float] = None # Maximum wall-clock seconds per report
+
     # Workflow-specific configuration
     number_of_queries: int = 2 # Number of search queries to generate per iteration
     max_search_depth: int = 2 # Maximum number of reflection + search iterations
+    deadline: Optional[float] = None # Seconds within which the report is compiled, sections still running at the end of their time slice publish their best content
+    pipelined_planning: bool = False # Skip the plan review and research each section as soon as the streaming planner emits it
+    replan_from_scratch: bool = False # Re-run the planning searches and the research of every section when the plan is revised, instead of reusing those of unchanged sections
+    reuse_earlier_reports: bool = False # Keep the research of the sections of the thread for its next reports on the same topic, whose plans reuse the drafts of matching sections
+    streaming_queries: bool = False # Search each section query as soon as the model emits it
+    search_quorum: Optional[int] = None # With streaming_queries, write the section once this many sources arrived, cancelling slower searches
     planner_provider: str = "azure_openai"
     planner_model: str = "shelle-wus-acceptance-gpt-4o-provisionedmanaged"
     planner_model_kwargs: Optional[Dict[str, Any]] = None
+    grader_provider: Optional[str] = None # Provider of the grader model, the planner provider if unset
+    grader_model: Optional[str] = None # Small model that grades sections first, escalating low-confidence grades to the planner model (no cascade if unset)
+    grader_model_kwargs: Optional[Dict[str, Any]] = None
+    grader_confidence_threshold: float = 0.8 # Grades of the grader model below this confidence are escalated
     writer_provider: str = "azure_openai"
     writer_model: str = "shelle-wus-acceptance-gpt-4o-provisionedmanaged"
     writer_model_kwargs: Optional[Dict[str, Any]] = None
+    economy_provider: str = "azure_openai"
+    economy_model: Optional[str] = None # Cheaper model replacing the planner and writer models once most of the budget is spent
     
     # Azure OpenAI configuration
     azure_openai_endpoint: Optional[str] = None
@@ -90,15 +123,36 @@ class MultiAgentConfiguration:
     # Common configuration
     search_api: SearchAPI = SearchAPI.NONE #SearchAPI.TAVILY
     search_api_config: Optional[Dict[str, Any]] = None
-    process_search_results: Literal["summarize", "split_and_rerank"] | None = None
+    process_search_results: Literal["summarize", "split_and_rerank", "lexical_rerank"] | None = None
     summarization_model_provider: str = "azure_openai"
     summarization_model: str = "shelle-wus-acceptance-gpt-4o-provisionedmanaged"
+    summarization_mode: Literal["online", "batch"] = "online" # "batch" uses the offline Batch API (non-interactive jobs only)
+    summarization_max_concurrency: int = 4 # Maximum number of concurrent summarization calls per model
+    summarization_batch_size: int = 1 # Number of short pages grouped into one summarization call
+    summarization_policy: Literal["adaptive", "always"] = "adaptive" # "adaptive" passes through, truncates or extracts pages that do not need the LLM
+    summarization_passthrough_max_tokens: int = 500 # Pages up to this size are used as they are
+    summarization_min_tokens: int = 2000 # Pages up to this size are compressed extractively instead of summarized
+    summarization_min_score: Optional[float] = None # Pages the search API scores below this are truncated
+    summarization_max_pages: Optional[int] = None # Maximum number of LLM summaries per search, further pages are extracted
+    embedding_model: str = "openai:text-embedding-3-small" # Embedding model used by split_and_rerank
+    embedding_cache_dir: Optional[str] = None # Directory for the persistent embedding cache (in-memory if unset)
+    lexical_rerank_method: Literal["bm25", "tfidf"] = "bm25" # Local scorer used by lexical_rerank
+    extractive_compression: Literal["none", "before_summarization", "replace_summarization"] = "none" # Local sentence extraction applied to raw page content
+    extractive_compression_max_tokens: int = 1000 # Budget of the extracted content per page (~4 characters per token)
+    response_cache_path: Optional[str] = None # SQLite file of the exact-match LLM response cache for structured calls with temperature 0 (off if unset)
+    llm_max_concurrency: int = 16 # Upper bound of concurrent calls per model deployment, lowered adaptively on 429s and timeouts
+    model_routes: Optional[Dict[str, Any]] = None # Deployments per route for the "router" provider, e.g. {"writer": [{"model": "azure_openai:gpt-4o-ptu", "weight": 3}, "azure_openai:gpt-4o-paygo"]}
     include_source_str: bool = False
+    usage_export_dir: Optional[str] = None # Directory where the usage accounting of each report is written as <thread_id>-<report_id>.json
+    token_budget: Optional[int] = None # Maximum LLM tokens (input + output) per report, the research is scaled down as it is spent
+    cost_budget: Optional[float] = None # Maximum LLM cost per report in USD, for models listed in MODEL_PRICES
+    time_budget: Optional[float] = None # Maximum wall-clock seconds per report
     
     # Multi-agent specific configuration
     number_of_queries: int = 2 # Number of search queries to generate per section
     supervisor_model: str = "azure_openai:shelle-wus-acceptance-gpt-4o-provisionedmanaged"
     researcher_model: str = "azure_openai:shelle-wus-acceptance-gpt-4o-provisionedmanaged"
+    economy_model: Optional[str] = None # "provider:model" replacing the supervisor and researcher models once most of the budget is spent
     ask_for_clarification: bool = False # Whether to ask for clarification from the user
     # MCP server configuration
     mcp_server_config: Optional[Dict[str, Any]] = None
@@ -0,0 +1,59 @@
+import asyncio
+from typing import Awaitable, List, Literal, Optional, TypeVar
+
+from langchain_core.runnables import RunnableConfig
+
+from open_deep_research.accounting import get_config_usage
+from open_deep_research.state import Section
+
+# Shares of the deadline, counted from the start of the report, by which each phase must
+# be done: the planning searches, the plan, section research, and the final sections
+# and report compilation
+DEADLINE_PHASE_ENDS = {
+    "planning_search": 0.1,
+    "planning": 0.2,
+    "research": 0.75,
+    "writing": 0.95,
+}
+
+# Appended to sections cut short by the deadline, and standing in for sections never written
+INCOMPLETE_SECTION_MARKER = "*[Incomplete: this section was cut short by the report deadline.]*"
+
+T = TypeVar("T")
+
+
+def get_time_left(config: Optional[RunnableConfig], deadline: Optional[float], phase: Literal["planning_search", "planning", "research", "writing"]) -> Optional[float]:
+    """Seconds left in the time slice of a phase of a report with a deadline.
+
+    The clock of a report is the one of its usage accounting (see track_report): it
+    counts from the start time kept in the graph state, without the time recorded
+    there as paused while the report waited for human feedback, so a report resumed
+    in another process keeps its deadline. A node's slice ends with the share of the
+    deadline given to its phase in DEADLINE_PHASE_ENDS, so every node of a phase, and
+    every section researched in parallel, has to be done by the same time.
+
+    Returns:
+        Optional[float]: Seconds left, 0 once the slice is over, None without a deadline
+    """
+    if not deadline:
+        return None
+    return max(0.0, float(deadline) * DEADLINE_PHASE_ENDS[phase] - get_config_usage(config).elapsed())
+
+
+async def run_within(awaitable: Awaitable[T], time_left: Optional[float]) -> T:
+    """Await a coroutine, cancelling it with asyncio.TimeoutError after time_left seconds (no limit if None)."""
+    if time_left is None:
+        return await awaitable
+    return await asyncio.wait_for(awaitable, timeout=time_left)
+
+
+def fallback_plan(topic: str) -> List[Section]:
+    """Plan of a report whose planner did not finish in time: the whole topic researched as one section."""
+    return [Section(name="Research findings", description=topic, research=True, content="")]
+
+
+def mark_incomplete(name: str, content: Optional[str]) -> str:
+    """Content of a section cut short by the deadline: its best draft, or its heading, followed by the marker."""
+    if content:
+        return f"{content}\n\n{INCOMPLETE_SECTION_MARKER}"
+    return f"## {name}\n\n{INCOMPLETE_SECTION_MARKER}"
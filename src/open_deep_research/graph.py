@@ -1,8 +1,11 @@
-from typing import Literal
+import asyncio
+import logging
+from typing import Literal, Optional
 
 from langchain.chat_models import init_chat_model
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables import Runnable, RunnableConfig
+from pydantic import ValidationError
 
 from langgraph.constants import Send
 from langgraph.graph import START, END, StateGraph
@@ -15,6 +18,8 @@ from open_deep_research.state import (
     ReportState,
     SectionState,
     SectionOutputState,
+    Section,
+    SearchQuery,
     Queries,
     Feedback
 )
@@ -25,23 +30,69 @@ from open_deep_research.prompts import (
     query_writer_instructions, 
     section_writer_instructions,
     final_section_writer_instructions,
+    final_section_writer_context,
+    final_section_writer_inputs,
     section_grader_instructions,
+    section_grader_inputs,
     section_writer_inputs
 )
 
 from open_deep_research.configuration import WorkflowConfiguration
+from open_deep_research.accounting import current_section, export_run_usage, start_config_usage, track_report
+from open_deep_research.budget import govern_budget
+from open_deep_research.deadline import fallback_plan, get_time_left, mark_incomplete, run_within
+from open_deep_research.checkpointing import get_checkpointer
+from open_deep_research.payloads import SectionRecord, share_text
+from open_deep_research.replanning import research_record, reuse_section_research
 from open_deep_research.utils import (
     format_sections, 
     get_config_value, 
     get_search_params, 
-    select_and_execute_search,
+    search_source_records,
+    store_sources,
+    materialize_sources,
     get_today_str,
-    get_chat_model
+    get_chat_model,
+    astream_section,
+    cacheable_prompt,
+    cascade_grade_section,
+    astream_tool_call_list_items,
+    search_queries_as_they_arrive,
 )
 
+logger = logging.getLogger(__name__)
+
 ## Nodes -- 
 
-async def generate_report_plan(state: ReportState, config: RunnableConfig):
+def start_report(state: ReportState, config: RunnableConfig):
+    """Start a new report, clearing what a previous report of the thread left in the state.
+
+    With a checkpointer, a thread keeps its state across runs: a new topic must not
+    inherit the completed sections of the previous report. Resuming a run (after an
+    interrupt, or with no input after a failure) does not go through this node, so a
+    resumed report keeps its completed sections. The usage accounting of the report,
+    with its budget and clock, starts here too: its id, clock and spend totals are
+    kept in report_usage, for the nodes to find it (see track_report).
+
+    With reuse_earlier_reports, the research of the sections is kept for the next
+    reports on the same topic, whose plans reuse the research of matching sections
+    (see reuse_section_research): sections are only researched once their plan is
+    approved, so a revised plan can only reuse research within a thread. It is
+    cleared on another topic, and at the start of every report otherwise.
+    """
+    update = {
+        "report_usage": start_config_usage(config).snapshot(),
+        "completed_sections": None,
+        "source_refs": None,
+        "feedback_on_report_plan": None,
+        "planning_source_refs": None,
+        "final_report": "",
+    }
+    if state.get("research_topic") != state["topic"] or not WorkflowConfiguration.from_runnable_config(config).reuse_earlier_reports:
+        update.update(research_topic=state["topic"], section_research=None)
+    return update
+
+async def generate_report_plan(state: ReportState, config: RunnableConfig) -> Command[Literal["human_feedback", "gather_completed_sections"]]:
     """Generate the initial report plan with sections.
     
     This node:
@@ -50,12 +101,20 @@ async def generate_report_plan(state: ReportState, config: RunnableConfig):
     3. Performs web searches using those queries
     4. Uses an LLM to generate a structured plan with sections
     
+    A plan revised after feedback reuses the sources of the first planning searches,
+    unless replan_from_scratch is set.
+
+    With pipelined_planning, the plan is not reviewed: the planner output is streamed
+    and each research section is researched and written as soon as it is planned,
+    while the planner generates the remaining sections (see research_sections_while_planning).
+    
     Args:
         state: Current graph state containing the report topic
         config: Configuration for models, search APIs, etc.
         
     Returns:
-        Dict containing the generated sections
+        Command with the generated sections, to the plan review or, when pipelined,
+        with the completed research sections to gather_completed_sections
     """
     print("=== DEBUG: Entering generate_report_plan function ===")
     print("Generating report plan...")
@@ -63,6 +122,7 @@ async def generate_report_plan(state: ReportState, config: RunnableConfig):
     # Inputs
     topic = state["topic"]
     print(f"DEBUG: Topic = {topic}")
+    usage = track_report(state, config)
 
     # Get list of feedback on the report plan
     feedback_list = state.get("feedback_on_report_plan", [])
@@ -73,7 +133,7 @@ async def generate_report_plan(state: ReportState, config: RunnableConfig):
 
     # Get configuration
     print("DEBUG: Getting configuration...")
-    configurable = WorkflowConfiguration.from_runnable_config(config)
+    configurable = govern_budget(WorkflowConfiguration.from_runnable_config(config), config)
     report_structure = configurable.report_structure
     number_of_queries = configurable.number_of_queries
     search_api = get_config_value(configurable.search_api)
@@ -95,6 +155,7 @@ async def generate_report_plan(state: ReportState, config: RunnableConfig):
         "azure_openai_endpoint": configurable.azure_openai_endpoint,
         "azure_openai_api_key": configurable.azure_openai_api_key,
         "azure_openai_api_version": configurable.azure_openai_api_version,
+        "model_routes": configurable.model_routes,
     }
     print(f"DEBUG: Azure config API version = {azure_config['azure_openai_api_version']}")
     
@@ -103,6 +164,7 @@ async def generate_report_plan(state: ReportState, config: RunnableConfig):
         model=writer_model_name, 
         model_provider=writer_provider, 
         azure_config=azure_config,
+        response_cache_path=configurable.response_cache_path,
         **writer_model_kwargs
     ) 
     print("DEBUG: get_chat_model completed successfully")
@@ -118,16 +180,32 @@ async def generate_report_plan(state: ReportState, config: RunnableConfig):
         number_of_queries=number_of_queries,
         today=get_today_str()
     )
-    print("generating report plan")
-    # Generate queries  
-    results = await structured_llm.ainvoke([SystemMessage(content=system_instructions_query),
-                                     HumanMessage(content="Generate search queries that will help with planning the sections of the report.")])
-    print("generated report plan")
-    # Web search
-    query_list = [query.search_query for query in results.queries]
-
-    # Search the web with parameters
-    source_str = await select_and_execute_search(search_api, query_list, params_to_pass)
+    async def search_for_planning() -> list[str]:
+        print("generating report plan")
+        # Generate queries  
+        results = await structured_llm.ainvoke([SystemMessage(content=system_instructions_query),
+                                         HumanMessage(content="Generate search queries that will help with planning the sections of the report.")])
+        print("generated report plan")
+        # Web search
+        query_list = [query.search_query for query in results.queries]
+
+        # Search the web with parameters
+        results = await search_source_records(search_api, query_list, params_to_pass, config)
+        return store_sources(results, config)
+
+    planning_source_refs = state.get("planning_source_refs")
+    if planning_source_refs is not None and feedback_list and not configurable.replan_from_scratch:
+        # The plan is revised after feedback with the sources of the first planning searches
+        logger.info("Reusing the planning searches")
+    elif number_of_queries:
+        try:
+            # The planning searches end with their slice of the deadline, leaving the rest of the planning slice to the planner
+            planning_source_refs = await run_within(search_for_planning(), get_time_left(config, configurable.deadline, "planning_search"))
+        except asyncio.TimeoutError:
+            logger.warning("Planning searches cut short by the report deadline")
+    # Without sources (e.g. the report budget is spent), plan without searching
+    source_str = materialize_sources(planning_source_refs or [], config)
+    planning_update = {"planning_source_refs": planning_source_refs} if planning_source_refs is not None else {}
 
     # Format system instructions
     system_instructions_sections = report_planner_instructions.format(topic=topic, report_organization=report_structure, context=source_str, feedback=feedback)
@@ -148,6 +226,7 @@ async def generate_report_plan(state: ReportState, config: RunnableConfig):
             model=planner_model, 
             model_provider=planner_provider, 
             azure_config=azure_config,
+            response_cache_path=configurable.response_cache_path,
             max_tokens=20_000, 
             thinking={"type": "enabled", "budget_tokens": 16_000}
         )
@@ -158,20 +237,97 @@ async def generate_report_plan(state: ReportState, config: RunnableConfig):
             model=planner_model, 
             model_provider=planner_provider,
             azure_config=azure_config,
+            response_cache_path=configurable.response_cache_path,
             **planner_model_kwargs
         )
     
-    # Generate the report sections
+    planner_messages = [SystemMessage(content=system_instructions_sections),
+                        HumanMessage(content=planner_message)]
+
+    # Skip the plan review and research sections while the rest of the plan is generated
+    if configurable.pipelined_planning:
+        # Extended thinking does not allow forcing a tool call
+        tool_choice = {} if planner_model == "claude-3-7-sonnet-latest" else {"tool_choice": "Sections"}
+        update = await research_sections_while_planning(planner_llm.bind_tools([Sections], **tool_choice),
+                                                        planner_messages,
+                                                        topic,
+                                                        config,
+                                                        completed={s.name for s in state.get("completed_sections", [])},
+                                                        time_left=get_time_left(config, configurable.deadline, "planning"))
+        return Command(goto="gather_completed_sections", update={**update, **planning_update})
+
+    # Generate the report sections, within the planning slice of the deadline
     structured_llm = planner_llm.with_structured_output(Sections)
-    report_sections = await structured_llm.ainvoke([SystemMessage(content=system_instructions_sections),
-                                             HumanMessage(content=planner_message)])
+    try:
+        report_sections = await run_within(structured_llm.ainvoke(planner_messages), get_time_left(config, configurable.deadline, "planning"))
+        sections = report_sections.sections
+    except asyncio.TimeoutError:
+        logger.warning("Report planning cut short by the report deadline, researching the topic as one section")
+        sections = fallback_plan(topic)
 
-    # Get sections
-    sections = report_sections.sections
+    # The clock stops while the plan waits for review, recorded in the state for a report resumed in another process
+    usage.pause()
+    return Command(goto="human_feedback", update={"sections": sections, **planning_update, "report_usage": usage.snapshot()})
+
+async def research_sections_while_planning(planner: Runnable, messages: list, topic: str, config: RunnableConfig, completed: set[str] = frozenset(), time_left: Optional[float] = None) -> dict:
+    """Stream the report plan and start the research of each section as soon as it is planned.
 
-    return {"sections": sections}
+    Each research section runs through the section sub-graph in its own task, so the
+    research of the first sections overlaps with the generation of the later ones.
+    The sub-graph runs inside this node without checkpoints of its own.
 
-def human_feedback(state: ReportState, config: RunnableConfig) -> Command[Literal["generate_report_plan","build_section_with_web_research"]]:
+    Args:
+        planner: Planner model with the Sections tool bound
+        messages: Planner prompt messages
+        topic: Report topic
+        config: Configuration of the run
+        completed: Names of the sections a resumed thread already completed, not researched again
+        time_left: Seconds left to stream the plan (no limit if None); the sections planned by then
+            are researched, or the whole topic as one section if none was
+
+    Returns:
+        State update with the planned sections, the completed research sections and their source refs
+    """
+    sections = []
+    tasks = []
+
+    def research(section: Section):
+        sections.append(section)
+        if section.research and section.name not in completed:
+            tasks.append(asyncio.create_task(pipelined_section_graph.ainvoke(
+                {"topic": topic, "section": SectionRecord.from_section(section), "search_iterations": 0}, config
+            )))
+
+    async def plan():
+        async for item in astream_tool_call_list_items(planner, messages, "Sections", "sections"):
+            try:
+                section = Section(**item)
+            except ValidationError as e:
+                logger.warning("Skipping incomplete planned section: %s", e)
+                continue
+            research(section)
+
+    try:
+        try:
+            await run_within(plan(), time_left)
+        except asyncio.TimeoutError:
+            logger.warning("Report planning cut short by the report deadline after %d sections", len(sections))
+            if not sections:
+                for section in fallback_plan(topic):
+                    research(section)
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    return {
+        "sections": sections,
+        "completed_sections": [section for result in results for section in result["completed_sections"]],
+        "source_refs": [ref for result in results for ref in result.get("source_refs", [])],
+    }
+
+def human_feedback(state: ReportState, config: RunnableConfig) -> Command[Literal["generate_report_plan","build_section_with_web_research","gather_completed_sections"]]:
     """Get human feedback on the report plan and route to next steps.
     
     This node:
@@ -180,6 +336,10 @@ def human_feedback(state: ReportState, config: RunnableConfig) -> Command[Litera
     3. Routes to either:
        - Section writing if plan is approved
        - Plan regeneration if feedback is provided
+
+    Sections a resumed thread already completed are not researched again, and
+    sections matching the research of an earlier plan reuse it (see
+    reuse_section_research), unless replan_from_scratch is set.
     
     Args:
         state: Current graph state with sections to review
@@ -204,47 +364,87 @@ def human_feedback(state: ReportState, config: RunnableConfig) -> Command[Litera
                         \n\n{sections_str}\n
                         \nDoes the report plan meet your needs?\nPass 'true' to approve the report plan.\nOr, provide feedback to regenerate the report plan:"""
     
+    # the report clock stops while the user reviews the plan
+    usage = track_report(state, config)
+    usage.pause()
     feedback = interrupt(interrupt_message)
+    usage.resume()
 
     # If the user approves the report plan, kick off section writing
     if isinstance(feedback, bool) and feedback is True:
         # Treat this as approve and kick off section writing
+        completed = {s.name for s in state.get("completed_sections", [])}
+        reused, seeds = [], {}
+        if not WorkflowConfiguration.from_runnable_config(config).replan_from_scratch:
+            reused, seeds = reuse_section_research(sections, completed, state.get("section_research", {}))
+            completed |= {s.name for s in reused}
         return Command(goto=[
-            Send("build_section_with_web_research", {"topic": topic, "section": s, "search_iterations": 0}) 
+            Send("build_section_with_web_research", section_research_payload(topic, s, seeds.get(s.name), state.get("report_usage"))) 
             for s in sections 
-            if s.research
-        ])
+            if s.research and s.name not in completed
+        ] or "gather_completed_sections", update={"completed_sections": reused, "report_usage": usage.snapshot()})
     
     # If the user provides feedback, regenerate the report plan 
     elif isinstance(feedback, str):
         # Treat this as feedback and append it to the existing list
         return Command(goto="generate_report_plan", 
-                       update={"feedback_on_report_plan": [feedback]})
+                       update={"feedback_on_report_plan": [feedback], "report_usage": usage.snapshot()})
     else:
         raise TypeError(f"Interrupt value of type {type(feedback)} is not supported.")
     
-async def generate_queries(state: SectionState, config: RunnableConfig):
+def section_research_payload(topic: str, section: Section, research: Optional[dict] = None, report_usage: Optional[dict] = None) -> dict:
+    """Send() payload of a research section, seeded with the draft, queries and sources of earlier research if any."""
+    payload = {"topic": topic, "section": SectionRecord.from_section(section), "search_iterations": 0, "report_usage": report_usage}
+    if research:
+        payload["section"].content = research["content"]
+        payload["search_queries"] = [SearchQuery(search_query=query) for query in research["search_queries"]]
+        payload["search_refs"] = payload["source_refs"] = research.get("source_refs", [])
+    return payload
+
+async def generate_queries(state: SectionState, config: RunnableConfig) -> Command[Literal["search_web", "write_section"]]:
     """Generate search queries for researching a specific section.
     
     This node uses an LLM to generate targeted search queries based on the 
     section topic and description.
     
+    With streaming_queries, the queries are streamed and each one is searched as
+    soon as it is complete, so this node also does the work of search_web and goes
+    straight to write_section. So does a section seeded with the research of an
+    earlier plan (see section_research_payload).
+    
     Args:
         state: Current state containing section details
         config: Configuration including number of queries to generate
         
     Returns:
-        Dict containing the generated search queries
+        Command with the generated search queries, and with streaming_queries the
+        search results
     """
 
     # Get state 
     topic = state["topic"]
     section = state["section"]
+    current_section.set(section.name)
+    track_report(state, config)
 
-    # Get configuration
-    configurable = WorkflowConfiguration.from_runnable_config(config)
+    # Get configuration, scaled down to the budget left
+    configurable = govern_budget(WorkflowConfiguration.from_runnable_config(config), config)
     number_of_queries = configurable.number_of_queries
 
+    if state.get("search_refs") and not state["search_iterations"]:
+        # Seeded with earlier research, the section is rewritten from its sources
+        return Command(update={"search_iterations": 1}, goto="write_section")
+
+    time_left = get_time_left(config, configurable.deadline, "research")
+    # Straight to writing, with the sources the section already has
+    no_search = Command(update={"search_queries": [],
+                                "search_refs": state.get("search_refs", []),
+                                "search_iterations": state["search_iterations"] + 1},
+                        goto="write_section")
+    if not number_of_queries or time_left == 0:
+        # The report budget or the research slice of the deadline is spent, write the section from the sources it has
+        return no_search
+
     # Generate queries 
     writer_provider = get_config_value(configurable.writer_provider)
     writer_model_name = get_config_value(configurable.writer_model)
@@ -255,12 +455,14 @@ async def generate_queries(state: SectionState, config: RunnableConfig):
         "azure_openai_endpoint": configurable.azure_openai_endpoint,
         "azure_openai_api_key": configurable.azure_openai_api_key,
         "azure_openai_api_version": configurable.azure_openai_api_version,
+        "model_routes": configurable.model_routes,
     }
     
     writer_model = get_chat_model(
         model=writer_model_name, 
         model_provider=writer_provider, 
         azure_config=azure_config,
+        response_cache_path=configurable.response_cache_path,
         **writer_model_kwargs
     ) 
     structured_llm = writer_model.with_structured_output(Queries)
@@ -270,12 +472,48 @@ async def generate_queries(state: SectionState, config: RunnableConfig):
                                                            section_topic=section.description, 
                                                            number_of_queries=number_of_queries,
                                                            today=get_today_str())
+    query_messages = [SystemMessage(content=system_instructions),
+                      HumanMessage(content="Generate search queries on the provided topic.")]
+
+    search_api = get_config_value(configurable.search_api)
+    if configurable.streaming_queries and search_api != "none":
+        # Search each query as soon as the model has written it
+        query_model = writer_model.bind_tools([Queries], tool_choice="Queries")
+
+        async def stream_queries():
+            async for item in astream_tool_call_list_items(query_model, query_messages, "Queries", "queries"):
+                if item.get("search_query"):
+                    yield item["search_query"]
+
+        params_to_pass = get_search_params(search_api, configurable.search_api_config or {})
+        try:
+            query_list, results = await run_within(search_queries_as_they_arrive(search_api,
+                                                                                    stream_queries(),
+                                                                                    params_to_pass,
+                                                                                    config,
+                                                                                    focus=section.description,
+                                                                                    quorum=configurable.search_quorum,
+                                                                                    section_name=section.name),
+                                                      time_left)
+        except asyncio.TimeoutError:
+            logger.warning("Searches of section %s cut short by the report deadline", section.name)
+            return no_search
+        refs = store_sources(results, config)
+        return Command(update={"search_queries": [SearchQuery(search_query=query) for query in query_list],
+                               "search_refs": refs,
+                               "source_refs": refs,
+                               "search_iterations": state["search_iterations"] + 1},
+                       goto="write_section")
+
     print("generating section queries")
     # Generate queries  
-    queries = await structured_llm.ainvoke([SystemMessage(content=system_instructions),
-                                     HumanMessage(content="Generate search queries on the provided topic.")])
+    try:
+        queries = await run_within(structured_llm.ainvoke(query_messages), time_left)
+    except asyncio.TimeoutError:
+        logger.warning("Queries of section %s cut short by the report deadline", section.name)
+        return no_search
     print("generated section queries")
-    return {"search_queries": queries.queries}
+    return Command(update={"search_queries": queries.queries}, goto="search_web")
 
 async def search_web(state: SectionState, config: RunnableConfig):
     """Execute web searches for the section queries.
@@ -283,18 +521,20 @@ async def search_web(state: SectionState, config: RunnableConfig):
     This node:
     1. Takes the generated queries
     2. Executes searches using configured search API
-    3. Formats results into usable context
+    3. Keeps the results in the source store, the state only gets their refs
     
     Args:
         state: Current state with search queries
         config: Search API configuration
         
     Returns:
-        Dict with search results and updated iteration count
+        Dict with the refs of the search results and updated iteration count
     """
 
     # Get state
     search_queries = state["search_queries"]
+    current_section.set(state["section"].name)
+    track_report(state, config)
 
     # Get configuration
     configurable = WorkflowConfiguration.from_runnable_config(config)
@@ -306,9 +546,34 @@ async def search_web(state: SectionState, config: RunnableConfig):
     query_list = [query.search_query for query in search_queries]
 
     # Search the web with parameters
-    source_str = await select_and_execute_search(search_api, query_list, params_to_pass)
+    if configurable.streaming_queries and search_api != "none":
+        # Follow-up searches also stop at the quorum
+        async def follow_up_queries():
+            for query in query_list:
+                yield query
+
+        async def search():
+            _, results = await search_queries_as_they_arrive(search_api,
+                                                             follow_up_queries(),
+                                                             params_to_pass,
+                                                             config,
+                                                             focus=state["section"].description,
+                                                             quorum=configurable.search_quorum,
+                                                             section_name=state["section"].name)
+            return results
+    else:
+        async def search():
+            return await search_source_records(search_api, query_list, params_to_pass, config, focus=state["section"].description)
 
-    return {"source_str": source_str, "search_iterations": state["search_iterations"] + 1}
+    try:
+        results = await run_within(search(), get_time_left(config, configurable.deadline, "research"))
+    except asyncio.TimeoutError:
+        # Past the research slice of the deadline, the section is rewritten from its earlier sources
+        logger.warning("Searches of section %s cut short by the report deadline", state['section'].name)
+        return {"search_refs": state.get("search_refs", []), "search_iterations": state["search_iterations"] + 1}
+
+    refs = store_sources(results, config)
+    return {"search_refs": refs, "source_refs": refs, "search_iterations": state["search_iterations"] + 1}
 
 async def write_section(state: SectionState, config: RunnableConfig) -> Command[Literal[END, "search_web"]]:
     """Write a section of the report and evaluate if more research is needed.
@@ -319,6 +584,10 @@ async def write_section(state: SectionState, config: RunnableConfig) -> Command[
     3. Either:
        - Completes the section if quality passes
        - Triggers more research if quality fails
+
+    With a deadline, a section still being written at the end of the research slice
+    is published with its previous draft, marked incomplete, and a written section
+    is published ungraded.
     
     Args:
         state: Current state with search results and section info
@@ -331,10 +600,13 @@ async def write_section(state: SectionState, config: RunnableConfig) -> Command[
     # Get state 
     topic = state["topic"]
     section = state["section"]
-    source_str = state["source_str"]
+    current_section.set(section.name)
+    usage = track_report(state, config)
+    # The sources of the latest search are materialized from the source store
+    source_str = materialize_sources(state.get("search_refs", []), config)
 
-    # Get configuration
-    configurable = WorkflowConfiguration.from_runnable_config(config)
+    # Get configuration, scaled down to the budget left
+    configurable = govern_budget(WorkflowConfiguration.from_runnable_config(config), config)
 
     # Format system instructions
     section_writer_inputs_formatted = section_writer_inputs.format(topic=topic, 
@@ -353,6 +625,7 @@ async def write_section(state: SectionState, config: RunnableConfig) -> Command[
         "azure_openai_endpoint": configurable.azure_openai_endpoint,
         "azure_openai_api_key": configurable.azure_openai_api_key,
         "azure_openai_api_version": configurable.azure_openai_api_version,
+        "model_routes": configurable.model_routes,
     }
     
     writer_model = get_chat_model(
@@ -362,21 +635,45 @@ async def write_section(state: SectionState, config: RunnableConfig) -> Command[
         **writer_model_kwargs
     ) 
 
-    section_content = await writer_model.ainvoke([SystemMessage(content=section_writer_instructions),
-                                           HumanMessage(content=section_writer_inputs_formatted)])
+    def publish_section() -> Command:
+        # The source refs of the section reach the report state with the section, and its spend with the report usage
+        return Command(update={"completed_sections": [section],
+                               "section_research": research_record(section, state.get("search_queries", []), source_refs=state.get("source_refs", [])),
+                               "report_usage": usage.snapshot()},
+                       goto=END)
+
+    # Stream the section as it is written, tagged with its name
+    # The static instructions are the cached prefix of every section write
+    try:
+        section_content = await run_within(astream_section(writer_model,
+                                                           [SystemMessage(content=cacheable_prompt(writer_model, section_writer_instructions)),
+                                                            HumanMessage(content=section_writer_inputs_formatted)],
+                                                           section.name),
+                                           get_time_left(config, configurable.deadline, "research"))
+    except asyncio.TimeoutError:
+        # Past the research slice of the deadline, publish the previous draft, if any, as incomplete
+        logger.warning("Section %s cut short by the report deadline", section.name)
+        section.content = mark_incomplete(section.name, section.content)
+        return publish_section()
     
     # Write content to the section object  
     section.content = section_content.content
 
+    # At the maximum search depth, or once the research slice of the deadline is
+    # over, the section is published whatever its grade
+    if (state["search_iterations"] >= configurable.max_search_depth
+            or get_time_left(config, configurable.deadline, "research") == 0):
+        return publish_section()
+
     # Grade prompt 
     section_grader_message = ("Grade the report and consider follow-up questions for missing information. "
                               "If the grade is 'pass', return empty strings for all follow-up queries. "
                               "If the grade is 'fail', provide specific search queries to gather missing information.")
     
-    section_grader_instructions_formatted = section_grader_instructions.format(topic=topic, 
-                                                                               section_topic=section.description,
-                                                                               section=section.content, 
-                                                                               number_of_follow_up_queries=configurable.number_of_queries)
+    section_grader_inputs_formatted = section_grader_inputs.format(topic=topic, 
+                                                                   section_topic=section.description,
+                                                                   section=section.content, 
+                                                                   number_of_follow_up_queries=configurable.number_of_queries)
 
     # Use planner model for reflection
     planner_provider = get_config_value(configurable.planner_provider)
@@ -388,35 +685,59 @@ async def write_section(state: SectionState, config: RunnableConfig) -> Command[
         "azure_openai_endpoint": configurable.azure_openai_endpoint,
         "azure_openai_api_key": configurable.azure_openai_api_key,
         "azure_openai_api_version": configurable.azure_openai_api_version,
+        "model_routes": configurable.model_routes,
     }
 
     if planner_model == "claude-3-7-sonnet-latest":
         # Allocate a thinking budget for claude-3-7-sonnet-latest as the planner model
-        reflection_model = get_chat_model(
+        reflection_llm = get_chat_model(
             model=planner_model, 
             model_provider=planner_provider, 
             azure_config=azure_config,
+            response_cache_path=configurable.response_cache_path,
             max_tokens=20_000, 
             thinking={"type": "enabled", "budget_tokens": 16_000}
-        ).with_structured_output(Feedback)
+        )
     else:
-        reflection_model = get_chat_model(
+        reflection_llm = get_chat_model(
             model=planner_model, 
             model_provider=planner_provider, 
             azure_config=azure_config,
+            response_cache_path=configurable.response_cache_path,
             **planner_model_kwargs
-        ).with_structured_output(Feedback)
-    # Generate feedback
-    feedback = await reflection_model.ainvoke([SystemMessage(content=section_grader_instructions_formatted),
-                                        HumanMessage(content=section_grader_message)])
-
-    # If the section is passing or the max search depth is reached, publish the section to completed sections 
-    if feedback.grade == "pass" or state["search_iterations"] >= configurable.max_search_depth:
-        # Publish the section to completed sections 
-        update = {"completed_sections": [section]}
-        if configurable.include_source_str:
-            update["source_str"] = source_str
-        return Command(update=update, goto=END)
+        )
+
+    grader_model = get_config_value(configurable.grader_model)
+    if grader_model:
+        # Cascade: a small model grades first and only uncertain grades reach the planner model
+        grader_llm = get_chat_model(
+            model=grader_model,
+            model_provider=get_config_value(configurable.grader_provider or configurable.planner_provider),
+            azure_config=azure_config,
+            response_cache_path=configurable.response_cache_path,
+            **get_config_value(configurable.grader_model_kwargs or {})
+        )
+        grading = cascade_grade_section(grader_llm,
+                                        reflection_llm,
+                                        section_grader_instructions,
+                                        section_grader_inputs_formatted + "\n" + section_grader_message,
+                                        float(configurable.grader_confidence_threshold),
+                                        config)
+    else:
+        reflection_model = reflection_llm.with_structured_output(Feedback)
+        # Generate feedback, with the static grading instructions as the cached prefix
+        grading = reflection_model.ainvoke([SystemMessage(content=cacheable_prompt(reflection_llm, section_grader_instructions)),
+                                            HumanMessage(content=section_grader_inputs_formatted + "\n" + section_grader_message)])
+
+    try:
+        feedback = await run_within(grading, get_time_left(config, configurable.deadline, "research"))
+    except asyncio.TimeoutError:
+        # The section is written, it is published ungraded
+        return publish_section()
+
+    # If the section is passing, publish the section to completed sections 
+    if feedback.grade == "pass":
+        return publish_section()
 
     # Update the existing section with new content and update search queries
     else:
@@ -439,16 +760,20 @@ async def write_final_sections(state: SectionState, config: RunnableConfig):
         Dict containing the newly written section
     """
 
-    # Get configuration
-    configurable = WorkflowConfiguration.from_runnable_config(config)
+    usage = track_report(state, config)
+
+    # Get configuration, scaled down to the budget left
+    configurable = govern_budget(WorkflowConfiguration.from_runnable_config(config), config)
 
     # Get state 
     topic = state["topic"]
     section = state["section"]
-    completed_report_sections = state["report_sections_from_research"]
+    current_section.set(section.name)
+    completed_report_sections = str(state["report_sections_from_research"])
     
-    # Format system instructions
-    system_instructions = final_section_writer_instructions.format(topic=topic, section_name=section.name, section_topic=section.description, context=completed_report_sections)
+    # Format inputs, the report context is shared by all final sections and precedes the section
+    context_formatted = final_section_writer_context.format(topic=topic, context=completed_report_sections)
+    inputs_formatted = final_section_writer_inputs.format(section_name=section.name, section_topic=section.description)
 
     # Generate section  
     writer_provider = get_config_value(configurable.writer_provider)
@@ -460,6 +785,7 @@ async def write_final_sections(state: SectionState, config: RunnableConfig):
         "azure_openai_endpoint": configurable.azure_openai_endpoint,
         "azure_openai_api_key": configurable.azure_openai_api_key,
         "azure_openai_api_version": configurable.azure_openai_api_version,
+        "model_routes": configurable.model_routes,
     }
     
     writer_model = get_chat_model(
@@ -469,14 +795,22 @@ async def write_final_sections(state: SectionState, config: RunnableConfig):
         **writer_model_kwargs
     ) 
     
-    section_content = await writer_model.ainvoke([SystemMessage(content=system_instructions),
-                                           HumanMessage(content="Generate a report section based on the provided sources.")])
-    
-    # Write content to section 
-    section.content = section_content.content
+    try:
+        section_content = await run_within(astream_section(writer_model,
+                                                           [SystemMessage(content=cacheable_prompt(writer_model, final_section_writer_instructions)),
+                                                            HumanMessage(content=cacheable_prompt(writer_model, context_formatted,
+                                                                                                  inputs_formatted + "\nGenerate a report section based on the provided sources."))],
+                                                           section.name),
+                                           get_time_left(config, configurable.deadline, "writing"))
+        # Write content to section 
+        section.content = section_content.content
+    except asyncio.TimeoutError:
+        # The report is compiled on time without this section
+        logger.warning("Section %s cut short by the report deadline", section.name)
+        section.content = mark_incomplete(section.name, None)
 
     # Write the updated section to completed sections
-    return {"completed_sections": [section]}
+    return {"completed_sections": [section], "report_usage": usage.snapshot()}
 
 def gather_completed_sections(state: ReportState):
     """Format completed sections as context for writing final sections.
@@ -492,12 +826,15 @@ def gather_completed_sections(state: ReportState):
     """
 
     # List of completed sections
-    completed_sections = state["completed_sections"]
+    # Sections completed under the name of an earlier plan are left out
+    planned = {s.name for s in state["sections"]}
+    completed_sections = [s for s in state["completed_sections"] if s.name in planned]
 
     # Format completed section to str to use as context for final sections
     completed_report_sections = format_sections(completed_sections)
 
-    return {"report_sections_from_research": completed_report_sections}
+    # Shared by the final section writers instead of copied into each of them
+    return {"report_sections_from_research": share_text(completed_report_sections)}
 
 def compile_final_report(state: ReportState, config: RunnableConfig):
     """Compile all sections into the final report.
@@ -521,17 +858,27 @@ def compile_final_report(state: ReportState, config: RunnableConfig):
     sections = state["sections"]
     completed_sections = {s.name: s.content for s in state["completed_sections"]}
 
-    # Update sections with completed content while maintaining original order
+    # Update sections with completed content while maintaining original order,
+    # sections the deadline left unwritten are marked incomplete
     for section in sections:
-        section.content = completed_sections[section.name]
+        section.content = completed_sections.get(section.name) or mark_incomplete(section.name, None)
 
     # Compile final report
     all_sections = "\n\n".join([s.content for s in sections])
 
+    # Token, cost and latency totals of the report
+    track_report(state, config)
+    usage = export_run_usage(config, configurable.usage_export_dir)
+    if usage["grading"].get("graded"):
+        logger.info("Grader cascade of the report: %d grades, %.0f%% escalated, %.0f%% agreement on escalations",
+                    usage["grading"]["graded"], 100 * usage["grading"]["escalation_rate"], 100 * usage["grading"]["agreement_rate"])
+
     if configurable.include_source_str:
-        return {"final_report": all_sections, "source_str": state["source_str"]}
+        # The sources are materialized from the source store only for evaluation
+        source_str = materialize_sources(state.get("source_refs", []), config)
+        return {"final_report": all_sections, "source_str": source_str, "usage": usage}
     else:
-        return {"final_report": all_sections}
+        return {"final_report": all_sections, "usage": usage}
 
 def initiate_final_section_writing(state: ReportState):
     """Create parallel tasks for writing non-research sections.
@@ -543,15 +890,18 @@ def initiate_final_section_writing(state: ReportState):
         state: Current state with all sections and research context
         
     Returns:
-        List of Send commands for parallel section writing
+        List of Send commands for parallel section writing, or the report compilation
+        if every such section is already written (e.g. by a resumed thread)
     """
 
     # Kick off section writing in parallel via Send() API for any sections that do not require research
+    completed = {s.name for s in state["completed_sections"]}
     return [
-        Send("write_final_sections", {"topic": state["topic"], "section": s, "report_sections_from_research": state["report_sections_from_research"]}) 
+        Send("write_final_sections", {"topic": state["topic"], "section": SectionRecord.from_section(s), "report_sections_from_research": state["report_sections_from_research"],
+                                      "report_usage": state.get("report_usage")}) 
         for s in state["sections"] 
-        if not s.research
-    ]
+        if not s.research and s.name not in completed
+    ] or "compile_final_report"
 
 # Report section sub-graph -- 
 
@@ -563,13 +913,16 @@ section_builder.add_node("write_section", write_section)
 
 # Add edges
 section_builder.add_edge(START, "generate_queries")
-section_builder.add_edge("generate_queries", "search_web")
 section_builder.add_edge("search_web", "write_section")
 
+# Section sub-graph run inside generate_report_plan by pipelined planning, several at a time
+pipelined_section_graph = section_builder.compile(checkpointer=False)
+
 # Outer graph for initial report plan compiling results from each section -- 
 
 # Add nodes
 builder = StateGraph(ReportState, input=ReportStateInput, output=ReportStateOutput, config_schema=WorkflowConfiguration)
+builder.add_node("start_report", start_report)
 builder.add_node("generate_report_plan", generate_report_plan)
 builder.add_node("human_feedback", human_feedback)
 builder.add_node("build_section_with_web_research", section_builder.compile())
@@ -578,11 +931,11 @@ builder.add_node("write_final_sections", write_final_sections)
 builder.add_node("compile_final_report", compile_final_report)
 
 # Add edges
-builder.add_edge(START, "generate_report_plan")
-builder.add_edge("generate_report_plan", "human_feedback")
+builder.add_edge(START, "start_report")
+builder.add_edge("start_report", "generate_report_plan")
 builder.add_edge("build_section_with_web_research", "gather_completed_sections")
-builder.add_conditional_edges("gather_completed_sections", initiate_final_section_writing, ["write_final_sections"])
+builder.add_conditional_edges("gather_completed_sections", initiate_final_section_writing, ["write_final_sections", "compile_final_report"])
 builder.add_edge("write_final_sections", "compile_final_report")
 builder.add_edge("compile_final_report", END)
 
-graph = builder.compile()
+graph = builder.compile(checkpointer=get_checkpointer())
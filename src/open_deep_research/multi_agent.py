@@ -13,15 +13,21 @@ from langgraph.types import Command, Send
 from langgraph.graph import START, END, StateGraph
 
 from open_deep_research.configuration import MultiAgentConfiguration
+from open_deep_research.accounting import current_section, export_run_usage, merge_report_usage, start_config_usage, track_report
+from open_deep_research.budget import govern_budget
+from open_deep_research.checkpointing import get_checkpointer
+from open_deep_research.state import extend_or_reset
 from open_deep_research.utils import get_chat_model
 from open_deep_research.utils import (
     get_config_value,
     tavily_search,
     duckduckgo_search,
     get_today_str,
+    astream_section_tool_call,
+    cacheable_prompt,
 )
 
-from open_deep_research.prompts import SUPERVISOR_INSTRUCTIONS, RESEARCH_INSTRUCTIONS
+from open_deep_research.prompts import SUPERVISOR_INSTRUCTIONS, SUPERVISOR_INPUTS, RESEARCH_INSTRUCTIONS, RESEARCH_INPUTS
 
 ## Tools factory - will be initialized based on configuration
 def get_search_tool(config: RunnableConfig):
@@ -102,14 +108,18 @@ class FinishReport(BaseModel):
 ## State
 class ReportStateOutput(MessagesState):
     final_report: str # Final report
+    usage: dict # Token, cost and latency accounting of the run
     # for evaluation purposes only
     # this is included only if configurable.include_source_str is True
     source_str: str # String of formatted source content from web search
 
 class ReportState(MessagesState):
     sections: list[str] # List of report sections 
-    completed_sections: Annotated[list[Section], operator.add] # Send() API key
+    completed_sections: Annotated[list[Section], extend_or_reset] # Send() API key, cleared at the start of each report
+    completed_titles: Annotated[list[str], extend_or_reset] # Section titles sent to the research agents whose section is written
     final_report: str # Final report
+    usage: dict # Token, cost and latency accounting of the run
+    report_usage: Annotated[dict, merge_report_usage] # Id, clock and spend totals of the current report (see track_report), replaced at the start of each report
     # for evaluation purposes only
     # this is included only if configurable.include_source_str is True
     source_str: Annotated[str, operator.add] # String of formatted source content from web search
@@ -117,12 +127,16 @@ class ReportState(MessagesState):
 class SectionState(MessagesState):
     section: str # Report section  
     completed_sections: list[Section] # Final key we duplicate in outer state for Send() API
+    completed_titles: list[str] # Title of the section in the Send() payload, once written
+    report_usage: dict # Id, clock and spend totals of the report (see track_report)
     # for evaluation purposes only
     # this is included only if configurable.include_source_str is True
     source_str: str # String of formatted source content from web search
 
 class SectionOutputState(TypedDict):
     completed_sections: list[Section] # Final key we duplicate in outer state for Send() API
+    completed_titles: list[str] # Title of the section in the Send() payload, once written
+    report_usage: dict # Id, clock and spend totals of the report, with the spend of the section
     # for evaluation purposes only
     # this is included only if configurable.include_source_str is True
     source_str: str # String of formatted source content from web search
@@ -186,28 +200,39 @@ async def get_research_tools(config: RunnableConfig) -> list[BaseTool]:
     return tools
 
 
+def start_report(state: ReportState, config: RunnableConfig):
+    """Start a new report, clearing the sections a previous report left in the thread state.
+
+    The conversation goes on in the messages; only the report being assembled, and its
+    usage accounting, are reset. The id, clock and spend totals of the report are kept
+    in report_usage (see track_report).
+    """
+    return {"report_usage": start_config_usage(config).snapshot(), "completed_sections": None, "completed_titles": None, "final_report": ""}
+
 async def supervisor(state: ReportState, config: RunnableConfig):
     """LLM decides whether to call a tool or not"""
+    track_report(state, config)
 
     # Messages
     messages = state["messages"]
 
-    # Get configuration
-    configurable = MultiAgentConfiguration.from_runnable_config(config)
+    # Get configuration, scaled down to the budget left
+    configurable = govern_budget(MultiAgentConfiguration.from_runnable_config(config), config)
     supervisor_model = get_config_value(configurable.supervisor_model)
     
     azure_config = {
         "azure_openai_endpoint": configurable.azure_openai_endpoint,
         "azure_openai_api_key": configurable.azure_openai_api_key,
         "azure_openai_api_version": configurable.azure_openai_api_version,
+        "model_routes": configurable.model_routes,
     }
 
     # Initialize the model - handle provider:model format
     if ":" in supervisor_model:
         provider, model = supervisor_model.split(":", 1)
-        llm = get_chat_model(model=model, model_provider=provider, azure_config=azure_config)
+        llm = get_chat_model(model=model, model_provider=provider, azure_config=azure_config, response_cache_path=configurable.response_cache_path)
     else:
-        llm = get_chat_model(model=supervisor_model, model_provider="openai", azure_config=azure_config)
+        llm = get_chat_model(model=supervisor_model, model_provider="openai", azure_config=azure_config, response_cache_path=configurable.response_cache_path)
     
     # If sections have been completed, but we don't yet have the final report, then we need to initiate writing the introduction and conclusion
     if state.get("completed_sections") and not state.get("final_report"):
@@ -216,6 +241,9 @@ async def supervisor(state: ReportState, config: RunnableConfig):
 
     # Get tools based on configuration
     supervisor_tool_list = await get_supervisor_tools(config)
+    if not configurable.number_of_queries:
+        # The report budget is spent, no more searches
+        supervisor_tool_list = [tool for tool in supervisor_tool_list if (tool.metadata or {}).get("type") != "search"]
     
     
     llm_with_tools = (
@@ -228,10 +256,11 @@ async def supervisor(state: ReportState, config: RunnableConfig):
         )
     )
 
-    # Get system prompt
-    system_prompt = SUPERVISOR_INSTRUCTIONS.format(today=get_today_str())
+    # Get system prompt, the static instructions are the cached prefix and the date and MCP prompt follow them
+    system_inputs = SUPERVISOR_INPUTS.format(today=get_today_str())
     if configurable.mcp_prompt:
-        system_prompt += f"\n\n{configurable.mcp_prompt}"
+        system_inputs += f"\n\n{configurable.mcp_prompt}"
+    system_prompt = cacheable_prompt(llm, SUPERVISOR_INSTRUCTIONS, system_inputs)
 
     # Invoke
     return {
@@ -250,6 +279,7 @@ async def supervisor(state: ReportState, config: RunnableConfig):
 
 async def supervisor_tools(state: ReportState, config: RunnableConfig)  -> Command[Literal["supervisor", "research_team", "__end__"]]:
     """Performs the tool call and sends to the research agent"""
+    usage = track_report(state, config)
     configurable = MultiAgentConfiguration.from_runnable_config(config)
 
     result = []
@@ -310,8 +340,11 @@ async def supervisor_tools(state: ReportState, config: RunnableConfig)  -> Comma
 
     # After processing all tool calls, decide what to do next
     if sections_list:
-        # Send the sections to the research agents
-        return Command(goto=[Send("research_team", {"section": s}) for s in sections_list], update={"messages": result})
+        # Send the sections to the research agents, except those of this report a resumed thread already completed,
+        # matched by the title they were sent with since the agents name their sections freely
+        completed = set(state.get("completed_titles", []))
+        return Command(goto=[Send("research_team", {"section": s, "report_usage": state.get("report_usage")}) for s in sections_list if s not in completed] or "supervisor",
+                       update={"messages": result})
     elif intro_content:
         # Store introduction while waiting for conclusion
         # Append to messages to guide the LLM to write conclusion next
@@ -333,6 +366,8 @@ async def supervisor_tools(state: ReportState, config: RunnableConfig)  -> Comma
 
         state_update = {
             "final_report": complete_report,
+            # Token, cost and latency totals of the run
+            "usage": export_run_usage(config, configurable.usage_export_dir),
             "messages": result,
         }
     else:
@@ -343,6 +378,7 @@ async def supervisor_tools(state: ReportState, config: RunnableConfig)  -> Comma
     if configurable.include_source_str and source_str:
         state_update["source_str"] = source_str
 
+    state_update["report_usage"] = usage.snapshot()
     return Command(goto="supervisor", update=state_update)
 
 async def supervisor_should_continue(state: ReportState) -> str:
@@ -360,33 +396,42 @@ async def supervisor_should_continue(state: ReportState) -> str:
 
 async def research_agent(state: SectionState, config: RunnableConfig):
     """LLM decides whether to call a tool or not"""
+    current_section.set(state["section"])
+    track_report(state, config)
     
-    # Get configuration
-    configurable = MultiAgentConfiguration.from_runnable_config(config)
+    # Get configuration, scaled down to the budget left
+    configurable = govern_budget(MultiAgentConfiguration.from_runnable_config(config), config)
     researcher_model = get_config_value(configurable.researcher_model)
     
     azure_config = {
         "azure_openai_endpoint": configurable.azure_openai_endpoint,
         "azure_openai_api_key": configurable.azure_openai_api_key,
         "azure_openai_api_version": configurable.azure_openai_api_version,
+        "model_routes": configurable.model_routes,
     }
     
     # Initialize the model - handle provider:model format
     if ":" in researcher_model:
         provider, model = researcher_model.split(":", 1)
-        llm = get_chat_model(model=model, model_provider=provider, azure_config=azure_config)
+        llm = get_chat_model(model=model, model_provider=provider, azure_config=azure_config, response_cache_path=configurable.response_cache_path)
     else:
-        llm = get_chat_model(model=researcher_model, model_provider="openai", azure_config=azure_config)
+        llm = get_chat_model(model=researcher_model, model_provider="openai", azure_config=azure_config, response_cache_path=configurable.response_cache_path)
 
     # Get tools based on configuration
     research_tool_list = await get_research_tools(config)
-    system_prompt = RESEARCH_INSTRUCTIONS.format(
+    # The instructions are shared by all researchers, the section follows the cached prefix
+    system_inputs = RESEARCH_INPUTS.format(
         section_description=state["section"],
         number_of_queries=configurable.number_of_queries,
         today=get_today_str(),
     )
     if configurable.mcp_prompt:
-        system_prompt += f"\n\n{configurable.mcp_prompt}"
+        system_inputs += f"\n\n{configurable.mcp_prompt}"
+    if not configurable.number_of_queries:
+        # The report budget is spent, the section is written from what was found so far
+        research_tool_list = [tool for tool in research_tool_list if (tool.metadata or {}).get("type") != "search"]
+        system_inputs += "\n\nThe research budget is spent: do not search any more, write the section now with the information you already have."
+    system_prompt = cacheable_prompt(llm, RESEARCH_INSTRUCTIONS, system_inputs)
 
     # Ensure we have at least one user message (required by Anthropic)
     messages = state.get("messages", [])
@@ -395,24 +440,30 @@ async def research_agent(state: SectionState, config: RunnableConfig):
 
     return {
         "messages": [
-            # Enforce tool calling to either perform more search or call the Section tool to write the section
-            await llm.bind_tools(research_tool_list,             
-                                 parallel_tool_calls=False,
-                                 # force at least one tool call
-                                 tool_choice="any").ainvoke(
+            # Enforce tool calling to either perform more search or call the Section tool to write the section,
+            # streaming the section content while the Section tool call is generated
+            await astream_section_tool_call(
+                llm.bind_tools(research_tool_list,
+                               parallel_tool_calls=False,
+                               # force at least one tool call
+                               tool_choice="any"),
                 [
                     {
                         "role": "system",
                         "content": system_prompt
                     }
                 ]
-                + messages
+                + messages,
+                state["section"],
+                tool_name="Section",
             )
         ]
     }
 
 async def research_agent_tools(state: SectionState, config: RunnableConfig):
     """Performs the tool call and route to supervisor or continue the research loop"""
+    current_section.set(state["section"])
+    usage = track_report(state, config)
     configurable = MultiAgentConfiguration.from_runnable_config(config)
 
     result = []
@@ -457,6 +508,8 @@ async def research_agent_tools(state: SectionState, config: RunnableConfig):
     if completed_section:
         # Write the completed section to state and return to the supervisor
         state_update["completed_sections"] = [completed_section]
+        state_update["completed_titles"] = [state["section"]]
+        state_update["report_usage"] = usage.snapshot()
     if configurable.include_source_str and source_str:
         state_update["source_str"] = source_str
 
@@ -490,12 +543,14 @@ research_builder.add_edge("research_agent_tools", "research_agent")
 
 # Supervisor workflow
 supervisor_builder = StateGraph(ReportState, input=MessagesState, output=ReportStateOutput, config_schema=MultiAgentConfiguration)
+supervisor_builder.add_node("start_report", start_report)
 supervisor_builder.add_node("supervisor", supervisor)
 supervisor_builder.add_node("supervisor_tools", supervisor_tools)
 supervisor_builder.add_node("research_team", research_builder.compile())
 
 # Flow of the supervisor agent
-supervisor_builder.add_edge(START, "supervisor")
+supervisor_builder.add_edge(START, "start_report")
+supervisor_builder.add_edge("start_report", "supervisor")
 supervisor_builder.add_conditional_edges(
     "supervisor",
     supervisor_should_continue,
@@ -503,4 +558,4 @@ supervisor_builder.add_conditional_edges(
 )
 supervisor_builder.add_edge("research_team", "supervisor")
 
-graph = supervisor_builder.compile()
\ No newline at end of file
+graph = supervisor_builder.compile(checkpointer=get_checkpointer())
\ No newline at end of file
@@ -0,0 +1,164 @@
+import hashlib
+import threading
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.types import Send
+
+# Serialization type of the values the CompactSerializer wrote with markers
+COMPACT_TYPE = "msgpack+compact"
+
+# Keys of the markers of shared texts and section records in compacted values
+_SHARED_TEXT_KEY = "__shared_text__"
+_SECTION_RECORD_KEY = "__section_record__"
+
+
+class MissingSharedTextError(LookupError):
+    """Shared text of a checkpoint missing from memory and from the registered loaders.
+
+    Raised e.g. when a checkpoint is read in a new process without the checkpointer
+    that stored its shared texts, or after these were pruned.
+    """
+
+
+@dataclass(frozen=True)
+class SharedText:
+    """Immutable text shared by the state of many branches, referenced by its id.
+
+    Every Send of a fan-out gets the same object instead of a copy of the text, and
+    the CompactSerializer writes it as its id, the checkpointer storing the text once.
+    ``str()`` of a SharedText is its text, so nodes read it like a plain string.
+    """
+    id: str # SHA-256 of the text
+    text: str = field(repr=False)
+
+    def __str__(self) -> str:
+        return self.text
+
+    @classmethod
+    def resolve(cls, id: str) -> "SharedText":
+        """Look up a shared text by id, in memory first, then with the registered loaders.
+
+        Raises:
+            MissingSharedTextError: If no loader has the text
+        """
+        with _SHARED_TEXTS_LOCK:
+            shared = _SHARED_TEXTS.get(id)
+            if shared is not None:
+                return shared
+        for loader in list(_SHARED_TEXT_LOADERS):
+            text = loader(id)
+            if text is not None:
+                return share_text(text)
+        raise MissingSharedTextError(f"Shared text {id[:12]} is missing from memory and from the checkpoint database")
+
+
+_SHARED_TEXTS: "weakref.WeakValueDictionary[str, SharedText]" = weakref.WeakValueDictionary()
+_SHARED_TEXTS_LOCK = threading.Lock()
+_SHARED_TEXT_LOADERS: List[Callable[[str], Optional[str]]] = []
+
+
+def share_text(text: Union[str, SharedText]) -> SharedText:
+    """Get the SharedText of a text, the same object for equal texts alive at the same time."""
+    if isinstance(text, SharedText):
+        return text
+    id = hashlib.sha256(text.encode()).hexdigest()
+    with _SHARED_TEXTS_LOCK:
+        shared = _SHARED_TEXTS.get(id)
+        if shared is None:
+            shared = _SHARED_TEXTS[id] = SharedText(id, text)
+        return shared
+
+
+def register_shared_text_loader(loader: Callable[[str], Optional[str]]) -> None:
+    """Register a function returning the text of a shared text id it stored, or None."""
+    if loader not in _SHARED_TEXT_LOADERS:
+        _SHARED_TEXT_LOADERS.append(loader)
+
+
+@dataclass(slots=True)
+class SectionRecord:
+    """Compact report section handed to the section branches.
+
+    Same fields as Section, without the pydantic machinery: it is cheaper to create
+    and copy, and the CompactSerializer writes it as the list of its values.
+    """
+    name: str
+    description: str
+    research: bool
+    content: str
+
+    @classmethod
+    def from_section(cls, section: Any) -> "SectionRecord":
+        """Record of a Section (or of another record)."""
+        return cls(section.name, section.description, section.research, section.content)
+
+
+class CompactSerializer(JsonPlusSerializer):
+    """Serializer writing shared texts by id and section records as lists of their values.
+
+    Shared texts and section records found in dicts, lists, tuples and Send payloads
+    are replaced by small markers before the value is written by the
+    JsonPlusSerializer, under the COMPACT_TYPE type, and are restored when read back.
+    Shared texts met while serializing are returned by dumps_shared, for the
+    checkpointer to store them once (see SqliteCheckpointSaver); values written with
+    dumps_typed can only be read back in a process holding their shared texts.
+    """
+
+    def dumps_shared(self, obj: Any) -> Tuple[str, bytes, Dict[str, str]]:
+        """Serialize a value, returning the texts of the shared texts it refers to by id."""
+        shared: Dict[str, str] = {}
+        compacted = False
+
+        def compact(value: Any) -> Any:
+            nonlocal compacted
+            if isinstance(value, SharedText):
+                compacted = True
+                shared[value.id] = value.text
+                return {_SHARED_TEXT_KEY: value.id}
+            if isinstance(value, SectionRecord):
+                compacted = True
+                return {_SECTION_RECORD_KEY: [value.name, value.description, value.research, value.content]}
+            if type(value) is dict:
+                return {key: compact(item) for key, item in value.items()}
+            if type(value) in (list, tuple):
+                return type(value)(compact(item) for item in value)
+            if isinstance(value, Send):
+                # Send payloads are where shared texts and section records are found
+                return Send(value.node, compact(value.arg))
+            return value
+
+        value = compact(obj)
+        if not compacted:
+            return (*super().dumps_typed(obj), {})
+        type_, data = super().dumps_typed(value)
+        if type_ != "msgpack":
+            # e.g. the JSON fallback of invalid UTF-8, written without markers
+            return (*super().dumps_typed(obj), {})
+        return COMPACT_TYPE, data, shared
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        type_, data, _ = self.dumps_shared(obj)
+        return type_, data
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, data_ = data
+        if type_ != COMPACT_TYPE:
+            return super().loads_typed(data)
+
+        def restore(value: Any) -> Any:
+            if type(value) is dict:
+                if len(value) == 1 and _SHARED_TEXT_KEY in value:
+                    return SharedText.resolve(value[_SHARED_TEXT_KEY])
+                if len(value) == 1 and _SECTION_RECORD_KEY in value:
+                    return SectionRecord(*value[_SECTION_RECORD_KEY])
+                return {key: restore(item) for key, item in value.items()}
+            if type(value) in (list, tuple):
+                return type(value)(restore(item) for item in value)
+            if isinstance(value, Send):
+                return Send(value.node, restore(value.arg))
+            return value
+
+        return restore(super().loads_typed(("msgpack", data_)))
@@ -165,24 +165,12 @@ section_writer_inputs="""
 </Source material>
 """
 
-section_grader_instructions = """Review a report section relative to the specified topic:
-
-<Report topic>
-{topic}
-</Report topic>
-
-<section topic>
-{section_topic}
-</section topic>
-
-<section content>
-{section}
-</section content>
+section_grader_instructions = """Review a report section relative to the specified topic. The report request, section topic and section content are given in the user message.
 
 <task>
 Evaluate whether the section content adequately addresses the section topic.
 
-If the section content does not adequately address the section topic, generate {number_of_follow_up_queries} follow-up search queries to gather missing information.
+If the section content does not adequately address the section topic, generate the number of follow-up search queries given in the user message to gather missing information.
 </task>
 
 <format>
@@ -197,23 +185,24 @@ follow_up_queries: List[SearchQuery] = Field(
 </format>
 """
 
-final_section_writer_instructions="""You are an expert technical writer crafting a section that synthesizes information from the rest of the report.
-
-<Report topic>
+section_grader_inputs = """<Report topic>
 {topic}
 </Report topic>
 
-<Section name>
-{section_name}
-</Section name>
-
-<Section topic> 
+<section topic>
 {section_topic}
-</Section topic>
+</section topic>
 
-<Available report content>
-{context}
-</Available report content>
+<section content>
+{section}
+</section content>
+
+<number of follow-up queries>
+{number_of_follow_up_queries}
+</number of follow-up queries>
+"""
+
+final_section_writer_instructions="""You are an expert technical writer crafting a section that synthesizes information from the rest of the report. The report request and the available report content are given in the user message, followed by the name and topic of the section to write.
 
 <Task>
 1. Section-Specific Approach:
@@ -260,6 +249,25 @@ For Conclusion/Summary:
 - Do not include word count or any preamble in your response
 </Quality Checks>"""
 
+# Shared by every final section, so it precedes the section-specific inputs
+final_section_writer_context = """<Report topic>
+{topic}
+</Report topic>
+
+<Available report content>
+{context}
+</Available report content>
+"""
+
+final_section_writer_inputs = """<Section name>
+{section_name}
+</Section name>
+
+<Section topic>
+{section_topic}
+</Section topic>
+"""
+
 
 ## Supervisor
 SUPERVISOR_INSTRUCTIONS = """
@@ -335,27 +343,23 @@ Step 7: Call FinishReport tool → Complete
 - Follow the exact tool sequence shown in the example
 - Check your message history to see what you've already completed
 </critical_reminders>
-
-Today is {today}
 """
 
+SUPERVISOR_INPUTS = """Today is {today}"""
+
 RESEARCH_INSTRUCTIONS = """
 You are a researcher responsible for completing a specific section of a report.
 
 ### Your goals:
 
 1. **Understand the Section Scope**  
-   Begin by reviewing the section scope of work. This defines your research focus. Use it as your objective.
-
-<Section Description>
-{section_description}
-</Section Description>
+   Begin by reviewing the section scope of work, given in the Section Description at the end of these instructions. This defines your research focus. Use it as your objective.
 
 2. **Strategic Research Process**  
    Follow this precise research strategy:
 
    a) **First Search**: Begin with well-crafted search queries for a search tool that directly addresses the core of the section topic.
-      - Formulate {number_of_queries} UNIQUE, targeted queries that will yield the most valuable information
+      - Formulate the number of queries given at the end of these instructions as UNIQUE, targeted queries that will yield the most valuable information
       - Avoid generating multiple similar queries (e.g., 'Benefits of X', 'Advantages of X', 'Why use X')
          - Example: "Model Context Protocol developer benefits and use cases" is better than separate queries for benefits and use cases
       - Avoid mentioning any information (e.g., specific entities, events or dates) that might be outdated in your queries, unless explicitly provided by the user or included in your instructions
@@ -438,6 +442,15 @@ Before each search query or when writing the section, think through:
 - Keep a professional, factual tone
 - Always follow markdown formatting
 - Stay within the 200 word limit for the main content
+"""
+
+RESEARCH_INPUTS = """<Section Description>
+{section_description}
+</Section Description>
+
+<Number of queries>
+{number_of_queries}
+</Number of queries>
 
 Today is {today}
 """
@@ -510,4 +523,19 @@ Example 2 (for a scientific article):
 }}
 ```
 
-Remember, your goal is to create a summary that can be easily understood and utilized by a downstream research agent while preserving the most critical information from the original webpage."""
\ No newline at end of file
+Remember, your goal is to create a summary that can be easily understood and utilized by a downstream research agent while preserving the most critical information from the original webpage."""
+
+BATCH_SUMMARIZATION_PROMPT = """You are tasked with summarizing the raw content of several short webpages retrieved from a web search. Each webpage must be summarized on its own, following the same guidelines you would use for a single page: preserve the main topic, key facts, statistics, dates, names and important quotes, and keep the summary significantly shorter than the original unless the content is already concise.
+
+Here are the webpages, each wrapped in a tag carrying its id:
+
+{webpages}
+
+Return exactly one summary per webpage, in the same order as the webpages above. Each summary must contain:
+- "summary": a concise summary of that webpage only
+- "key_excerpts": up to 5 important quotes or excerpts from that webpage
+
+Never merge information from different webpages into the same summary."""
+
+
+section_grader_confidence_message = """Also rate your confidence in the grade from 0 to 1. Use a confidence below 0.5 if the section is borderline, if you are unsure whether the sources support it, or if part of the section topic could be judged either way."""
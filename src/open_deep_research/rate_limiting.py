@@ -0,0 +1,247 @@
+import asyncio
+import threading
+import time
+import weakref
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.outputs import LLMResult
+
+# Default upper bound of concurrent calls per model deployment
+DEFAULT_LLM_MAX_CONCURRENCY = 16
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Check whether an exception raised by a model or search client is a rate-limit (429) error."""
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if status_code == 429:
+        return True
+    message = str(error).lower()
+    return "429" in message or "rate limit" in message or "ratelimit" in message
+
+
+def is_timeout_error(error: BaseException) -> bool:
+    """Check whether an exception is a request timeout, a sign of an overloaded deployment."""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return status_code in (408, 504) or "timeout" in type(error).__name__.lower() or "timed out" in str(error).lower()
+
+
+def get_retry_after(error: BaseException) -> Optional[float]:
+    """Read the Retry-After delay in seconds from the response attached to an exception."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        # HTTP dates are not worth parsing here, the backoff of the caller applies
+        return None
+    return None
+
+
+class AIMDLimiter:
+    """Adaptive concurrency limit with additive increase and multiplicative decrease.
+
+    Each successful call raises the limit by ``increase / limit``, so about one slot per
+    window of successful calls. A rate-limit or timeout error multiplies the limit by
+    ``decrease_factor``; errors of calls that started before the last decrease are not
+    counted again, so a burst of 429s from one window cuts the limit only once. A
+    Retry-After delay makes every new call wait until it has passed.
+
+    The limiter is shared by the calls of one event loop, the loop it is first used
+    in; get_llm_limiter keeps one limiter per deployment and event loop.
+
+    Args:
+        max_concurrency: Upper bound of the limit
+        initial_concurrency: Starting limit, defaults to max_concurrency
+        min_concurrency: Lower bound of the limit
+        increase: Slots added per window of successful calls
+        decrease_factor: Factor applied to the limit on rate-limit or timeout errors
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = DEFAULT_LLM_MAX_CONCURRENCY,
+        initial_concurrency: Optional[int] = None,
+        min_concurrency: int = 1,
+        increase: float = 1.0,
+        decrease_factor: float = 0.5,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.limit = float(min(initial_concurrency or self.max_concurrency, self.max_concurrency))
+        self._in_flight = 0
+        self._waiting = 0
+        self._cooldown_until = 0.0
+        self._last_decrease = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._condition: Optional[asyncio.Condition] = None
+        # metrics
+        self.acquired = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _get_condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if self._loop is None:
+            self._loop = loop
+            self._condition = asyncio.Condition()
+        elif self._loop is not loop:
+            raise RuntimeError("AIMDLimiter is bound to a different event loop")
+        return self._condition
+
+    async def acquire(self) -> float:
+        """Wait for a free slot and for any Retry-After cool-down.
+
+        Returns:
+            float: Start time of the call, to be passed back to release
+        """
+        condition = self._get_condition()
+        queued_at = time.monotonic()
+        async with condition:
+            self._waiting += 1
+            try:
+                await condition.wait_for(lambda: self._in_flight < int(self.limit))
+            finally:
+                self._waiting -= 1
+            self._in_flight += 1
+        delay = self._cooldown_until - time.monotonic()
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                await self.release(queued_at, success=False)
+                raise
+        started_at = time.monotonic()
+        wait = started_at - queued_at
+        self.acquired += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        return started_at
+
+    async def release(self, started_at: float, throttled: bool = False, success: bool = True, retry_after: Optional[float] = None):
+        """Free the slot of a call and adapt the limit to its outcome."""
+        condition = self._get_condition()
+        async with condition:
+            self._in_flight = max(0, self._in_flight - 1)
+            now = time.monotonic()
+            if retry_after:
+                self._cooldown_until = max(self._cooldown_until, now + retry_after)
+            if throttled:
+                self.throttled += 1
+                if started_at >= self._last_decrease:
+                    self.limit = max(float(self.min_concurrency), self.limit * self.decrease_factor)
+                    self._last_decrease = now
+            elif success:
+                self.limit = min(float(self.max_concurrency), self.limit + self.increase / self.limit)
+            condition.notify_all()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Current limit, occupancy and queue-wait statistics."""
+        return {
+            "limit": int(self.limit),
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "acquired": self.acquired,
+            "throttled": self.throttled,
+            "avg_wait": self.total_wait / self.acquired if self.acquired else 0.0,
+            "max_wait": self.max_wait,
+            "cooldown": max(0.0, self._cooldown_until - time.monotonic()),
+        }
+
+
+# Limiters are kept per event loop, since slots held by the calls of one loop cannot
+# be waited for from another. They disappear with their loop.
+_LLM_LIMITERS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, AIMDLimiter]]" = weakref.WeakKeyDictionary()
+_LLM_LIMITERS_LOCK = threading.Lock()
+
+
+def get_llm_limiter(deployment: tuple, max_concurrency: int = DEFAULT_LLM_MAX_CONCURRENCY) -> AIMDLimiter:
+    """Get the limiter of a model deployment for the running event loop."""
+    loop = asyncio.get_running_loop()
+    with _LLM_LIMITERS_LOCK:
+        limiters = _LLM_LIMITERS.setdefault(loop, {})
+        limiter = limiters.get(deployment)
+        if limiter is None:
+            limiter = limiters[deployment] = AIMDLimiter(max_concurrency=max_concurrency)
+        elif limiter.max_concurrency != max_concurrency:
+            limiter.max_concurrency = max(1, max_concurrency)
+            limiter.limit = min(limiter.limit, float(limiter.max_concurrency))
+        return limiter
+
+
+def get_llm_limiter_metrics() -> Dict[str, Dict[str, Any]]:
+    """Get the metrics of the model deployment limiters, keyed by "provider:deployment".
+
+    Only the limiters of the running event loop are included when called from one.
+    """
+    try:
+        loops = [asyncio.get_running_loop()]
+    except RuntimeError:
+        loops = list(_LLM_LIMITERS.keys())
+    return {
+        ":".join(str(part) for part in key if part): limiter.metrics()
+        for loop in loops
+        for key, limiter in _LLM_LIMITERS.get(loop, {}).items()
+    }
+
+
+class RateLimitCallbackHandler(AsyncCallbackHandler):
+    """Holds every chat model call until its deployment's AIMD limiter has a free slot.
+
+    The slot is taken when the call starts and given back when it ends or fails, so
+    retries (with_retry or node retries) queue behind the same limit and cool-down
+    instead of firing at once. The limit per deployment comes from the
+    ``llm_max_concurrency`` configurable, if set, and defaults to
+    DEFAULT_LLM_MAX_CONCURRENCY.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._runs: Dict[UUID, tuple] = {}
+
+    @staticmethod
+    def _deployment(serialized: Optional[Dict[str, Any]], params: Dict[str, Any]) -> tuple:
+        provider = params.get("_type") or ((serialized or {}).get("id") or [None])[-1]
+        model = params.get("azure_deployment") or params.get("deployment_name") or params.get("model") or params.get("model_name")
+        endpoint = params.get("azure_endpoint") or params.get("base_url") or params.get("openai_api_base")
+        return (provider, model, endpoint)
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata: Optional[Dict[str, Any]] = None, invocation_params: Optional[Dict[str, Any]] = None, **kwargs: Any):
+        max_concurrency = (metadata or {}).get("llm_max_concurrency") or DEFAULT_LLM_MAX_CONCURRENCY
+        limiter = get_llm_limiter(self._deployment(serialized, invocation_params or {}), int(max_concurrency))
+        started_at = await limiter.acquire()
+        self._runs[run_id] = (limiter, started_at)
+
+    async def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            limiter, started_at = run
+            await limiter.release(started_at)
+
+    async def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        limiter, started_at = run
+        if isinstance(error, asyncio.CancelledError):
+            await limiter.release(started_at, success=False)
+            return
+        throttled = is_rate_limit_error(error) or is_timeout_error(error)
+        await limiter.release(started_at, throttled=throttled, success=False, retry_after=get_retry_after(error))
+
+
+# Attached to every chat model created through get_chat_model
+RATE_LIMIT_CALLBACK_HANDLER = RateLimitCallbackHandler()
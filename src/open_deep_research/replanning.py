@@ -0,0 +1,121 @@
+import difflib
+import logging
+from typing import Any, Dict, List, Set, Tuple
+
+from open_deep_research.deadline import INCOMPLETE_SECTION_MARKER
+from open_deep_research.payloads import SectionRecord
+
+logger = logging.getLogger(__name__)
+
+# Similarity to a researched section from which a planned section reuses its draft as
+# it is, and from which it is rewritten from the earlier draft and sources instead of
+# being researched from scratch
+SECTION_REUSE_MIN_SIMILARITY = 0.9
+SECTION_SEED_MIN_SIMILARITY = 0.6
+
+
+def _normalize(text: str) -> str:
+    return " ".join((text or "").lower().split())
+
+
+def section_similarity(section: Any, research: Dict[str, Any], name: str) -> float:
+    """Similarity of a planned section to a researched one, from 0 to 1.
+
+    The difflib ratios of the names and of the descriptions, the description
+    weighing twice as much as the name.
+    """
+    name_ratio = difflib.SequenceMatcher(None, _normalize(section.name), _normalize(name)).ratio()
+    description_ratio = difflib.SequenceMatcher(None, _normalize(section.description), _normalize(research.get("description", ""))).ratio()
+    return (name_ratio + 2 * description_ratio) / 3
+
+
+def match_sections(sections: List[Any], section_research: Dict[str, Dict[str, Any]]) -> Dict[str, Tuple[str, float]]:
+    """Match planned sections to researched sections, one to one, the most similar pairs first.
+
+    Args:
+        sections: Sections of the revised plan
+        section_research: Research of the completed sections by name (see research_record)
+
+    Returns:
+        Dict[str, Tuple[str, float]]: Researched section name and similarity by planned
+        section name, for the pairs at least SECTION_SEED_MIN_SIMILARITY similar
+    """
+    pairs = sorted(
+        (
+            (section_similarity(section, research, name), section.name, name)
+            for section in sections
+            for name, research in section_research.items()
+        ),
+        reverse=True,
+    )
+    matches: Dict[str, Tuple[str, float]] = {}
+    used: Set[str] = set()
+    for similarity, planned, researched in pairs:
+        if similarity < SECTION_SEED_MIN_SIMILARITY:
+            break
+        if planned in matches or researched in used:
+            continue
+        matches[planned] = (researched, similarity)
+        used.add(researched)
+    return matches
+
+
+def research_record(section: Any, search_queries: List[Any], **sources: Any) -> Dict[str, Dict[str, Any]]:
+    """State update recording the research of a completed section, for later revisions of the plan.
+
+    Args:
+        section: The completed section
+        search_queries: Latest search queries of the section (SearchQuery objects or strings)
+        **sources: The sources of the section, as the graph keeps them (e.g. source_refs)
+    """
+    queries = [getattr(query, "search_query", query) for query in search_queries or []]
+    return {section.name: {"description": section.description, "search_queries": queries, "content": section.content, **sources}}
+
+
+def reuse_section_research(
+    sections: List[Any],
+    completed: Set[str],
+    section_research: Dict[str, Dict[str, Any]],
+) -> Tuple[List[SectionRecord], Dict[str, Dict[str, Any]]]:
+    """Find the earlier research each research section of a revised plan can reuse.
+
+    A section nearly identical to a researched one (SECTION_REUSE_MIN_SIMILARITY)
+    takes over its draft as it is, renamed if needed. A section similar to one
+    (SECTION_SEED_MIN_SIMILARITY), or matching a draft cut short by the deadline, is
+    rewritten from its draft, queries and sources, and researched further only if the
+    grader asks for it. Other sections are researched from scratch.
+
+    Args:
+        sections: Sections of the revised plan
+        completed: Names of the sections already completed under their planned name
+        section_research: Research of the completed sections by name (see research_record)
+
+    Returns:
+        Tuple: The reused sections, completed under their planned names, and the earlier
+        research by name of the sections to rewrite from it
+    """
+    pending = [s for s in sections if s.research and s.name not in completed]
+    reused: List[SectionRecord] = []
+    seeds: Dict[str, Dict[str, Any]] = {}
+    # the research of sections kept under their name is not reused for others
+    kept = completed & {s.name for s in sections}
+    available = {name: research for name, research in section_research.items() if name not in kept}
+    if not pending or not available:
+        return reused, seeds
+    matches = match_sections(pending, available)
+    for section in pending:
+        match = matches.get(section.name)
+        if match is None:
+            continue
+        name, similarity = match
+        research = available[name]
+        draft = research.get("content") or ""
+        if similarity >= SECTION_REUSE_MIN_SIMILARITY and draft and INCOMPLETE_SECTION_MARKER not in draft:
+            logger.info("Reusing section %s for %s (similarity %.2f)", name, section.name, similarity)
+            if name != section.name:
+                draft = draft.replace(f"## {name}", f"## {section.name}", 1)
+            reused.append(SectionRecord(section.name, section.description, True, draft))
+        else:
+            logger.info("Rewriting section %s from the research of %s (similarity %.2f)", section.name, name, similarity)
+            seeds[section.name] = {**research, "content": draft.replace(INCOMPLETE_SECTION_MARKER, "").strip()}
+    return reused, seeds
@@ -0,0 +1,124 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# Response metadata flag of the messages answered by a ResponseCache
+RESPONSE_CACHE_HIT_KEY = "response_cache_hit"
+
+
+class ResponseCache(BaseCache):
+    """Exact-match cache of LLM responses, stored in SQLite.
+
+    Entries are keyed by a hash of the model's LLM string (model, parameters and bound
+    tools or output schema) and of the serialized prompt messages, so any change to
+    the prompt, model, parameters or schema is a miss. Hits, misses and writes are
+    counted per instance, and the messages of hits are flagged with
+    RESPONSE_CACHE_HIT_KEY in their response metadata.
+
+    Args:
+        path: SQLite database file, created if missing
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, llm_string TEXT, created_at REAL, generations TEXT)"
+            )
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode()).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT generations FROM responses WHERE key = ?", (self._key(prompt, llm_string),)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        try:
+            generations = loads(row[0])
+        except Exception as e:
+            # entries written by an incompatible langchain version are ignored
+            logger.warning("Ignoring unreadable response cache entry: %s", e)
+            return None
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            if message is not None:
+                message.response_metadata[RESPONSE_CACHE_HIT_KEY] = True
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        generations = dumps(list(return_val))
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, llm_string, created_at, generations) VALUES (?, ?, ?, ?)",
+                (self._key(prompt, llm_string), llm_string, time.time(), generations),
+            )
+            self.writes += 1
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM responses")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit, miss and write counts of this cache and its hit rate."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_RESPONSE_CACHES: Dict[str, ResponseCache] = {}
+
+
+def get_response_cache(path: str) -> ResponseCache:
+    """Get the process-wide response cache stored at a path."""
+    path = os.path.abspath(os.path.expanduser(path))
+    if path not in _RESPONSE_CACHES:
+        _RESPONSE_CACHES[path] = ResponseCache(path)
+    return _RESPONSE_CACHES[path]
+
+
+def get_response_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Get the stats of every response cache opened in this process, by path."""
+    return {path: cache.stats() for path, cache in _RESPONSE_CACHES.items()}
+
+
+def is_deterministic_call(model_kwargs: Dict[str, Any]) -> bool:
+    """Whether a model configured with these arguments may have its responses cached.
+
+    Only calls with an explicit temperature of zero are cached: the provider default
+    temperature samples the output, and so does extended thinking.
+    """
+    if model_kwargs.get("temperature") != 0:
+        return False
+    thinking = model_kwargs.get("thinking")
+    if isinstance(thinking, dict) and thinking.get("type") == "enabled":
+        return False
+    return True
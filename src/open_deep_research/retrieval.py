@@ -0,0 +1,883 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import functools
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Literal, Optional, Tuple
+
+import numpy as np
+from langchain.embeddings import init_embeddings
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import RunnableConfig
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+try:
+    import fcntl
+except ImportError: # Windows: on-disk caches are only safe for one writing process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(text: str) -> str:
+    """Hash chunk content, used as the cache and deduplication key."""
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class EmbeddingCache:
+    """Embedding vectors keyed by (model, content hash).
+
+    Vectors are stored as one float32 row per hash. With a ``cache_dir`` the rows
+    are appended to ``vectors.f32`` (read back through a memory map) and their
+    hashes to ``keys.txt``, so the cache survives across runs and processes
+    without loading every vector into memory. Writers hold an exclusive lock on
+    ``lock`` (fcntl, where available) and first read the rows other processes
+    appended, so concurrent writers never misalign the two files. Without a
+    ``cache_dir`` the cache lives in memory for the lifetime of the process, in a
+    buffer grown geometrically up to ``max_entries`` rows, beyond which the oldest
+    rows are overwritten.
+
+    Args:
+        model: Embedding model identifier, part of the cache key
+        cache_dir: Directory for the on-disk cache, or None for an in-memory cache
+        max_entries: Maximum number of vectors of the in-memory cache
+    """
+
+    def __init__(self, model: str, cache_dir: Optional[str] = None, max_entries: int = 100_000):
+        self.model = model
+        self.dimensions: Optional[int] = None
+        self.max_entries = max_entries
+        self._rows: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._size = 0
+        self._path = None
+        self._keys_offset = 0 # Bytes of keys.txt read so far
+        self._row_keys: List[Optional[str]] = [] # Hash of each in-memory row, to evict it when overwritten
+        self._next_row = 0 # In-memory row written next
+        if cache_dir:
+            self._path = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model))
+            os.makedirs(self._path, exist_ok=True)
+            with self._lock:
+                self._sync()
+
+    @property
+    def _vectors_file(self) -> str:
+        return os.path.join(self._path, "vectors.f32")
+
+    @property
+    def _keys_file(self) -> str:
+        return os.path.join(self._path, "keys.txt")
+
+    @property
+    def _meta_file(self) -> str:
+        return os.path.join(self._path, "meta.json")
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """Hold the lock of the on-disk cache, shared by the processes writing to it."""
+        with open(os.path.join(self._path, "lock"), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _sync(self, repair: bool = False):
+        """Read the rows appended to the on-disk cache since the last call.
+
+        Vectors are written before their keys, so an interrupted write leaves extra
+        vector rows or a partial key line at most. With ``repair`` (under the file
+        lock) they are truncated, so that the next rows are appended aligned.
+        """
+        if self.dimensions is None:
+            if not os.path.exists(self._meta_file):
+                return
+            with open(self._meta_file) as f:
+                self.dimensions = json.load(f)["dimensions"]
+        if not os.path.exists(self._keys_file):
+            open(self._keys_file, "a").close()
+        with open(self._keys_file, "rb") as f:
+            f.seek(self._keys_offset)
+            appended = f.read()
+        complete = appended[:appended.rfind(b"\n") + 1]
+        keys = complete.decode().splitlines()
+        vector_rows = os.path.getsize(self._vectors_file) // (4 * self.dimensions) if os.path.exists(self._vectors_file) else 0
+        keys = keys[:max(0, vector_rows - self._size)]
+        for key in keys:
+            self._rows.setdefault(key, self._size)
+            self._size += 1
+            self._keys_offset += len(key.encode()) + 1
+        if repair:
+            with open(self._keys_file, "ab") as f:
+                f.truncate(self._keys_offset)
+            with open(self._vectors_file, "ab") as f:
+                f.truncate(4 * self.dimensions * self._size)
+        if keys:
+            self._remap()
+
+    def _remap(self):
+        if self._size:
+            self._vectors = np.memmap(self._vectors_file, dtype=np.float32, mode="r", shape=(self._size, self.dimensions))
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get_many(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """Look up cached vectors, returning only the hashes that were found."""
+        with self._lock:
+            return {h: np.array(self._vectors[self._rows[h]]) for h in hashes if h in self._rows}
+
+    def put_many(self, hashes: List[str], vectors: np.ndarray):
+        """Store vectors for hashes that are not cached yet."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self._path:
+                with self._file_lock():
+                    self._put_on_disk(hashes, vectors)
+            else:
+                self._put_in_memory(hashes, vectors)
+
+    def _new_rows(self, hashes: List[str]) -> List[int]:
+        new = {}
+        for i, h in enumerate(hashes):
+            if h not in self._rows and h not in new:
+                new[h] = i
+        return list(new.values())
+
+    def _put_on_disk(self, hashes: List[str], vectors: np.ndarray):
+        self._sync(repair=True)
+        if self.dimensions is None:
+            self.dimensions = vectors.shape[1]
+            with open(self._meta_file, "w") as f:
+                json.dump({"model": self.model, "dimensions": self.dimensions}, f)
+        new = self._new_rows(hashes)
+        if not new:
+            return
+        new_hashes = [hashes[i] for i in new]
+        with open(self._vectors_file, "ab") as f:
+            f.write(vectors[new].tobytes())
+        with open(self._keys_file, "a") as f:
+            f.write("".join(f"{h}\n" for h in new_hashes))
+        self._sync()
+
+    def _put_in_memory(self, hashes: List[str], vectors: np.ndarray):
+        if self.dimensions is None:
+            self.dimensions = vectors.shape[1]
+        new = self._new_rows(hashes)[-self.max_entries:]
+        if not new:
+            return
+        needed = min(self._size + len(new), self.max_entries)
+        if self._vectors is None or self._vectors.shape[0] < needed:
+            # grow geometrically so repeated additions stay cheap
+            grown = np.zeros((min(max(needed, 2 * self._size), self.max_entries), self.dimensions), dtype=np.float32)
+            if self._size:
+                grown[:self._size] = self._vectors[:self._size]
+            self._vectors = grown
+            self._row_keys.extend([None] * (grown.shape[0] - len(self._row_keys)))
+        for i in new:
+            row = self._next_row
+            evicted = self._row_keys[row]
+            if evicted is not None:
+                del self._rows[evicted]
+            self._vectors[row] = vectors[i]
+            self._rows[hashes[i]] = row
+            self._row_keys[row] = hashes[i]
+            self._next_row = (row + 1) % self.max_entries
+            self._size = min(self._size + 1, self.max_entries)
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings that only call the underlying model for content not seen before.
+
+    Args:
+        embeddings: The underlying embeddings model
+        cache: Cache holding vectors for this model
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def _split_cached(self, texts: List[str], prefix: str = ""):
+        hashes = [content_hash(f"{prefix}{text}") for text in texts]
+        cached = self.cache.get_many(hashes)
+        missing = {}
+        for h, text in zip(hashes, texts):
+            if h not in cached and h not in missing:
+                missing[h] = text
+        return hashes, cached, missing
+
+    def _merge(self, hashes: List[str], cached: Dict[str, np.ndarray], missing: Dict[str, str], new_vectors) -> np.ndarray:
+        if missing:
+            new_vectors = np.asarray(new_vectors, dtype=np.float32)
+            self.cache.put_many(list(missing), new_vectors)
+            cached.update(zip(missing, new_vectors))
+        if not hashes:
+            return np.zeros((0, self.cache.dimensions or 0), dtype=np.float32)
+        return np.stack([cached[h] for h in hashes])
+
+    def embed_documents_array(self, texts: List[str]) -> np.ndarray:
+        """Embed documents and return them as a float32 matrix."""
+        hashes, cached, missing = self._split_cached(texts)
+        new_vectors = self.embeddings.embed_documents(list(missing.values())) if missing else []
+        return self._merge(hashes, cached, missing, new_vectors)
+
+    async def aembed_documents_array(self, texts: List[str]) -> np.ndarray:
+        """Asynchronously embed documents and return them as a float32 matrix."""
+        hashes, cached, missing = self._split_cached(texts)
+        new_vectors = await self.embeddings.aembed_documents(list(missing.values())) if missing else []
+        return self._merge(hashes, cached, missing, new_vectors)
+
+    def embed_queries_array(self, texts: List[str]) -> np.ndarray:
+        """Embed several queries with a single call to the underlying model.
+
+        Queries share the cache with documents under their own key.
+        """
+        hashes, cached, missing = self._split_cached(texts, prefix="query:")
+        if len(missing) == 1:
+            new_vectors = [self.embeddings.embed_query(next(iter(missing.values())))]
+        else:
+            new_vectors = self.embeddings.embed_documents(list(missing.values())) if missing else []
+        return self._merge(hashes, cached, missing, new_vectors)
+
+    async def aembed_queries_array(self, texts: List[str]) -> np.ndarray:
+        """Asynchronously embed several queries with a single call to the underlying model."""
+        hashes, cached, missing = self._split_cached(texts, prefix="query:")
+        if len(missing) == 1:
+            new_vectors = [await self.embeddings.aembed_query(next(iter(missing.values())))]
+        else:
+            new_vectors = await self.embeddings.aembed_documents(list(missing.values())) if missing else []
+        return self._merge(hashes, cached, missing, new_vectors)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents_array(texts).tolist()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return (await self.aembed_documents_array(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_queries_array([text])[0].tolist()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_queries_array([text]))[0].tolist()
+
+
+_EMBEDDINGS: Dict[tuple, CachedEmbeddings] = {}
+
+
+def get_embeddings(model: str, cache_dir: Optional[str] = None) -> CachedEmbeddings:
+    """Get the process-wide cached embeddings for a model.
+
+    Args:
+        model: Embedding model identifier in ``provider:model`` format
+        cache_dir: Directory for the on-disk embedding cache, or None to cache in memory
+
+    Returns:
+        CachedEmbeddings: Embeddings backed by the cache for this model
+    """
+    key = (model, cache_dir)
+    if key not in _EMBEDDINGS:
+        _EMBEDDINGS[key] = CachedEmbeddings(init_embeddings(model), EmbeddingCache(model, cache_dir))
+    return _EMBEDDINGS[key]
+
+
+@functools.lru_cache(maxsize=None)
+def get_text_splitter(chunk_size: int = 1500, chunk_overlap: int = 200) -> RecursiveCharacterTextSplitter:
+    """Get the splitter for a chunk configuration, built once per process."""
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def chunk_boundaries(text: str, chunk_size: int = 1500, chunk_overlap: int = 200) -> List[Tuple[int, int]]:
+    """Split text into chunks and return their ``(start, end)`` offsets in the text.
+
+    Offsets are located the same way ``add_start_index`` does. Only offsets are returned
+    so that results from worker processes are cheap to send back and to cache.
+    """
+    boundaries = []
+    index, previous_chunk_len = 0, 0
+    for chunk in get_text_splitter(chunk_size, chunk_overlap).split_text(text):
+        index = text.find(chunk, max(0, index + previous_chunk_len - chunk_overlap))
+        previous_chunk_len = len(chunk)
+        boundaries.append((index, index + len(chunk)))
+    return boundaries
+
+
+class ChunkingService:
+    """Splits documents into chunks, caching chunk boundaries by content hash.
+
+    Small documents are split inline. Larger ones are split in a process pool when
+    called through ``asplit_documents``, so splitting a huge page does not hold up the
+    event loop (and the searches of other sections running on it).
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = 1500,
+        chunk_overlap: int = 200,
+        process_threshold: int = 20_000,
+        max_workers: Optional[int] = None,
+        cache_size: int = 2048,
+    ):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.process_threshold = process_threshold
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.cache_size = cache_size
+        self._boundaries: "OrderedDict[str, List[Tuple[int, int]]]" = OrderedDict()
+        self._executor: Optional[concurrent.futures.Executor] = None
+        self._lock = threading.Lock()
+
+    def _get_cached(self, key: str) -> Optional[List[Tuple[int, int]]]:
+        with self._lock:
+            boundaries = self._boundaries.get(key)
+            if boundaries is not None:
+                self._boundaries.move_to_end(key)
+            return boundaries
+
+    def _put_cached(self, key: str, boundaries: List[Tuple[int, int]]):
+        with self._lock:
+            self._boundaries[key] = boundaries
+            while len(self._boundaries) > self.cache_size:
+                self._boundaries.popitem(last=False)
+
+    def _split(self, text: str) -> List[Tuple[int, int]]:
+        return chunk_boundaries(text, self.chunk_size, self.chunk_overlap)
+
+    def _get_executor(self) -> concurrent.futures.Executor:
+        if self._executor is None:
+            try:
+                self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers)
+            except (OSError, NotImplementedError) as e:
+                # e.g. sandboxes without multiprocessing support
+                logger.warning("Process pool unavailable for chunking, using threads: %s", e)
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    async def _split_large(self, text: str) -> List[Tuple[int, int]]:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                self._get_executor(), chunk_boundaries, text, self.chunk_size, self.chunk_overlap
+            )
+        except concurrent.futures.BrokenExecutor:
+            # a worker died; start over with a new pool next time
+            self._executor = None
+            return await asyncio.to_thread(self._split, text)
+
+    def _to_chunks(self, document: Document, boundaries: List[Tuple[int, int]]) -> List[Document]:
+        text = document.page_content
+        return [
+            Document(page_content=text[start:end], metadata={**document.metadata, "start_index": start})
+            for start, end in boundaries
+        ]
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        """Split documents into chunks with ``start_index`` metadata, on the calling thread."""
+        chunks = []
+        for document in documents:
+            key = content_hash(document.page_content)
+            boundaries = self._get_cached(key)
+            if boundaries is None:
+                boundaries = self._split(document.page_content)
+                self._put_cached(key, boundaries)
+            chunks.extend(self._to_chunks(document, boundaries))
+        return chunks
+
+    async def asplit_documents(self, documents: List[Document]) -> List[Document]:
+        """Split documents into chunks with ``start_index`` metadata.
+
+        Large documents are split concurrently in the process pool; chunk order
+        follows the order of ``documents``.
+        """
+        keys = [content_hash(document.page_content) for document in documents]
+        boundaries_by_key = {}
+        large_texts = {}
+        for key, document in zip(keys, documents):
+            if key in boundaries_by_key or key in large_texts:
+                continue
+            boundaries = self._get_cached(key)
+            if boundaries is not None:
+                boundaries_by_key[key] = boundaries
+            elif len(document.page_content) >= self.process_threshold:
+                large_texts[key] = document.page_content
+            else:
+                boundaries_by_key[key] = self._split(document.page_content)
+                self._put_cached(key, boundaries_by_key[key])
+
+        if large_texts:
+            results = await asyncio.gather(*(self._split_large(text) for text in large_texts.values()))
+            for key, boundaries in zip(large_texts, results):
+                boundaries_by_key[key] = boundaries
+                self._put_cached(key, boundaries)
+
+        return [
+            chunk
+            for key, document in zip(keys, documents)
+            for chunk in self._to_chunks(document, boundaries_by_key[key])
+        ]
+
+    def shutdown(self):
+        """Shut down the worker pool, if one was started."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_CHUNKING_SERVICES: Dict[tuple, ChunkingService] = {}
+
+
+def get_chunking_service(chunk_size: int = 1500, chunk_overlap: int = 200) -> ChunkingService:
+    """Get the process-wide chunking service for a chunk configuration."""
+    key = (chunk_size, chunk_overlap)
+    if key not in _CHUNKING_SERVICES:
+        _CHUNKING_SERVICES[key] = ChunkingService(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return _CHUNKING_SERVICES[key]
+
+
+@dataclass
+class RerankResult:
+    """Result of ranking chunks against several queries."""
+    per_query: Dict[str, List[Document]] # Selected chunks per query, most similar first
+    merged: List[Document] # Chunks selected for any query, ordered by their best score
+    scores: List[float] = field(default_factory=list) # Best score of each merged chunk
+
+
+def select_top_chunks(
+    documents: List[Document],
+    queries: List[str],
+    scores: np.ndarray,
+    k: int,
+    urls_by_query: Optional[List[Optional[set[str]]]] = None,
+    max_total: Optional[int] = None,
+    min_score: float = -np.inf,
+) -> RerankResult:
+    """Select the top-k chunks per query from a (queries x chunks) score matrix.
+
+    Args:
+        documents: Chunks, one per score column
+        queries: Query texts, one per score row
+        scores: Score matrix, higher is more relevant
+        k: Number of chunks to select per query
+        urls_by_query: Per query, only consider chunks from these URLs (None for all chunks)
+        max_total: Maximum number of chunks in the merged ranking, or None for no limit
+        min_score: Chunks must score above this value to be selected
+
+    Returns:
+        RerankResult: Per-query and merged rankings
+    """
+    if not documents or not queries or k <= 0:
+        return RerankResult(per_query={query: [] for query in queries}, merged=[])
+
+    scores = np.array(scores, dtype=np.float32)
+    scores[scores <= min_score] = -np.inf
+    if urls_by_query is not None:
+        doc_urls = [doc.metadata.get("url") for doc in documents]
+        for row, urls in enumerate(urls_by_query):
+            if urls is not None:
+                mask = np.fromiter((url in urls for url in doc_urls), dtype=bool, count=len(doc_urls))
+                scores[row, ~mask] = -np.inf
+
+    # top-k per query without sorting every row
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+    per_query: Dict[str, List[Document]] = {}
+    best_scores: Dict[int, float] = {}
+    for query, rows, row_scores in zip(queries, top, top_scores):
+        selected = np.isfinite(row_scores)
+        per_query[query] = [documents[i] for i in rows[selected]]
+        for i, score in zip(rows[selected].tolist(), row_scores[selected].tolist()):
+            best_scores[i] = max(best_scores.get(i, -np.inf), score)
+
+    merged = sorted(best_scores, key=best_scores.get, reverse=True)[:max_total]
+    return RerankResult(
+        per_query=per_query,
+        merged=[documents[i] for i in merged],
+        scores=[best_scores[i] for i in merged],
+    )
+
+
+class ChunkIndex:
+    """Vector index over document chunks, reused by every search of a run.
+
+    Chunks are keyed by URL and content hash: adding a chunk that is already in
+    the index is a no-op, so repeated search results are neither embedded nor
+    stored twice. Each indexed chunk gets its hash in ``metadata["chunk_hash"]``.
+
+    Args:
+        embeddings: Embeddings used for chunks and queries
+    """
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+        self.documents: List[Document] = []
+        self._keys: Dict[tuple, int] = {}
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Normalized chunk vectors, one row per entry in ``documents``."""
+        return self._vectors[:len(self.documents)]
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        if isinstance(self.embeddings, CachedEmbeddings):
+            return self.embeddings.embed_documents_array(texts)
+        return np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+
+    async def _aembed(self, texts: List[str]) -> np.ndarray:
+        if isinstance(self.embeddings, CachedEmbeddings):
+            return await self.embeddings.aembed_documents_array(texts)
+        return np.asarray(await self.embeddings.aembed_documents(texts), dtype=np.float32)
+
+    def _append(self, documents: List[Document], vectors: np.ndarray):
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        size = len(self.documents)
+        needed = size + len(documents)
+        if self._vectors.shape[0] < needed or self._vectors.shape[1] != vectors.shape[1]:
+            # grow geometrically so repeated additions stay cheap
+            grown = np.zeros((max(needed, 2 * self._vectors.shape[0]), vectors.shape[1]), dtype=np.float32)
+            if size:
+                grown[:size] = self._vectors[:size]
+            self._vectors = grown
+        self._vectors[size:needed] = vectors
+        self.documents.extend(documents)
+
+    @staticmethod
+    def _key(doc: Document) -> tuple:
+        return (doc.metadata.get("url"), doc.metadata["chunk_hash"])
+
+    def _new_documents(self, documents: List[Document]) -> List[Document]:
+        new_documents = {}
+        for doc in documents:
+            doc.metadata["chunk_hash"] = doc.metadata.get("chunk_hash") or content_hash(doc.page_content)
+            key = self._key(doc)
+            if key not in self._keys and key not in new_documents:
+                new_documents[key] = doc
+        return list(new_documents.values())
+
+    def _register(self, documents: List[Document], vectors: np.ndarray):
+        for row, doc in enumerate(documents, len(self.documents)):
+            self._keys[self._key(doc)] = row
+        self._append(documents, vectors)
+
+    def add_documents(self, documents: List[Document]) -> int:
+        """Add chunks to the index, returning the number of chunks that were new."""
+        new_documents = self._new_documents(documents)
+        if new_documents:
+            self._register(new_documents, self._embed([doc.page_content for doc in new_documents]))
+        return len(new_documents)
+
+    async def aadd_documents(self, documents: List[Document]) -> int:
+        """Add chunks to the index, embedding them without blocking the event loop.
+
+        Returns the number of chunks that were new. Chunks added by another task
+        while these were embedded are not added twice.
+        """
+        new_documents = self._new_documents(documents)
+        if not new_documents:
+            return 0
+        vectors = await self._aembed([doc.page_content for doc in new_documents])
+        keep = [i for i, doc in enumerate(new_documents) if self._key(doc) not in self._keys]
+        if keep:
+            self._register([new_documents[i] for i in keep], vectors[keep])
+        return len(keep)
+
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        if isinstance(self.embeddings, CachedEmbeddings):
+            return self.embeddings.embed_queries_array(queries)
+        if len(queries) == 1:
+            return np.asarray([self.embeddings.embed_query(queries[0])], dtype=np.float32)
+        return np.asarray(self.embeddings.embed_documents(queries), dtype=np.float32)
+
+    async def _aembed_queries(self, queries: List[str]) -> np.ndarray:
+        if isinstance(self.embeddings, CachedEmbeddings):
+            return await self.embeddings.aembed_queries_array(queries)
+        if len(queries) == 1:
+            return np.asarray([await self.embeddings.aembed_query(queries[0])], dtype=np.float32)
+        return np.asarray(await self.embeddings.aembed_documents(queries), dtype=np.float32)
+
+    def rerank(
+        self,
+        queries: List[str],
+        k: int = 5,
+        urls_by_query: Optional[List[Optional[set[str]]]] = None,
+        max_total: Optional[int] = None,
+    ) -> RerankResult:
+        """Rank the indexed chunks against several queries at once.
+
+        All queries are embedded in one batch and scored against every chunk with a
+        single (queries x chunks) matrix product, followed by a top-k selection per
+        query. The merged ranking holds every chunk selected for at least one query,
+        ordered by its best score.
+
+        Args:
+            queries: Query texts
+            k: Number of chunks to select per query
+            urls_by_query: Per query, only consider chunks from these URLs (None for all chunks)
+            max_total: Maximum number of chunks in the merged ranking, or None for no limit
+
+        Returns:
+            RerankResult: Per-query and merged rankings
+        """
+        if not self.documents or not queries or k <= 0:
+            return RerankResult(per_query={query: [] for query in queries}, merged=[])
+
+        query_vectors = _normalize(self._embed_queries(queries))
+        scores = query_vectors @ self.vectors.T
+        return select_top_chunks(self.documents, queries, scores, k, urls_by_query=urls_by_query, max_total=max_total)
+
+    async def arerank(
+        self,
+        queries: List[str],
+        k: int = 5,
+        urls_by_query: Optional[List[Optional[set[str]]]] = None,
+        max_total: Optional[int] = None,
+    ) -> RerankResult:
+        """Rank the indexed chunks against several queries at once, embedding them without blocking the event loop (see rerank)."""
+        if not self.documents or not queries or k <= 0:
+            return RerankResult(per_query={query: [] for query in queries}, merged=[])
+
+        query_vectors = _normalize(await self._aembed_queries(queries))
+        # chunks added by other tasks meanwhile are scored too
+        scores = query_vectors @ self.vectors.T
+        return select_top_chunks(self.documents, queries, scores, k, urls_by_query=urls_by_query, max_total=max_total)
+
+    def similarity_search(self, query: str, k: int = 5, urls: Optional[set[str]] = None) -> List[Document]:
+        """Return the k chunks most similar to the query.
+
+        Args:
+            query: Query text
+            k: Number of chunks to return
+            urls: Only consider chunks from these URLs, or all chunks if None
+
+        Returns:
+            List[Document]: Matching chunks, most similar first
+        """
+        return self.rerank([query], k=k, urls_by_query=[urls]).per_query[query]
+
+
+# Keep the indexes of the most recent runs only
+MAX_RUN_INDEXES = 8
+_RUN_INDEXES: "OrderedDict[tuple, ChunkIndex]" = OrderedDict()
+
+
+def get_run_index(config: Optional[RunnableConfig], embeddings: Embeddings) -> ChunkIndex:
+    """Get the chunk index shared by all searches of the current run (graph thread).
+
+    Calls without a thread id get a fresh index.
+    """
+    thread_id = ((config or {}).get("configurable") or {}).get("thread_id")
+    if thread_id is None:
+        return ChunkIndex(embeddings)
+    key = (thread_id, id(embeddings))
+    if key in _RUN_INDEXES:
+        _RUN_INDEXES.move_to_end(key)
+    else:
+        _RUN_INDEXES[key] = ChunkIndex(embeddings)
+        while len(_RUN_INDEXES) > MAX_RUN_INDEXES:
+            _RUN_INDEXES.popitem(last=False)
+    return _RUN_INDEXES[key]
+
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how in is it its of on or that the this to was were what when "
+    "where which who why will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords, used for lexical ranking."""
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in _STOPWORDS]
+
+
+class LexicalIndex:
+    """BM25 or TF-IDF ranking of chunks, computed locally without any model calls.
+
+    Term counts are collected once per chunk; scoring several queries builds a
+    (chunks x query terms) matrix and scores all queries with one matrix product.
+
+    Args:
+        documents: Chunks to rank
+        method: "bm25" or "tfidf"
+        k1: BM25 term frequency saturation
+        b: BM25 length normalization
+    """
+
+    def __init__(self, documents: List[Document], method: Literal["bm25", "tfidf"] = "bm25", k1: float = 1.5, b: float = 0.75):
+        if method not in ("bm25", "tfidf"):
+            raise ValueError(f"Invalid lexical ranking method: {method}")
+        self.documents = documents
+        self.method = method
+        self.k1 = k1
+        self.b = b
+        self._counts = [Counter(tokenize(doc.page_content)) for doc in documents]
+        self._lengths = np.array([sum(counts.values()) for counts in self._counts], dtype=np.float32)
+        self._document_frequency = Counter(term for counts in self._counts for term in counts)
+        self._norms = None
+        if method == "tfidf":
+            # cosine normalization over each chunk's full term vector
+            self._norms = np.array([
+                math.sqrt(sum(((1 + math.log(tf)) * self._idf(term)) ** 2 for term, tf in counts.items())) or 1.0
+                for counts in self._counts
+            ], dtype=np.float32)
+
+    def _idf(self, term: str) -> float:
+        n = len(self.documents)
+        df = self._document_frequency.get(term, 0)
+        if self.method == "bm25":
+            return math.log(1 + (n - df + 0.5) / (df + 0.5))
+        return math.log((1 + n) / (1 + df)) + 1
+
+    def score(self, queries: List[str]) -> np.ndarray:
+        """Score every chunk against every query.
+
+        Returns:
+            np.ndarray: (queries x chunks) score matrix
+        """
+        query_terms = [Counter(tokenize(query)) for query in queries]
+        terms = sorted({term for counts in query_terms for term in counts})
+        if not terms or not self.documents:
+            return np.zeros((len(queries), len(self.documents)), dtype=np.float32)
+
+        tf = np.array([[counts.get(term, 0) for term in terms] for counts in self._counts], dtype=np.float32)
+        idf = np.array([self._idf(term) for term in terms], dtype=np.float32)
+        if self.method == "bm25":
+            avg_length = self._lengths.mean() or 1.0
+            length_norm = self.k1 * (1 - self.b + self.b * self._lengths / avg_length)
+            weights = tf * (self.k1 + 1) / (tf + length_norm[:, None]) * idf
+        else:
+            sublinear_tf = np.where(tf > 0, 1 + np.log(np.maximum(tf, 1)), 0)
+            weights = sublinear_tf * idf / self._norms[:, None]
+
+        query_matrix = np.array([[counts.get(term, 0) for term in terms] for counts in query_terms], dtype=np.float32)
+        return query_matrix @ weights.T
+
+    def rerank(
+        self,
+        queries: List[str],
+        k: int = 5,
+        urls_by_query: Optional[List[Optional[set[str]]]] = None,
+        max_total: Optional[int] = None,
+    ) -> RerankResult:
+        """Rank the chunks against several queries, keeping only chunks that share terms with a query."""
+        return select_top_chunks(
+            self.documents, queries, self.score(queries), k,
+            urls_by_query=urls_by_query, max_total=max_total, min_score=0.0,
+        )
+
+
+# A sentence ends at ., ! or ? followed by whitespace, or at a line break
+_SENTENCE_PATTERN = re.compile(r"\S.*?(?:[.!?](?=\s)|(?=\n)|$)")
+
+
+def split_sentences(text: str) -> List[Tuple[int, int]]:
+    """Split text into sentences and return their ``(start, end)`` offsets."""
+    return [match.span() for match in _SENTENCE_PATTERN.finditer(text)]
+
+
+def extractive_compress(
+    text: str,
+    queries: List[str],
+    max_chars: int,
+    position_weight: float = 0.2,
+    redundancy_weight: float = 0.5,
+    separator: str = "\n...\n",
+) -> str:
+    """Keep the sentences of a page that are most relevant to the queries.
+
+    Sentences are scored by the IDF-weighted share of query terms they contain, plus
+    a bonus for appearing early in the page. They are picked greedily, penalizing
+    sentences whose terms overlap with those already picked (maximal marginal
+    relevance), until ``max_chars`` is filled. Picked sentences are returned in page
+    order; runs of consecutive sentences are kept as continuous spans of the page.
+
+    Args:
+        text: Page content
+        queries: Search queries and any other text describing what is relevant
+        max_chars: Character budget of the result
+        position_weight: Weight of the bonus for early sentences
+        redundancy_weight: Weight of the penalty for overlap with picked sentences
+        separator: Inserted between non-consecutive spans
+
+    Returns:
+        str: The text itself if it fits the budget, otherwise the extracted spans
+    """
+    if len(text) <= max_chars:
+        return text
+    spans = split_sentences(text)
+    if not spans:
+        return text[:max_chars]
+
+    sentence_terms = [set(tokenize(text[start:end])) for start, end in spans]
+    n = len(spans)
+    document_frequency = Counter(term for terms in sentence_terms for term in terms)
+    query_terms = {term for query in queries for term in tokenize(query)}
+    idf = {term: math.log(1 + n / (1 + document_frequency.get(term, 0))) for term in query_terms}
+    total_idf = sum(idf.values()) or 1.0
+
+    relevance = [
+        sum(idf[term] for term in terms & query_terms) / total_idf + position_weight * (1 - i / n)
+        for i, terms in enumerate(sentence_terms)
+    ]
+
+    lengths = [end - start + len(separator) for start, end in spans]
+    redundancy = [0.0] * n
+    selected: List[int] = []
+    used_chars = 0
+    candidates = set(range(n))
+    while candidates:
+        best = max(candidates, key=lambda i: relevance[i] - redundancy_weight * redundancy[i])
+        candidates.discard(best)
+        if used_chars + lengths[best] > max_chars:
+            # shorter sentences may still fit
+            continue
+        selected.append(best)
+        used_chars += lengths[best]
+        candidates = {i for i in candidates if used_chars + lengths[i] <= max_chars}
+        for i in candidates:
+            union = len(sentence_terms[i] | sentence_terms[best])
+            if union:
+                overlap = len(sentence_terms[i] & sentence_terms[best]) / union
+                redundancy[i] = max(redundancy[i], overlap)
+
+    if not selected:
+        return text[:max_chars]
+
+    # consecutive sentences are kept as one span, including the text between them
+    excerpts = []
+    run_start = run_end = None
+    for i in sorted(selected):
+        if run_end is not None and i == run_end + 1:
+            run_end = i
+            continue
+        if run_start is not None:
+            excerpts.append(text[spans[run_start][0]:spans[run_end][1]])
+        run_start = run_end = i
+    excerpts.append(text[spans[run_start][0]:spans[run_end][1]])
+    return separator.join(excerpts)
@@ -0,0 +1,336 @@
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+
+from langchain_core.callbacks import (
+    AsyncCallbackManager,
+    AsyncCallbackManagerForLLMRun,
+    CallbackManager,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable
+
+from open_deep_research.rate_limiting import get_retry_after, is_rate_limit_error, is_timeout_error
+
+logger = logging.getLogger(__name__)
+
+# Server errors worth retrying on another deployment
+FAILOVER_STATUS_CODES = (500, 502, 503, 504, 529)
+
+# Weight of the latest call in the moving averages of latency and error rate
+ROUTER_EWMA_ALPHA = 0.3
+
+# Cool-down of a failing deployment, doubled per consecutive failure up to the maximum
+ROUTER_BASE_COOLDOWN = 5.0
+ROUTER_MAX_COOLDOWN = 120.0
+
+
+def is_failover_error(error: BaseException) -> bool:
+    """Check whether an error should move a call to another deployment (429, 5xx, timeouts, connection errors)."""
+    if is_rate_limit_error(error) or is_timeout_error(error):
+        return True
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if status_code in FAILOVER_STATUS_CODES:
+        return True
+    return "connection" in type(error).__name__.lower()
+
+
+class DeploymentHealth:
+    """Live latency, error rate and cool-down of one deployment, shared by every router using it."""
+
+    def __init__(self):
+        self.latency: Optional[float] = None # moving average of successful call latency, seconds
+        self.error_rate = 0.0 # moving average of failover errors
+        self.cooldown_until = 0.0
+        self.consecutive_failures = 0
+        self.calls = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def available(self, now: float) -> bool:
+        return self.cooldown_until <= now
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self.calls += 1
+            self.consecutive_failures = 0
+            self.latency = latency if self.latency is None else (1 - ROUTER_EWMA_ALPHA) * self.latency + ROUTER_EWMA_ALPHA * latency
+            self.error_rate = (1 - ROUTER_EWMA_ALPHA) * self.error_rate
+
+    def record_failure(self, retry_after: Optional[float] = None):
+        with self._lock:
+            self.calls += 1
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.error_rate = (1 - ROUTER_EWMA_ALPHA) * self.error_rate + ROUTER_EWMA_ALPHA
+            cooldown = retry_after or min(ROUTER_MAX_COOLDOWN, ROUTER_BASE_COOLDOWN * 2 ** (self.consecutive_failures - 1))
+            self.cooldown_until = max(self.cooldown_until, time.monotonic() + cooldown)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "latency": self.latency,
+            "error_rate": self.error_rate,
+            "cooldown": max(0.0, self.cooldown_until - time.monotonic()),
+        }
+
+
+_DEPLOYMENT_HEALTH: Dict[str, DeploymentHealth] = {}
+_DEPLOYMENT_HEALTH_LOCK = threading.Lock()
+
+
+def get_deployment_health(name: str) -> DeploymentHealth:
+    """Get the process-wide health record of a deployment."""
+    with _DEPLOYMENT_HEALTH_LOCK:
+        if name not in _DEPLOYMENT_HEALTH:
+            _DEPLOYMENT_HEALTH[name] = DeploymentHealth()
+        return _DEPLOYMENT_HEALTH[name]
+
+
+def get_router_metrics() -> Dict[str, Dict[str, Any]]:
+    """Get the health metrics of every routed deployment, by deployment name."""
+    return {name: health.metrics() for name, health in _DEPLOYMENT_HEALTH.items()}
+
+
+@dataclass
+class RouteDeployment:
+    """One deployment of a route.
+
+    Args:
+        name: Unique name of the deployment, e.g. "azure_openai:gpt-4o-ptu@eastus"
+        model: Chat model (or model with bound tools) of the deployment
+        weight: Share of the traffic among healthy deployments of the same priority
+        priority: Lower priorities are used first, higher ones take the spill-over
+        health: Shared live health record of the deployment
+        cache_breakpoints: Whether the deployment takes Anthropic ``cache_control``
+            breakpoints in content blocks; they are removed from the messages sent to
+            the other deployments
+    """
+    name: str
+    model: Any
+    weight: float = 1.0
+    priority: int = 0
+    health: Optional[DeploymentHealth] = None
+    cache_breakpoints: bool = False
+
+    def __post_init__(self):
+        if self.health is None:
+            self.health = get_deployment_health(self.name)
+
+
+def _child_config(run_manager: Any) -> Optional[Dict[str, Any]]:
+    """Config of a deployment call, nested under the run of the router call.
+
+    LLM run managers have no get_child, so the child manager is built the way chain
+    run managers build theirs, from the inheritable handlers, tags and metadata.
+    """
+    if run_manager is None:
+        return None
+    manager_class = AsyncCallbackManager if isinstance(run_manager, AsyncCallbackManagerForLLMRun) else CallbackManager
+    manager = manager_class(handlers=[], parent_run_id=run_manager.run_id)
+    manager.set_handlers(run_manager.inheritable_handlers)
+    manager.add_tags(run_manager.inheritable_tags)
+    manager.add_metadata(run_manager.inheritable_metadata)
+    return {"callbacks": manager}
+
+
+def strip_cache_breakpoints(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """Copy the messages with cache_control breakpoints without them, for providers that reject them."""
+    stripped = []
+    for message in messages:
+        if isinstance(message.content, list) and any(isinstance(block, dict) and "cache_control" in block for block in message.content):
+            content = [
+                {key: value for key, value in block.items() if key != "cache_control"} if isinstance(block, dict) else block
+                for block in message.content
+            ]
+            message = message.model_copy(update={"content": content})
+        stripped.append(message)
+    return stripped
+
+
+class RouterChatModel(BaseChatModel):
+    """Chat model that spreads calls over several deployments and fails over between them.
+
+    Each call goes to a deployment of the lowest priority that is not cooling down,
+    picked at random in proportion to its weight, its success rate and how its
+    latency compares to the fastest candidate. A 429, 5xx, timeout or connection
+    error puts the deployment into a cool-down (Retry-After or exponential) and moves
+    the call to the next deployment; other errors are raised. A streamed call fails
+    over only before its first chunk. When every deployment is cooling down, the one
+    that recovers first is tried.
+
+    The deployments keep their own callbacks, so the rate limiting and usage
+    accounting of get_chat_model apply per deployment. bind_tools binds the tools on
+    every deployment, and with_structured_output binds its schema through bind_tools.
+    Prompt cache breakpoints (see cacheable_prompt) only reach the deployments that
+    take them.
+    """
+
+    route: str
+    deployments: List[RouteDeployment]
+
+    @property
+    def _llm_type(self) -> str:
+        return "router"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"route": self.route, "deployments": [deployment.name for deployment in self.deployments]}
+
+    def _select(self, tried: Sequence[RouteDeployment]) -> RouteDeployment:
+        candidates = [deployment for deployment in self.deployments if deployment not in tried]
+        now = time.monotonic()
+        available = [deployment for deployment in candidates if deployment.health.available(now)]
+        if not available:
+            return min(candidates, key=lambda deployment: deployment.health.cooldown_until)
+        priority = min(deployment.priority for deployment in available)
+        available = [deployment for deployment in available if deployment.priority == priority]
+        fastest = min((deployment.health.latency for deployment in available if deployment.health.latency), default=None)
+        scores = []
+        for deployment in available:
+            score = deployment.weight * (1.0 - deployment.health.error_rate)
+            if fastest and deployment.health.latency:
+                score *= fastest / deployment.health.latency
+            scores.append(max(score, 1e-6))
+        return random.choices(available, weights=scores)[0]
+
+    def _messages(self, deployment: RouteDeployment, messages: List[BaseMessage]) -> List[BaseMessage]:
+        return messages if deployment.cache_breakpoints else strip_cache_breakpoints(messages)
+
+    def _failover(self, deployment: RouteDeployment, error: Exception, attempts: int) -> bool:
+        """Record a failed call and tell whether another deployment should be tried."""
+        if not is_failover_error(error):
+            return False
+        deployment.health.record_failure(get_retry_after(error))
+        if attempts < len(self.deployments):
+            logger.warning("Deployment %s of route %s failed (%s), failing over", deployment.name, self.route, type(error).__name__)
+            return True
+        return False
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        config = _child_config(run_manager)
+        tried: List[RouteDeployment] = []
+        while True:
+            deployment = self._select(tried)
+            tried.append(deployment)
+            start = time.monotonic()
+            try:
+                message = deployment.model.invoke(self._messages(deployment, messages), config, stop=stop, **kwargs)
+            except Exception as e:
+                if self._failover(deployment, e, len(tried)):
+                    continue
+                raise
+            deployment.health.record_success(time.monotonic() - start)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        config = _child_config(run_manager)
+        tried: List[RouteDeployment] = []
+        while True:
+            deployment = self._select(tried)
+            tried.append(deployment)
+            start = time.monotonic()
+            try:
+                message = await deployment.model.ainvoke(self._messages(deployment, messages), config, stop=stop, **kwargs)
+            except Exception as e:
+                if self._failover(deployment, e, len(tried)):
+                    continue
+                raise
+            deployment.health.record_success(time.monotonic() - start)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        config = _child_config(run_manager)
+        tried: List[RouteDeployment] = []
+        while True:
+            deployment = self._select(tried)
+            tried.append(deployment)
+            start = time.monotonic()
+            streamed = False
+            try:
+                for chunk in deployment.model.stream(self._messages(deployment, messages), config, stop=stop, **kwargs):
+                    streamed = True
+                    yield ChatGenerationChunk(message=chunk)
+            except Exception as e:
+                if not streamed and self._failover(deployment, e, len(tried)):
+                    continue
+                raise
+            deployment.health.record_success(time.monotonic() - start)
+            return
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        config = _child_config(run_manager)
+        tried: List[RouteDeployment] = []
+        while True:
+            deployment = self._select(tried)
+            tried.append(deployment)
+            start = time.monotonic()
+            streamed = False
+            try:
+                async for chunk in deployment.model.astream(self._messages(deployment, messages), config, stop=stop, **kwargs):
+                    streamed = True
+                    yield ChatGenerationChunk(message=chunk)
+            except Exception as e:
+                if not streamed and self._failover(deployment, e, len(tried)):
+                    continue
+                raise
+            deployment.health.record_success(time.monotonic() - start)
+            return
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "RouterChatModel":
+        """Bind tools on every deployment, each in its provider's format."""
+        return self.model_copy(update={
+            "deployments": [
+                RouteDeployment(
+                    name=deployment.name,
+                    model=deployment.model.bind_tools(tools, **kwargs),
+                    weight=deployment.weight,
+                    priority=deployment.priority,
+                    health=deployment.health,
+                    cache_breakpoints=deployment.cache_breakpoints,
+                )
+                for deployment in self.deployments
+            ]
+        })
+
+    def with_structured_output(self, schema: Any, *, include_raw: bool = False, **kwargs: Any) -> Runnable:
+        """Parse the output into the schema, bound as a forced tool on every deployment.
+
+        The provider-specific structured output methods of the deployments (e.g. JSON
+        schema mode) are not used, since the calls must go through the router to fail
+        over: the schema is bound with bind_tools, as BaseChatModel does.
+        """
+        return super().with_structured_output(schema, include_raw=include_raw, **kwargs)
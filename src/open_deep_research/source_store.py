@@ -0,0 +1,180 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from open_deep_research.checkpointing import CHECKPOINT_DB_ENV
+
+logger = logging.getLogger(__name__)
+
+# Fields of a processed search result kept in a source record
+SOURCE_RECORD_FIELDS = ("title", "url", "content", "raw_content")
+
+# Records kept in memory per store, the least recently used are dropped beyond it
+MAX_SOURCE_RECORDS = 20_000
+
+
+class MissingSourceError(LookupError):
+    """Refs of the graph state missing from the source store.
+
+    Raised e.g. when a run is resumed in a new process with an in-memory store, or
+    after its records were evicted: set source_store_path (or CHECKPOINT_DB_PATH)
+    to keep the sources of durable checkpoints.
+    """
+
+
+def source_ref(record: Dict[str, Any]) -> str:
+    """Content address of a source record: the SHA-256 of its fields."""
+    payload = json.dumps([record.get(field) for field in SOURCE_RECORD_FIELDS], ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def add_source_refs(left: Optional[List[str]], right: Optional[List[str]]) -> List[str]:
+    """State reducer merging lists of source refs, keeping the first occurrence of each.
+
+    An update of None clears the refs (at the start of a report).
+    """
+    if right is None:
+        return []
+    return list(dict.fromkeys([*(left or []), *right]))
+
+
+class SourceStore:
+    """Content-addressed store of search sources, shared by the nodes of a graph.
+
+    Each processed search result is stored once under the hash of its title, URL,
+    summary and raw content, and the graph state only carries these refs. Records
+    are kept in SQLite (WAL mode) when a path is given, which is needed for refs in
+    durable checkpoints to outlive the process, and the most recently used ones in
+    memory. Without a path, records evicted from memory are lost. The graph threads
+    referring to each stored record are kept in ``thread_sources``: in the database of
+    the checkpointer, records no thread refers to any more are deleted with the
+    threads pruned by prune_checkpoints.
+
+    Args:
+        path: SQLite database file, created if missing (in-memory if None)
+        max_records: Records kept in memory
+    """
+
+    def __init__(self, path: Optional[str] = None, max_records: int = MAX_SOURCE_RECORDS):
+        self.path = path
+        self.max_records = max_records
+        self._lock = threading.Lock()
+        self._records: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._connection: Optional[sqlite3.Connection] = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            with self._lock, self._connection:
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute("CREATE TABLE IF NOT EXISTS sources (ref TEXT PRIMARY KEY, record TEXT)")
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS thread_sources (thread_id TEXT, ref TEXT, PRIMARY KEY (thread_id, ref))"
+                )
+                self._connection.execute("CREATE INDEX IF NOT EXISTS thread_sources_ref ON thread_sources (ref)")
+        self.writes = 0
+        self.duplicates = 0
+        self.evictions = 0
+
+    def _remember(self, ref: str, record: Dict[str, Any]):
+        self._records[ref] = record
+        self._records.move_to_end(ref)
+        while len(self._records) > self.max_records:
+            self._records.popitem(last=False)
+            if self._connection is None and not self.evictions:
+                logger.warning("In-memory source store full, evicting the least recently used sources (set source_store_path to keep them)")
+            self.evictions += 1
+
+    def put_many(self, records: List[Dict[str, Any]], thread_id: Optional[str] = None) -> List[str]:
+        """Store source records, returning their refs in order.
+
+        Args:
+            records: Processed search results
+            thread_id: Graph thread whose state refers to the records, recorded for pruning
+        """
+        refs = []
+        new = {}
+        for result in records:
+            record = {field: result.get(field) for field in SOURCE_RECORD_FIELDS}
+            ref = source_ref(record)
+            refs.append(ref)
+            new.setdefault(ref, record)
+        with self._lock:
+            for ref, record in new.items():
+                if ref in self._records:
+                    self._records.move_to_end(ref)
+                    self.duplicates += 1
+                    continue
+                self._remember(ref, record)
+                self.writes += 1
+            if self._connection is not None:
+                with self._connection:
+                    self._connection.executemany(
+                        "INSERT OR IGNORE INTO sources (ref, record) VALUES (?, ?)",
+                        [(ref, json.dumps(record, ensure_ascii=False)) for ref, record in new.items()],
+                    )
+                    if thread_id is not None:
+                        self._connection.executemany(
+                            "INSERT OR IGNORE INTO thread_sources (thread_id, ref) VALUES (?, ?)",
+                            [(str(thread_id), ref) for ref in new],
+                        )
+        return refs
+
+    def get_many(self, refs: List[str]) -> List[Dict[str, Any]]:
+        """Look up source records by ref, in order.
+
+        Raises:
+            MissingSourceError: If some refs are not in the store
+        """
+        records = []
+        missing = []
+        with self._lock:
+            for ref in refs:
+                record = self._records.get(ref)
+                if record is not None:
+                    self._records.move_to_end(ref)
+                elif self._connection is not None:
+                    row = self._connection.execute("SELECT record FROM sources WHERE ref = ?", (ref,)).fetchone()
+                    if row is not None:
+                        record = json.loads(row[0])
+                        self._remember(ref, record)
+                if record is None:
+                    missing.append(ref)
+                    continue
+                records.append(record)
+        if missing:
+            raise MissingSourceError(
+                f"{len(missing)} of {len(refs)} sources are missing from the "
+                f"{'source store at ' + self.path if self.path else 'in-memory source store'} (first: {missing[0][:12]})"
+            )
+        return records
+
+    def stats(self) -> Dict[str, Any]:
+        """Number of records in memory, written, not stored again as duplicates, and evicted from memory."""
+        return {"records": len(self._records), "writes": self.writes, "duplicates": self.duplicates, "evictions": self.evictions}
+
+
+_SOURCE_STORES: Dict[Optional[str], SourceStore] = {}
+_SOURCE_STORES_LOCK = threading.Lock()
+
+
+def get_source_store(path: Optional[str] = None) -> SourceStore:
+    """Get the process-wide source store stored at a path.
+
+    Without a path, the sources are stored in the database of the durable checkpointer
+    of the bundled graphs (CHECKPOINT_DB_PATH) if set, so that the refs of its
+    checkpoints outlive the process, and in memory otherwise.
+    """
+    path = path or os.environ.get(CHECKPOINT_DB_ENV)
+    if path:
+        path = os.path.abspath(os.path.expanduser(path))
+    with _SOURCE_STORES_LOCK:
+        if path not in _SOURCE_STORES:
+            _SOURCE_STORES[path] = SourceStore(path)
+        return _SOURCE_STORES[path]
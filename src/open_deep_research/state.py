@@ -1,6 +1,21 @@
-from typing import Annotated, List, TypedDict, Literal
+from typing import Annotated, List, Optional, TypedDict, Literal
 from pydantic import BaseModel, Field
-import operator
+
+from open_deep_research.accounting import merge_report_usage
+from open_deep_research.payloads import SectionRecord, SharedText
+from open_deep_research.source_store import add_source_refs
+
+def extend_or_reset(left: Optional[list], right: Optional[list]) -> list:
+    """State reducer appending lists, or clearing the list when updated with None (at the start of a report)."""
+    if right is None:
+        return []
+    return [*(left or []), *right]
+
+def merge_or_reset(left: Optional[dict], right: Optional[dict]) -> dict:
+    """State reducer merging dicts, or clearing the dict when updated with None (at the start of a report on another topic)."""
+    if right is None:
+        return {}
+    return {**(left or {}), **right}
 
 class Section(BaseModel):
     name: str = Field(
@@ -37,37 +52,52 @@ class Feedback(BaseModel):
         description="List of follow-up search queries.",
     )
 
+class GradedFeedback(Feedback):
+    confidence: float = Field(
+        description="Confidence in the grade, from 0 (a guess) to 1 (certain). Use a low confidence for borderline sections.",
+    )
+
 class ReportStateInput(TypedDict):
     topic: str # Report topic
     
 class ReportStateOutput(TypedDict):
     final_report: str # Final report
+    usage: dict # Token, cost and latency accounting of the run
     # for evaluation purposes only
     # this is included only if configurable.include_source_str is True
     source_str: str # String of formatted source content from web search
 
 class ReportState(TypedDict):
     topic: str # Report topic    
-    feedback_on_report_plan: Annotated[list[str], operator.add] # List of feedback on the report plan
+    research_topic: str # Topic of the section research kept in the state, set at the start of each report
+    feedback_on_report_plan: Annotated[list[str], extend_or_reset] # List of feedback on the report plan, cleared at the start of each report
     sections: list[Section] # List of report sections 
-    completed_sections: Annotated[list, operator.add] # Send() API key
-    report_sections_from_research: str # String of any completed sections from research to write final sections
+    completed_sections: Annotated[list, extend_or_reset] # Send() API key, cleared at the start of each report
+    report_sections_from_research: SharedText # Completed sections from research to write final sections, shared by their Send() payloads
+    planning_source_refs: list[str] # Refs of the sources found by the planning searches, reused when the plan is revised after feedback
+    section_research: Annotated[dict, merge_or_reset] # Queries, sources and draft of each completed section by name, reused by the next reports on the same topic
     final_report: str # Final report
+    usage: dict # Token, cost and latency accounting of the run
+    report_usage: Annotated[dict, merge_report_usage] # Id, clock and spend totals of the current report (see track_report), replaced at the start of each report
+    source_refs: Annotated[list[str], add_source_refs] # Refs of the sources found by the section research, in the source store
     # for evaluation purposes only
     # this is included only if configurable.include_source_str is True
-    source_str: Annotated[str, operator.add] # String of formatted source content from web search
+    source_str: str # String of formatted source content from web search, materialized from source_refs
 
 class SectionState(TypedDict):
     topic: str # Report topic
-    section: Section # Report section  
+    section: SectionRecord # Report section  
     search_iterations: int # Number of search iterations done
     search_queries: list[SearchQuery] # List of search queries
-    source_str: str # String of formatted source content from web search
-    report_sections_from_research: str # String of any completed sections from research to write final sections
-    completed_sections: list[Section] # Final key we duplicate in outer state for Send() API
+    search_refs: list[str] # Refs of the sources found by the latest search, the context of the section writer
+    source_refs: Annotated[list[str], add_source_refs] # Refs of the sources found by every search of the section
+    report_sections_from_research: SharedText # Completed sections from research to write final sections
+    completed_sections: list[SectionRecord] # Final key we duplicate in outer state for Send() API
+    section_research: dict # Queries, sources and draft of the completed section
+    report_usage: dict # Id, clock and spend totals of the report (see track_report)
 
 class SectionOutputState(TypedDict):
-    completed_sections: list[Section] # Final key we duplicate in outer state for Send() API
-    # for evaluation purposes only
-    # this is included only if configurable.include_source_str is True
-    source_str: str # String of formatted source content from web search
+    completed_sections: list[SectionRecord] # Final key we duplicate in outer state for Send() API
+    section_research: dict # Queries, sources and draft of the completed section
+    source_refs: list[str] # Refs of the sources found by every search of the section
+    report_usage: dict # Id, clock and spend totals of the report, with the spend of the section
@@ -1,18 +1,21 @@
+import logging
 import os
 import asyncio
 import json
 import datetime
+import re
 import requests
 import random 
 import concurrent
-import hashlib
 import aiohttp
 import httpx
 import time
-from typing import List, Optional, Dict, Any, Union, Literal, Annotated, cast
-from urllib.parse import unquote
-from collections import defaultdict
-import itertools
+import atexit
+import weakref
+from typing import List, Optional, Dict, Any, Union, Literal, Annotated, AsyncIterator, cast
+from urllib.parse import parse_qsl, unquote, urlencode, urlsplit, urlunsplit
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
 
 from exa_py import Exa
 from linkup import LinkupClient
@@ -24,23 +27,43 @@ from bs4 import BeautifulSoup
 from markdownify import markdownify
 from pydantic import BaseModel
 from langchain.chat_models import init_chat_model
-from langchain.embeddings import init_embeddings
+from langchain_core.caches import BaseCache
+from langchain_core.callbacks import BaseCallbackManager
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 from langchain_anthropic import ChatAnthropic
 from langchain_core.language_models import BaseChatModel
-from langchain_core.runnables import RunnableConfig
+from langchain_core.messages import AIMessage, AIMessageChunk, message_chunk_to_message
+from langchain_core.runnables import RunnableBinding, RunnableConfig
 from langchain_core.tools import InjectedToolArg
-from langchain_core.vectorstores import InMemoryVectorStore
 from langchain_community.retrievers import ArxivRetriever
 from langchain_community.utilities.pubmed import PubMedAPIWrapper
 from langchain_core.tools import tool
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_core.utils.json import parse_partial_json
+from langgraph.config import get_stream_writer
 from langsmith import traceable
 
 from open_deep_research.configuration import Configuration
-from open_deep_research.state import Section
-from open_deep_research.prompts import SUMMARIZATION_PROMPT
+from open_deep_research.state import Feedback, GradedFeedback, Section
+from open_deep_research.retrieval import (
+    ChunkIndex,
+    LexicalIndex,
+    RerankResult,
+    content_hash,
+    extractive_compress,
+    get_chunking_service,
+    get_embeddings,
+    get_run_index,
+)
+from open_deep_research.response_cache import get_response_cache, is_deterministic_call
+from open_deep_research.accounting import USAGE_CALLBACK_HANDLER, get_config_usage, track_search
+from open_deep_research.budget import govern_budget
+from open_deep_research.source_store import get_source_store
+from open_deep_research.rate_limiting import RATE_LIMIT_CALLBACK_HANDLER, is_rate_limit_error
+from open_deep_research.router import RouteDeployment, RouterChatModel
+from open_deep_research.prompts import SUMMARIZATION_PROMPT, BATCH_SUMMARIZATION_PROMPT, section_grader_confidence_message
+
+logger = logging.getLogger(__name__)
 
 
 def get_config_value(value):
@@ -1185,25 +1208,17 @@ async def google_search_async(search_queries: Union[str, List[str]], max_results
         if executor:
             executor.shutdown(wait=False)
 
-async def scrape_pages(titles: List[str], urls: List[str]) -> str:
+async def fetch_pages_as_markdown(urls: List[str]) -> List[str]:
     """
-    Scrapes content from a list of URLs and formats it into a readable markdown document.
-    
-    This function:
-    1. Takes a list of page titles and URLs
-    2. Makes asynchronous HTTP requests to each URL
-    3. Converts HTML content to markdown
-    4. Formats all content with clear source attribution
-    
+    Fetches a list of URLs and converts their HTML content to markdown.
+
     Args:
-        titles (List[str]): A list of page titles corresponding to each URL
-        urls (List[str]): A list of URLs to scrape content from
-        
+        urls (List[str]): A list of URLs to fetch
+
     Returns:
-        str: A formatted string containing the full content of each page in markdown format,
-             with clear section dividers and source attribution
+        List[str]: The markdown content of each page, or a short error message for pages
+                   that could not be fetched or converted
     """
-    
     # Create an async HTTP client
     async with httpx.AsyncClient(follow_redirects=True, timeout=30.0) as client:
         pages = []
@@ -1232,27 +1247,50 @@ async def scrape_pages(titles: List[str], urls: List[str]) -> str:
             except Exception as e:
                 # Handle any exceptions during fetch
                 pages.append(f"Error fetching URL: {str(e)}")
+
+    return pages
+
+async def scrape_pages(titles: List[str], urls: List[str]) -> str:
+    """
+    Scrapes content from a list of URLs and formats it into a readable markdown document.
+    
+    This function:
+    1. Takes a list of page titles and URLs
+    2. Makes asynchronous HTTP requests to each URL
+    3. Converts HTML content to markdown
+    4. Formats all content with clear source attribution
+    
+    Args:
+        titles (List[str]): A list of page titles corresponding to each URL
+        urls (List[str]): A list of URLs to scrape content from
         
-        # Create formatted output
-        formatted_output = f"Search results: \n\n"
-        
-        for i, (title, url, page) in enumerate(zip(titles, urls, pages)):
-            formatted_output += f"\n\n--- SOURCE {i+1}: {title} ---\n"
-            formatted_output += f"URL: {url}\n\n"
-            formatted_output += f"FULL CONTENT:\n {page}"
-            formatted_output += "\n\n" + "-" * 80 + "\n"
+    Returns:
+        str: A formatted string containing the full content of each page in markdown format,
+             with clear section dividers and source attribution
+    """
+    pages = await fetch_pages_as_markdown(urls)
+
+    # Create formatted output
+    formatted_output = f"Search results: \n\n"
+    
+    for i, (title, url, page) in enumerate(zip(titles, urls, pages)):
+        formatted_output += f"\n\n--- SOURCE {i+1}: {title} ---\n"
+        formatted_output += f"URL: {url}\n\n"
+        formatted_output += f"FULL CONTENT:\n {page}"
+        formatted_output += "\n\n" + "-" * 80 + "\n"
         
     return formatted_output
 
-@tool
-async def duckduckgo_search(search_queries: List[str]):
-    """Perform searches using DuckDuckGo with retry logic to handle rate limits
+@traceable
+async def duckduckgo_search_async(search_queries: List[str]) -> List[dict]:
+    """Perform searches using DuckDuckGo with retry logic to handle rate limits,
+    and fetch the full content of every result as markdown.
     
     Args:
         search_queries (List[str]): List of search queries to process
         
     Returns:
-        str: A formatted string of search results
+        List[dict]: List of search responses, one per query, with the fetched page in each result's raw_content
     """
     
     async def process_single_query(query):
@@ -1330,8 +1368,6 @@ async def duckduckgo_search(search_queries: List[str]):
 
     # Process queries with delay between them to reduce rate limiting
     search_docs = []
-    urls = []
-    titles = []
     for i, query in enumerate(search_queries):
         # Add delay between queries (except first one)
         if i > 0:
@@ -1341,19 +1377,32 @@ async def duckduckgo_search(search_queries: List[str]):
         # Process the query
         result = await process_single_query(query)
         search_docs.append(result)
-        
-        # Safely extract URLs and titles from results, handling empty result cases
-        if result['results'] and len(result['results']) > 0:
-            for res in result['results']:
-                if 'url' in res and 'title' in res:
-                    urls.append(res['url'])
-                    titles.append(res['title'])
+
+    # Scrape the full pages of all results
+    results = [res for doc in search_docs for res in doc['results'] if res.get('url')]
+    pages = await fetch_pages_as_markdown([res['url'] for res in results])
+    for res, page in zip(results, pages):
+        res['raw_content'] = page
+
+    return search_docs
+
+@tool
+async def duckduckgo_search(
+    search_queries: List[str],
+    focus: Annotated[Optional[str], InjectedToolArg] = None,
+    config: RunnableConfig = None
+):
+    """Perform searches using DuckDuckGo with retry logic to handle rate limits
     
-    # If we got any valid URLs, scrape the pages
-    if urls:
-        return await scrape_pages(titles, urls)
-    else:
-        return "No valid search results found. Please try different search queries or use a different search API."
+    Args:
+        search_queries (List[str]): List of search queries to process
+        focus (Optional[str]): What the searches are for, used by extractive compression
+        
+    Returns:
+        str: A formatted string of search results
+    """
+    results = await search_and_process("duckduckgo", search_queries, {}, config=config, focus=focus)
+    return format_search_results(results)
 
 TAVILY_SEARCH_DESCRIPTION = (
     "A search engine optimized for comprehensive, accurate, and trusted results. "
@@ -1365,6 +1414,7 @@ async def tavily_search(
     queries: List[str],
     max_results: Annotated[int, InjectedToolArg] = 5,
     topic: Annotated[Literal["general", "news", "finance"], InjectedToolArg] = "general",
+    focus: Annotated[Optional[str], InjectedToolArg] = None,
     config: RunnableConfig = None
 ) -> str:
     """
@@ -1374,94 +1424,18 @@ async def tavily_search(
         queries (List[str]): List of search queries
         max_results (int): Maximum number of results to return
         topic (Literal['general', 'news', 'finance']): Topic to filter results by
+        focus (Optional[str]): What the searches are for, used by extractive compression
 
     Returns:
         str: A formatted string of search results
     """
-    # Use tavily_search_async with include_raw_content=True to get content directly
-    search_results = await tavily_search_async(
-        queries,
-        max_results=max_results,
-        topic=topic,
-        include_raw_content=True
-    )
-
-    # Format the search results directly using the raw_content already provided
-    formatted_output = f"Search results: \n\n"
-    
-    # Deduplicate results by URL
-    unique_results = {}
-    for response in search_results:
-        for result in response['results']:
-            url = result['url']
-            if url not in unique_results:
-                unique_results[url] = {**result, "query": response['query']}
-
-    async def noop():
-        return None
-
-    configurable = Configuration.from_runnable_config(config)
-    max_char_to_include = 30_000
-    # TODO: share this behavior across all search implementations / tools
-    if configurable.process_search_results == "summarize":
-        if configurable.summarization_model_provider == "anthropic":
-            extra_kwargs = {"betas": ["extended-cache-ttl-2025-04-11"]}
-        else:
-            extra_kwargs = {}
-
-        azure_config = {
-            "azure_openai_endpoint": getattr(configurable, 'azure_openai_endpoint', None),
-            "azure_openai_api_key": getattr(configurable, 'azure_openai_api_key', None),
-            "azure_openai_api_version": getattr(configurable, 'azure_openai_api_version', None),
-        }
-
-        summarization_model = get_chat_model(
-            model=configurable.summarization_model,
-            model_provider=configurable.summarization_model_provider,
-            azure_config=azure_config,
-            max_retries=configurable.max_structured_output_retries,
-            **extra_kwargs
-        )
-        summarization_tasks = [
-            noop() if not result.get("raw_content") else summarize_webpage(summarization_model, result['raw_content'][:max_char_to_include])
-            for result in unique_results.values()
-        ]
-        summaries = await asyncio.gather(*summarization_tasks)
-        unique_results = {
-            url: {'title': result['title'], 'content': result['content'] if summary is None else summary}
-            for url, result, summary in zip(unique_results.keys(), unique_results.values(), summaries)
-        }
-    elif configurable.process_search_results == "split_and_rerank":
-        embeddings = init_embeddings("openai:text-embedding-3-small")
-        results_by_query = itertools.groupby(unique_results.values(), key=lambda x: x['query'])
-        all_retrieved_docs = []
-        for query, query_results in results_by_query:
-            retrieved_docs = split_and_rerank_search_results(embeddings, query, query_results)
-            all_retrieved_docs.extend(retrieved_docs)
-
-        stitched_docs = stitch_documents_by_url(all_retrieved_docs)
-        unique_results = {
-            doc.metadata['url']: {'title': doc.metadata['title'], 'content': doc.page_content}
-            for doc in stitched_docs
-        }
-
-    # Format the unique results
-    for i, (url, result) in enumerate(unique_results.items()):
-        formatted_output += f"\n\n--- SOURCE {i+1}: {result['title']} ---\n"
-        formatted_output += f"URL: {url}\n\n"
-        formatted_output += f"SUMMARY:\n{result['content']}\n\n"
-        if result.get('raw_content'):
-            formatted_output += f"FULL CONTENT:\n{result['raw_content'][:max_char_to_include]}"  # Limit content size
-        formatted_output += "\n\n" + "-" * 80 + "\n"
-    
-    if unique_results:
-        return formatted_output
-    else:
-        return "No valid search results found. Please try different search queries or use a different search API."
+    # Queries are searched concurrently and processed as their results arrive
+    results = await search_and_process("tavily", queries, {"max_results": max_results, "topic": topic}, config=config, focus=focus)
+    return format_search_results(results)
 
 
 @tool
-async def azureaisearch_search(queries: List[str], max_results: int = 5, topic: str = "general") -> str:
+async def azureaisearch_search(queries: List[str], max_results: int = 5, topic: str = "general", config: RunnableConfig = None) -> str:
     """
     Fetches results from Azure AI Search API.
     
@@ -1471,47 +1445,28 @@ async def azureaisearch_search(queries: List[str], max_results: int = 5, topic:
     Returns:
         str: A formatted string of search results
     """
-    # Use azureaisearch_search_async with include_raw_content=True to get content directly
-    search_results = await azureaisearch_search_async(
-        queries,
-        max_results=max_results,
-        topic=topic,
-        include_raw_content=True
-    )
+    results = await search_and_process("azureaisearch", queries, {"max_results": max_results, "topic": topic}, config=config)
+    return format_search_results(results)
 
-    # Format the search results directly using the raw_content already provided
-    formatted_output = f"Search results: \n\n"
-    
-    # Deduplicate results by URL
-    unique_results = {}
-    for response in search_results:
-        for result in response['results']:
-            url = result['url']
-            if url not in unique_results:
-                unique_results[url] = result
-    
-    # Format the unique results
-    for i, (url, result) in enumerate(unique_results.items()):
-        formatted_output += f"\n\n--- SOURCE {i+1}: {result['title']} ---\n"
-        formatted_output += f"URL: {url}\n\n"
-        formatted_output += f"SUMMARY:\n{result['content']}\n\n"
-        if result.get('raw_content'):
-            formatted_output += f"FULL CONTENT:\n{result['raw_content'][:30000]}"  # Limit content size
-        formatted_output += "\n\n" + "-" * 80 + "\n"
-    
-    if unique_results:
-        return formatted_output
-    else:
-        return "No valid search results found. Please try different search queries or use a different search API."
 
-
-async def select_and_execute_search(search_api: str, query_list: list[str], params_to_pass: dict) -> str:
+async def select_and_execute_search(
+    search_api: str,
+    query_list: list[str],
+    params_to_pass: dict,
+    config: Optional[RunnableConfig] = None,
+    focus: Optional[str] = None,
+) -> str:
     """Select and execute the appropriate search API.
+
+    Results of every search API flow through the same post-processing pipeline
+    (see process_search_results_pipeline).
     
     Args:
         search_api: Name of the search API to use
         query_list: List of search queries to execute
         params_to_pass: Parameters to pass to the search API
+        config: Runnable config carrying the search result processing configuration
+        focus: What the searches are for (e.g. the section description)
         
     Returns:
         Formatted string containing search results
@@ -1522,31 +1477,150 @@ async def select_and_execute_search(search_api: str, query_list: list[str], para
     if search_api == "tavily":
         # Tavily search tool used with both workflow and agent 
         # and returns a formatted source string
-        return await tavily_search.ainvoke({'queries': query_list, **params_to_pass})
+        return await tavily_search.ainvoke({'queries': query_list, **params_to_pass, 'focus': focus}, config)
     elif search_api == "duckduckgo":
         # DuckDuckGo search tool used with both workflow and agent 
-        return await duckduckgo_search.ainvoke({'search_queries': query_list})
-    elif search_api == "perplexity":
-        search_results = perplexity_search(query_list, **params_to_pass)
-    elif search_api == "exa":
-        search_results = await exa_search(query_list, **params_to_pass)
-    elif search_api == "arxiv":
-        search_results = await arxiv_search_async(query_list, **params_to_pass)
-    elif search_api == "pubmed":
-        search_results = await pubmed_search_async(query_list, **params_to_pass)
-    elif search_api == "linkup":
-        search_results = await linkup_search(query_list, **params_to_pass)
-    elif search_api == "googlesearch":
-        search_results = await google_search_async(query_list, **params_to_pass)
-    elif search_api == "azureaisearch":
-        search_results = await azureaisearch_search_async(query_list, **params_to_pass)
+        return await duckduckgo_search.ainvoke({'search_queries': query_list, 'focus': focus}, config)
     elif search_api == "none":
         # Return empty string when no search is configured
         return ""
-    else:
+    elif search_api not in SEARCH_BACKENDS:
         raise ValueError(f"Unsupported search API: {search_api}")
 
-    return deduplicate_and_format_sources(search_results, max_tokens_per_source=4000, deduplication_strategy="keep_first")
+    results = await search_and_process(search_api, query_list, params_to_pass, config=config, focus=focus)
+    # Processed results carry their summary / reranked excerpts as content
+    include_raw_content = Configuration.from_runnable_config(config).process_search_results is None
+    return deduplicate_and_format_sources([{"results": results}], max_tokens_per_source=4000, include_raw_content=include_raw_content, deduplication_strategy="keep_first")
+
+
+async def search_source_records(
+    search_api: str,
+    query_list: list[str],
+    params_to_pass: dict,
+    config: Optional[RunnableConfig] = None,
+    focus: Optional[str] = None,
+) -> list[dict]:
+    """Search with the selected search API and return the processed results.
+
+    Like select_and_execute_search, but returns the result records instead of a
+    formatted string, to be kept in the source store (see store_sources).
+
+    Raises:
+        ValueError: If an unsupported search API is specified
+    """
+    if search_api == "none":
+        return []
+    if search_api == "tavily":
+        # Same defaults as the Tavily search tool
+        params_to_pass = {"max_results": 5, "topic": "general", **params_to_pass}
+    elif search_api == "duckduckgo":
+        params_to_pass = {}
+    elif search_api not in SEARCH_BACKENDS:
+        raise ValueError(f"Unsupported search API: {search_api}")
+    return await search_and_process(search_api, query_list, params_to_pass, config=config, focus=focus)
+
+
+def store_sources(results: list[dict], config: Optional[RunnableConfig] = None) -> list[str]:
+    """Keep processed search results in the source store of the run and return their refs."""
+    source_store_path = Configuration.from_runnable_config(config).source_store_path
+    thread_id = ((config or {}).get("configurable") or {}).get("thread_id")
+    return get_source_store(source_store_path).put_many(results, thread_id)
+
+
+def materialize_sources(refs: list[str], config: Optional[RunnableConfig] = None) -> str:
+    """Format the sources behind a list of refs into a source string, deduplicated by URL.
+
+    Returns:
+        str: The formatted sources, empty without sources
+    """
+    configurable = Configuration.from_runnable_config(config)
+    results = get_source_store(configurable.source_store_path).get_many(refs)
+    if not results:
+        return ""
+    # Processed results carry their summary / reranked excerpts as content
+    include_raw_content = configurable.process_search_results is None
+    return deduplicate_and_format_sources([{"results": results}], max_tokens_per_source=4000, include_raw_content=include_raw_content, deduplication_strategy="keep_first")
+
+
+async def search_queries_as_they_arrive(
+    search_api: str,
+    queries: AsyncIterator[str],
+    params_to_pass: dict,
+    config: Optional[RunnableConfig] = None,
+    focus: Optional[str] = None,
+    quorum: Optional[int] = None,
+    section_name: Optional[str] = None,
+) -> tuple[list[str], str]:
+    """Search each query as soon as it arrives and accumulate the processed results.
+
+    Every query is searched and processed (see search_and_process) in its own task
+    while later queries are still being generated. Results are deduplicated by
+    canonical URL across queries, in arrival order. With a quorum, the searches stop
+    as soon as that many sources have arrived: slower searches and the generation of
+    further queries are cancelled. A ``section_sources`` custom stream event is written
+    as each search completes.
+
+    Args:
+        search_api: Name of the search API to use
+        queries: Search queries, e.g. streamed from the query writer
+        params_to_pass: Parameters to pass to the search API
+        config: Runnable config carrying the search result processing configuration
+        focus: What the searches are for (e.g. the section description)
+        quorum: Number of sources after which the remaining searches are cancelled
+        section_name: Name of the section, attached to the stream events
+
+    Returns:
+        tuple: The queries issued and the processed results
+    """
+    write = get_section_stream_writer()
+    query_list: list[str] = []
+    search_tasks: list[asyncio.Task] = []
+    completed: asyncio.Queue = asyncio.Queue()
+    results: list[dict] = []
+    seen_urls: set[str] = set()
+
+    async def search(query: str):
+        try:
+            batch = await search_and_process(search_api, [query], params_to_pass, config=config, focus=focus)
+        except Exception as e:
+            logger.warning("Search for '%s' failed: %s", query, e)
+            batch = []
+        completed.put_nowait((query, batch))
+
+    async def produce():
+        async for query in queries:
+            query_list.append(query)
+            search_tasks.append(asyncio.create_task(search(query)))
+
+    producer = asyncio.create_task(produce())
+    received = 0
+    try:
+        while not (producer.done() and received == len(search_tasks)):
+            next_batch = asyncio.ensure_future(completed.get())
+            waiting = {next_batch} if producer.done() else {next_batch, producer}
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+            if producer in done and producer.exception() is not None:
+                next_batch.cancel()
+                raise producer.exception()
+            if next_batch not in done:
+                next_batch.cancel()
+                continue
+            query, batch = next_batch.result()
+            received += 1
+            for result in batch:
+                url = canonicalize_url(result["url"])
+                if url not in seen_urls:
+                    seen_urls.add(url)
+                    results.append(result)
+            write({"type": "section_sources", "section": section_name, "query": query, "sources": len(results)})
+            if quorum and len(results) >= int(quorum):
+                break
+    finally:
+        producer.cancel()
+        for task in search_tasks:
+            task.cancel()
+
+    return query_list, results
 
 
 class Summary(BaseModel):
@@ -1554,60 +1628,492 @@ class Summary(BaseModel):
     key_excerpts: list[str]
 
 
+class Summaries(BaseModel):
+    summaries: list[Summary]
+
+
+# Fallback size used when a page cannot be summarized, so failures never inflate the prompt
+SUMMARIZATION_FALLBACK_MAX_CHARS = 8_000
+
+
+def format_summary(summary: Summary) -> str:
+    """Format a structured summary as the text block handed to downstream prompts."""
+    excerpts_str = "\n".join(f'- {e}' for e in summary.key_excerpts)
+    return f"""<summary>\n{summary.summary}\n</summary>\n\n<key_excerpts>\n{excerpts_str}\n</key_excerpts>"""
+
+
+def truncate_webpage_content(webpage_content: str, max_chars: int = SUMMARIZATION_FALLBACK_MAX_CHARS) -> str:
+    """Truncate webpage content that is used in place of a summary."""
+    if len(webpage_content) <= max_chars:
+        return webpage_content
+    return webpage_content[:max_chars] + "... [truncated]"
+
+
+def supports_cache_breakpoints(model: Any) -> bool:
+    """Whether a model takes Anthropic ``cache_control`` breakpoints in its content blocks.
+
+    Bound models are looked through, and a router takes them if any of its deployments
+    does (it removes them from the calls of its other deployments).
+    """
+    while isinstance(model, RunnableBinding):
+        model = model.bound
+    if isinstance(model, RouterChatModel):
+        return any(deployment.cache_breakpoints for deployment in model.deployments)
+    return isinstance(model, ChatAnthropic)
+
+
+def cacheable_prompt(model: BaseChatModel, static_prefix: str, dynamic_suffix: Optional[str] = None, ttl: Optional[str] = None) -> Union[str, list[dict]]:
+    """Build message content whose static prefix can be served from the provider's prompt cache.
+
+    For Anthropic models, and routers with an Anthropic deployment, the prefix becomes
+    a text block ending in a ``cache_control`` breakpoint, so the tools, the messages
+    before it and the prefix are cached. OpenAI
+    and Azure OpenAI cache the longest repeated prefix of a prompt automatically, so
+    the content is returned as a single string with the prefix first.
+
+    Args:
+        model: Chat model the content is sent to
+        static_prefix: Content that is identical across calls
+        dynamic_suffix: Content that varies per call, placed after the breakpoint
+        ttl: Anthropic cache lifetime ("5m" or "1h"), the provider default if unset
+
+    Returns:
+        Message content, a string or a list of content blocks
+    """
+    if supports_cache_breakpoints(model):
+        cache_control = {"type": "ephemeral", **({"ttl": ttl} if ttl else {})}
+        blocks = [{"type": "text", "text": static_prefix, "cache_control": cache_control}]
+        if dynamic_suffix:
+            blocks.append({"type": "text", "text": dynamic_suffix})
+        return blocks
+    return static_prefix + "\n\n" + dynamic_suffix if dynamic_suffix else static_prefix
+
+
+def _summarization_user_message(model: BaseChatModel, content: str):
+    return cacheable_prompt(model, content, ttl="1h")
+
+
+async def _summarize_webpage_content(model: BaseChatModel, webpage_content: str, stop_after_attempt: int = 1) -> str:
+    """Summarize a single webpage, letting model errors propagate to the caller."""
+    summary = await model.with_structured_output(Summary).with_retry(stop_after_attempt=stop_after_attempt).ainvoke([
+        {"role": "system", "content": SUMMARIZATION_PROMPT.format(webpage_content=webpage_content)},
+        {"role": "user", "content": _summarization_user_message(model, "Please summarize the article")},
+    ])
+    return format_summary(summary)
+
+
+async def _summarize_webpage_group(model: BaseChatModel, webpages: list[str]) -> Optional[list[str]]:
+    """Summarize several short webpages in one call.
+
+    Returns None if the model does not return exactly one summary per webpage.
+    """
+    webpages_str = "\n\n".join(
+        f"<webpage id=\"{i}\">\n{webpage}\n</webpage>" for i, webpage in enumerate(webpages, 1)
+    )
+    result = await model.with_structured_output(Summaries).ainvoke([
+        {"role": "system", "content": BATCH_SUMMARIZATION_PROMPT.format(webpages=webpages_str)},
+        {"role": "user", "content": _summarization_user_message(model, f"Please summarize each of the {len(webpages)} articles")},
+    ])
+    if len(result.summaries) != len(webpages):
+        return None
+    return [format_summary(summary) for summary in result.summaries]
+
+
 async def summarize_webpage(model: BaseChatModel, webpage_content: str) -> str:
     """Summarize webpage content."""
     try:
-        user_input_content = "Please summarize the article"
-        if isinstance(model, ChatAnthropic):
-            user_input_content = [{
-                "type": "text",
-                "text": user_input_content,
-                "cache_control": {"type": "ephemeral", "ttl": "1h"}
-            }]
-
-        summary = await model.with_structured_output(Summary).with_retry(stop_after_attempt=2).ainvoke([
-            {"role": "system", "content": SUMMARIZATION_PROMPT.format(webpage_content=webpage_content)},
-            {"role": "user", "content": user_input_content},
-        ])
-    except:
-        # fall back on the raw content
-        return webpage_content
+        return await _summarize_webpage_content(model, webpage_content, stop_after_attempt=2)
+    except Exception as e:
+        # fall back on the (truncated) raw content
+        logger.warning("Failed to summarize webpage: %s", e)
+        return truncate_webpage_content(webpage_content)
 
-    def format_summary(summary: Summary):
-        excerpts_str = "\n".join(f'- {e}' for e in summary.key_excerpts)
-        return f"""<summary>\n{summary.summary}\n</summary>\n\n<key_excerpts>\n{excerpts_str}\n</key_excerpts>"""
 
-    return format_summary(summary)
+class SummarizationScheduler:
+    """Run webpage summarization under a shared concurrency limit.
+
+    Instead of starting one model call per search result at once, at most
+    ``max_concurrency`` summaries run at a time. The limit is fixed: adapting to
+    rate-limit errors is left to the AIMD limiter of the model deployment (see
+    RateLimitCallbackHandler), so a 429 lowers a single limit. Failed calls are
+    retried with exponential backoff and jitter.
+
+    When ``batch_size`` is larger than one, pages shorter than ``batch_max_chars``
+    are grouped and summarized together in a single call.
+
+    Args:
+        max_concurrency: Upper bound for concurrent summarization calls
+        batch_size: Number of short pages to group into one call (1 disables grouping)
+        batch_max_chars: Pages up to this length are eligible for grouping
+        max_attempts: Attempts per call before falling back on the truncated page
+        base_delay: Initial backoff delay in seconds
+        max_delay: Upper bound for the backoff delay in seconds
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        batch_size: int = 1,
+        batch_max_chars: int = 4_000,
+        max_attempts: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.batch_size = max(1, batch_size)
+        self.batch_max_chars = batch_max_chars
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def run(self, fn, *args):
+        """Run a model call under the concurrency limit, retrying failures with backoff."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        for attempt in range(self.max_attempts):
+            try:
+                async with self._semaphore:
+                    return await fn(*args)
+            except Exception as e:
+                if attempt == self.max_attempts - 1:
+                    raise
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt) * (1 + random.random())
+                if is_rate_limit_error(e):
+                    logger.warning("Summarization rate limited, retrying in %.1fs", delay)
+            # back off without holding a slot
+            await asyncio.sleep(delay)
+
+    async def _summarize_one(self, model: BaseChatModel, webpage: str) -> str:
+        try:
+            return await self.run(_summarize_webpage_content, model, webpage)
+        except Exception as e:
+            logger.warning("Failed to summarize webpage: %s", e)
+            return truncate_webpage_content(webpage)
+
+    async def _summarize_group(self, model: BaseChatModel, webpages: list[str]) -> list[str]:
+        try:
+            summaries = await self.run(_summarize_webpage_group, model, webpages)
+        except Exception as e:
+            logger.warning("Failed to summarize group of %s webpages: %s", len(webpages), e)
+            summaries = None
+        if summaries is None:
+            # fall back on summarizing the pages one by one
+            return list(await asyncio.gather(*[self._summarize_one(model, webpage) for webpage in webpages]))
+        return summaries
+
+    async def summarize(self, model: BaseChatModel, webpages: list[Optional[str]]) -> list[Optional[str]]:
+        """Summarize a list of webpages, keeping None for pages without content.
+
+        Args:
+            model: Chat model used for summarization
+            webpages: Raw webpage contents, None or empty for results without raw content
+
+        Returns:
+            list[Optional[str]]: Formatted summary per webpage, in the input order
+        """
+        summaries: list[Optional[str]] = [None] * len(webpages)
+        singles = []
+        short_pages = []
+        for i, webpage in enumerate(webpages):
+            if not webpage:
+                continue
+            if self.batch_size > 1 and len(webpage) <= self.batch_max_chars:
+                short_pages.append(i)
+            else:
+                singles.append(i)
+
+        groups = [short_pages[i:i + self.batch_size] for i in range(0, len(short_pages), self.batch_size)]
+        # a group of one page is summarized as a single page
+        singles.extend(group[0] for group in groups if len(group) == 1)
+        groups = [group for group in groups if len(group) > 1]
+
+        async def summarize_single(i: int):
+            summaries[i] = await self._summarize_one(model, webpages[i])
+
+        async def summarize_group(indices: list[int]):
+            for i, summary in zip(indices, await self._summarize_group(model, [webpages[i] for i in indices])):
+                summaries[i] = summary
+
+        await asyncio.gather(
+            *[summarize_single(i) for i in singles],
+            *[summarize_group(group) for group in groups],
+        )
+        return summaries
+
+
+# Schedulers are kept per event loop, like the chat models (see _registry_scope)
+_SUMMARIZATION_SCHEDULERS: "weakref.WeakKeyDictionary[Any, Dict[tuple, SummarizationScheduler]]" = weakref.WeakKeyDictionary()
+
 
+def get_summarization_scheduler(
+    model_provider: str,
+    model: str,
+    max_concurrency: int = 4,
+    batch_size: int = 1,
+    max_attempts: int = 4,
+) -> SummarizationScheduler:
+    """Get the summarization scheduler for a model in the running event loop.
+
+    Schedulers are shared so that concurrent sections and tool calls summarizing with
+    the same model are bounded by one limit instead of one limit per call.
+    """
+    key = (model_provider, model, max_concurrency, batch_size, max_attempts)
+    schedulers = _SUMMARIZATION_SCHEDULERS.setdefault(_registry_scope(), {})
+    if key not in schedulers:
+        schedulers[key] = SummarizationScheduler(
+            max_concurrency=max_concurrency,
+            batch_size=batch_size,
+            max_attempts=max_attempts,
+        )
+    return schedulers[key]
 
-def split_and_rerank_search_results(embeddings: Embeddings, query: str, search_results: list[dict], max_chunks: int = 5):
-    # split webpage content into chunks
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1500, chunk_overlap=200, add_start_index=True
+
+async def summarize_webpages_with_batch_api(
+    webpages: list[Optional[str]],
+    model: str,
+    model_provider: str,
+    azure_config: Optional[Dict[str, Any]] = None,
+    poll_interval: float = 30.0,
+    timeout: float = 24 * 60 * 60,
+) -> list[Optional[str]]:
+    """Summarize webpages offline through the OpenAI / Azure OpenAI Batch API.
+
+    Batch requests are billed at a discount and do not compete with interactive
+    traffic for rate limits, at the cost of latency (up to the 24h completion
+    window). Meant for non-interactive report jobs.
+
+    Args:
+        webpages: Raw webpage contents, None or empty for results without raw content
+        model: Model name or Azure OpenAI (global batch) deployment name
+        model_provider: "openai" or "azure_openai"
+        azure_config: Azure OpenAI configuration dictionary
+        poll_interval: Seconds between batch status checks
+        timeout: Seconds to wait for the batch before cancelling it
+
+    Returns:
+        list[Optional[str]]: Formatted summary per webpage, None where no summary was produced
+    """
+    from openai import AsyncAzureOpenAI, AsyncOpenAI
+
+    provider = model_provider.lower()
+    azure_config = azure_config or {}
+    if provider == "azure_openai" and azure_config.get("azure_openai_endpoint") and azure_config.get("azure_openai_api_key"):
+        client = AsyncAzureOpenAI(
+            azure_endpoint=azure_config["azure_openai_endpoint"],
+            api_key=azure_config["azure_openai_api_key"],
+            api_version=azure_config.get("azure_openai_api_version") or "2024-10-21",
+        )
+        endpoint = "/chat/completions"
+    elif provider in ("openai", "azure_openai"):
+        # Same fallback as get_chat_model when the Azure config is incomplete
+        client = AsyncOpenAI()
+        endpoint = "/v1/chat/completions"
+    else:
+        raise ValueError(f"Batch summarization is not supported for provider: {model_provider}")
+
+    requests_jsonl = "\n".join(
+        json.dumps({
+            "custom_id": str(i),
+            "method": "POST",
+            "url": endpoint,
+            "body": {
+                "model": model,
+                "response_format": {"type": "json_object"},
+                "messages": [
+                    {"role": "system", "content": SUMMARIZATION_PROMPT.format(webpage_content=webpage)},
+                    {"role": "user", "content": "Please summarize the article as a JSON object"},
+                ],
+            },
+        })
+        for i, webpage in enumerate(webpages)
+        if webpage
     )
-    documents = [
+    summaries: list[Optional[str]] = [None] * len(webpages)
+    if not requests_jsonl:
+        return summaries
+
+    batch_file = await client.files.create(file=("summaries.jsonl", requests_jsonl.encode()), purpose="batch")
+    batch = await client.batches.create(input_file_id=batch_file.id, endpoint=endpoint, completion_window="24h")
+
+    deadline = time.monotonic() + timeout
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        if time.monotonic() > deadline:
+            await client.batches.cancel(batch.id)
+            raise TimeoutError(f"Summarization batch {batch.id} did not finish within {timeout} seconds")
+        await asyncio.sleep(poll_interval)
+        batch = await client.batches.retrieve(batch.id)
+
+    if batch.status != "completed" or not batch.output_file_id:
+        raise RuntimeError(f"Summarization batch {batch.id} ended with status '{batch.status}'")
+
+    output = await client.files.content(batch.output_file_id)
+    for line in output.text.splitlines():
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        response = entry.get("response") or {}
+        if response.get("status_code") != 200:
+            continue
+        content = response["body"]["choices"][0]["message"]["content"]
+        try:
+            summaries[int(entry["custom_id"])] = format_summary(Summary.model_validate_json(content))
+        except ValueError:
+            logger.warning("Could not parse batch summary for webpage %s", entry['custom_id'])
+    return summaries
+
+
+def _search_result_documents(search_results: list[dict]) -> list[Document]:
+    return [
         Document(
             page_content=result.get('raw_content') or result['content'],
             metadata={"url": result['url'], "title": result['title']}
         )
         for result in search_results
     ]
-    all_splits = text_splitter.split_documents(documents)
 
-    # index chunks
-    vector_store = InMemoryVectorStore(embeddings)
-    vector_store.add_documents(documents=all_splits)
 
-    # retrieve relevant chunks
-    retrieved_docs = vector_store.similarity_search(query, k=max_chunks)
-    return retrieved_docs
+def split_search_results(search_results: list[dict]) -> list[Document]:
+    """Split the content of search results into chunks with url, title and start_index metadata."""
+    return get_chunking_service().split_documents(_search_result_documents(search_results))
+
+
+async def asplit_search_results(search_results: list[dict]) -> list[Document]:
+    """Split the content of search results into chunks, splitting large pages in a process pool."""
+    return await get_chunking_service().asplit_documents(_search_result_documents(search_results))
+
+
+async def rerank_search_results_by_query(
+    embeddings: Embeddings,
+    results_by_query: dict[str, list[dict]],
+    max_chunks: int = 5,
+    index: Optional[ChunkIndex] = None,
+    chunks: Optional[list[Document]] = None,
+) -> RerankResult:
+    """Rerank the chunks of search results against all their queries in one pass.
+
+    Each query only ranks chunks from its own search results. All chunks are
+    indexed together, all queries are embedded in one batch and scored with a
+    single matrix product. The embedding calls are awaited, so the searches of
+    other sections keep running meanwhile.
+
+    Args:
+        embeddings: Embeddings used for chunks and queries
+        results_by_query: Search results grouped by the query that returned them
+        max_chunks: Number of chunks to select per query
+        index: Index to reuse across calls; a new one is created if None
+        chunks: Chunks of the search results if already split
+
+    Returns:
+        RerankResult: Per-query and merged rankings
+    """
+    if index is None:
+        index = ChunkIndex(embeddings)
+    # only new chunks are embedded when reusing an index
+    if chunks is None:
+        chunks = split_search_results([
+            result for query_results in results_by_query.values() for result in query_results
+        ])
+    await index.aadd_documents(chunks)
+    queries = list(results_by_query)
+    urls_by_query = [{result['url'] for result in results_by_query[query]} for query in queries]
+    return await index.arerank(queries, k=max_chunks, urls_by_query=urls_by_query)
+
+
+def lexical_rerank_search_results_by_query(
+    results_by_query: dict[str, list[dict]],
+    max_chunks: int = 5,
+    method: Literal["bm25", "tfidf"] = "bm25",
+    chunks: Optional[list[Document]] = None,
+) -> RerankResult:
+    """Rerank the chunks of search results against their queries with BM25 or TF-IDF.
+
+    Runs locally in milliseconds, without network access or model calls. Each query
+    only ranks chunks from its own search results, and chunks that share no terms
+    with the query are dropped.
+
+    Args:
+        results_by_query: Search results grouped by the query that returned them
+        max_chunks: Number of chunks to select per query
+        method: "bm25" or "tfidf"
+        chunks: Chunks of the search results if already split
+
+    Returns:
+        RerankResult: Per-query and merged rankings
+    """
+    if chunks is None:
+        chunks = split_search_results([
+            result for query_results in results_by_query.values() for result in query_results
+        ])
+    index = LexicalIndex(chunks, method=method)
+    queries = list(results_by_query)
+    urls_by_query = [{result['url'] for result in results_by_query[query]} for query in queries]
+    return index.rerank(queries, k=max_chunks, urls_by_query=urls_by_query)
+
+
+async def split_and_rerank_search_results(
+    embeddings: Embeddings,
+    query: str,
+    search_results: list[dict],
+    max_chunks: int = 5,
+    index: Optional[ChunkIndex] = None,
+):
+    search_results = list(search_results)
+    reranked = await rerank_search_results_by_query(embeddings, {query: search_results}, max_chunks=max_chunks, index=index)
+    return reranked.per_query[query]
+
+
+# Chunks whose start offsets are at most this many characters past the end of the
+# previous span are treated as adjacent (the splitter strips whitespace at chunk edges)
+STITCH_MAX_GAP = 2
+
+
+def _merge_chunk_spans(docs: list[Document]) -> list[str]:
+    """Merge the chunks of one page into continuous spans of text.
+
+    Chunks are ordered by their ``start_index`` and chunks that overlap or sit next to
+    each other are joined, so text shared through the splitter overlap appears once.
+    Chunks without a ``start_index`` are kept as separate spans.
+    """
+    positioned = sorted(
+        (doc for doc in docs if doc.metadata.get("start_index") is not None),
+        key=lambda doc: doc.metadata["start_index"],
+    )
+    spans = []
+    span_text, span_end = None, -1
+    for doc in positioned:
+        start = doc.metadata["start_index"]
+        end = start + len(doc.page_content)
+        if span_text is not None and start <= span_end + STITCH_MAX_GAP:
+            if end > span_end:
+                if start > span_end:
+                    span_text += "\n" + doc.page_content
+                else:
+                    span_text += doc.page_content[span_end - start:]
+                span_end = end
+            continue
+        if span_text is not None:
+            spans.append(span_text)
+        span_text, span_end = doc.page_content, end
+    if span_text is not None:
+        spans.append(span_text)
+
+    spans.extend(doc.page_content for doc in docs if doc.metadata.get("start_index") is None)
+    return spans
 
 
 def stitch_documents_by_url(documents: list[Document]) -> list[Document]:
+    """Stitch retrieved chunks into a single document per URL.
+
+    Documents are returned in the order their URL first appears in ``documents`` and keep
+    the metadata of their best-ranked chunk. Within a page, chunks are put back in page
+    order and overlapping or adjacent chunks are merged into continuous spans.
+    """
     url_to_docs: defaultdict[str, list[Document]] = defaultdict(list)
     url_to_snippet_hashes: defaultdict[str, set[str]] = defaultdict(set)
     for doc in documents:
-        snippet_hash = hashlib.sha256(doc.page_content.encode()).hexdigest()
+        # indexed chunks carry their hash already
+        snippet_hash = doc.metadata.get("chunk_hash") or content_hash(doc.page_content)
         url = doc.metadata['url']
         # deduplicate snippets by the content
         if snippet_hash in url_to_snippet_hashes[url]:
@@ -1616,11 +2122,10 @@ def stitch_documents_by_url(documents: list[Document]) -> list[Document]:
         url_to_docs[url].append(doc)
         url_to_snippet_hashes[url].add(snippet_hash)
 
-    # stitch retrieved chunks into a single doc per URL
     stitched_docs = []
     for docs in url_to_docs.values():
         stitched_doc = Document(
-            page_content="\n\n".join([f"...{doc.page_content}..." for doc in docs]),
+            page_content="\n\n".join([f"...{span}..." for span in _merge_chunk_spans(docs)]),
             metadata=cast(Document, docs[0]).metadata
         )
         stitched_docs.append(stitched_doc)
@@ -1628,6 +2133,706 @@ def stitch_documents_by_url(documents: list[Document]) -> list[Document]:
     return stitched_docs
 
 
+## Search result post-processing pipeline --
+#
+# Every search backend feeds the same chain of async stages:
+#   stream_search_responses -> canonicalize -> deduplicate -> extract -> process -> format
+# Stages pass batches (the results of one search response) down the chain, so the
+# results of fast queries are extracted and summarized while slow ones are still running.
+
+# Search APIs that return result dicts and can go through the pipeline
+SEARCH_BACKENDS = ("tavily", "azureaisearch", "linkup", "perplexity", "exa", "arxiv", "pubmed", "googlesearch", "duckduckgo")
+
+# Backends that search all queries concurrently anyway, so they are called once per query
+# and their responses are streamed as they complete. The others space their requests out
+# to respect rate limits and are called once for all queries.
+STREAMING_SEARCH_BACKENDS = ("tavily", "azureaisearch", "linkup")
+
+_TRACKING_PARAM_PREFIXES = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid")
+
+
+def canonicalize_url(url: str) -> str:
+    """Normalize a URL for deduplication.
+
+    Lowercases scheme and host, drops the fragment, tracking parameters and trailing slashes.
+    """
+    if not url:
+        return url
+    parts = urlsplit(url.strip())
+    if not parts.scheme or not parts.netloc:
+        return url.strip()
+    query = urlencode([
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith(_TRACKING_PARAM_PREFIXES)
+    ])
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/") or "/", query, ""))
+
+
+async def stream_search_responses(search_api: str, query_list: list[str], params_to_pass: dict) -> AsyncIterator[dict]:
+    """Execute a search and yield its responses (one per query) as they arrive.
+
+    Every yielded response carries the query it belongs to.
+
+    Args:
+        search_api: Name of the search API to use
+        query_list: List of search queries to execute
+        params_to_pass: Parameters to pass to the search API
+
+    Raises:
+        ValueError: If an unsupported search API is specified
+    """
+    if search_api in STREAMING_SEARCH_BACKENDS:
+        search_fn = {
+            "tavily": tavily_search_async,
+            "azureaisearch": azureaisearch_search_async,
+            "linkup": linkup_search,
+        }[search_api]
+
+        async def search_one(query: str) -> list[dict]:
+            responses = await search_fn([query], **params_to_pass)
+            return [{**response, "query": response.get("query") or query} for response in responses]
+
+        for next_done in asyncio.as_completed([search_one(query) for query in query_list]):
+            for response in await next_done:
+                yield response
+        return
+
+    if search_api == "perplexity":
+        # synchronous client, keep it off the event loop
+        responses = await asyncio.to_thread(perplexity_search, query_list, **params_to_pass)
+    elif search_api == "exa":
+        responses = await exa_search(query_list, **params_to_pass)
+    elif search_api == "arxiv":
+        responses = await arxiv_search_async(query_list, **params_to_pass)
+    elif search_api == "pubmed":
+        responses = await pubmed_search_async(query_list, **params_to_pass)
+    elif search_api == "googlesearch":
+        responses = await google_search_async(query_list, **params_to_pass)
+    elif search_api == "duckduckgo":
+        responses = await duckduckgo_search_async(query_list)
+    else:
+        raise ValueError(f"Unsupported search API: {search_api}")
+
+    for query, response in zip(query_list, responses):
+        yield {**response, "query": response.get("query") or query}
+
+
+async def canonicalize_search_results(responses: AsyncIterator[dict]) -> AsyncIterator[list[dict]]:
+    """Turn search responses into batches of results with a common set of fields."""
+    async for response in responses:
+        batch = []
+        for result in response.get("results") or []:
+            url = result.get("url") or ""
+            batch.append({
+                "title": result.get("title") or url,
+                "url": url,
+                "canonical_url": canonicalize_url(url),
+                "content": result.get("content") or "",
+                "score": result.get("score"),
+                "raw_content": result.get("raw_content"),
+                "query": response.get("query"),
+            })
+        yield batch
+
+
+async def deduplicate_search_results(batches: AsyncIterator[list[dict]]) -> AsyncIterator[list[dict]]:
+    """Drop results whose canonical URL was already seen, keeping the first one."""
+    seen_urls = set()
+    async for batch in batches:
+        unique_batch = []
+        for result in batch:
+            if result["canonical_url"] in seen_urls:
+                continue
+            seen_urls.add(result["canonical_url"])
+            unique_batch.append(result)
+        if unique_batch:
+            yield unique_batch
+
+
+def _extract_text(raw_content: str) -> str:
+    # Some backends return HTML markup as raw content
+    if raw_content.lstrip()[:1] == "<" and re.search(r"<(html|body|div|p)[\s>]", raw_content[:2_000], re.IGNORECASE):
+        return BeautifulSoup(raw_content, "html.parser").get_text("\n")
+    return raw_content
+
+
+async def extract_search_results(batches: AsyncIterator[list[dict]], max_char_to_include: int = 30_000) -> AsyncIterator[list[dict]]:
+    """Extract plain text from the raw content of each result and limit its size."""
+    async for batch in batches:
+        for result in batch:
+            raw_content = result["raw_content"]
+            result["raw_content"] = _extract_text(raw_content)[:max_char_to_include] if raw_content else None
+        yield batch
+
+
+async def compress_search_results(
+    batches: AsyncIterator[list[dict]],
+    max_chars: int,
+    focus: Optional[str] = None,
+) -> AsyncIterator[list[dict]]:
+    """Reduce the raw content of each result to its sentences most relevant to its query."""
+    async for batch in batches:
+        for result in batch:
+            if result["raw_content"]:
+                context = [result["query"] or "", focus or ""]
+                result["raw_content"] = extractive_compress(result["raw_content"], context, max_chars)
+        yield batch
+
+
+def _get_summarization_params(configurable: Configuration) -> tuple[dict, dict]:
+    if configurable.summarization_model_provider == "anthropic":
+        extra_kwargs = {"betas": ["extended-cache-ttl-2025-04-11"]}
+    else:
+        extra_kwargs = {}
+
+    azure_config = {
+        "azure_openai_endpoint": getattr(configurable, 'azure_openai_endpoint', None),
+        "azure_openai_api_key": getattr(configurable, 'azure_openai_api_key', None),
+        "azure_openai_api_version": getattr(configurable, 'azure_openai_api_version', None),
+        "model_routes": getattr(configurable, 'model_routes', None),
+    }
+    return azure_config, extra_kwargs
+
+
+# Per-decision counters of the summarization policy, accumulated over the process
+SUMMARIZATION_POLICY_STATS: Counter = Counter()
+
+
+def get_summarization_policy_stats() -> dict[str, int]:
+    """Get the summarization policy counters.
+
+    For every decision (pass_through, truncate, extract, summarize) there is a count of
+    pages plus the characters of raw content that went in and of content that came out.
+    """
+    return dict(SUMMARIZATION_POLICY_STATS)
+
+
+@dataclass
+class SummarizationPolicy:
+    """Decides per search result how its raw content is reduced.
+
+    - pass_through: short pages are used as they are, a summary would not be shorter
+    - truncate: pages scored below min_score by the search API keep their beginning only
+    - extract: medium pages, and any page once the summary budget of the search is used
+      up, are compressed extractively
+    - summarize: everything else is summarized with the LLM
+
+    Sizes are estimated at ~4 characters per token.
+    """
+    mode: Literal["adaptive", "always"] = "adaptive"
+    passthrough_max_tokens: int = 500
+    summarize_min_tokens: int = 2000
+    min_score: Optional[float] = None
+    max_summaries: Optional[int] = None
+    extract_max_tokens: int = 1000
+    pre_compress: bool = False
+    llm: bool = True
+    summaries_left: Optional[int] = field(default=None, init=False)
+
+    def __post_init__(self):
+        self.summaries_left = self.max_summaries
+
+    @classmethod
+    def from_configuration(cls, configurable: Configuration) -> "SummarizationPolicy":
+        return cls(
+            mode=configurable.summarization_policy,
+            passthrough_max_tokens=configurable.summarization_passthrough_max_tokens,
+            summarize_min_tokens=configurable.summarization_min_tokens,
+            min_score=configurable.summarization_min_score,
+            max_summaries=configurable.summarization_max_pages,
+            extract_max_tokens=configurable.extractive_compression_max_tokens,
+            pre_compress=configurable.extractive_compression == "before_summarization",
+            llm=configurable.extractive_compression != "replace_summarization",
+        )
+
+    def decide(self, result: dict) -> Literal["pass_through", "truncate", "extract", "summarize"]:
+        raw_content = result["raw_content"]
+        if not raw_content:
+            return "pass_through"
+        if self.mode == "always":
+            return "summarize" if self.llm else "extract"
+
+        tokens = len(raw_content) // 4
+        if tokens <= self.passthrough_max_tokens:
+            return "pass_through"
+        if self.min_score is not None and result.get("score") is not None and result["score"] < self.min_score:
+            return "truncate"
+        if not self.llm or tokens <= self.summarize_min_tokens or self.summaries_left == 0:
+            return "extract"
+        if self.summaries_left is not None:
+            self.summaries_left -= 1
+        return "summarize"
+
+    def apply(self, result: dict, decision: str, focus: Optional[str] = None):
+        """Reduce a result in place for every decision except summarize."""
+        raw_content = result["raw_content"]
+        if raw_content:
+            if decision == "truncate":
+                result["content"] = truncate_webpage_content(raw_content)
+            elif decision == "extract":
+                result["content"] = extractive_compress(
+                    raw_content, [result["query"] or "", focus or ""], self.extract_max_tokens * 4
+                )
+            else:
+                result["content"] = raw_content
+        self.record(result, decision)
+
+    def summarization_input(self, result: dict, focus: Optional[str] = None) -> str:
+        """Content handed to the LLM for a result that is summarized."""
+        if self.pre_compress:
+            return extractive_compress(result["raw_content"], [result["query"] or "", focus or ""], self.extract_max_tokens * 4)
+        return result["raw_content"]
+
+    def record(self, result: dict, decision: str):
+        SUMMARIZATION_POLICY_STATS[decision] += 1
+        SUMMARIZATION_POLICY_STATS[f"{decision}_input_chars"] += len(result["raw_content"] or "")
+        SUMMARIZATION_POLICY_STATS[f"{decision}_output_chars"] += len(result["content"] or "")
+        result["raw_content"] = None
+
+
+async def summarize_search_results(
+    batches: AsyncIterator[list[dict]],
+    configurable: Configuration,
+    focus: Optional[str] = None,
+) -> list[dict]:
+    """Replace the content of each result with a reduced version of its raw content.
+
+    SummarizationPolicy decides per result whether it is passed through, truncated,
+    compressed extractively or summarized. In online mode the pages to summarize are
+    handed to the summarization scheduler as soon as their batch arrives. In batch mode
+    they are collected and sent as one Batch API job.
+    """
+    azure_config, extra_kwargs = _get_summarization_params(configurable)
+    policy = SummarizationPolicy.from_configuration(configurable)
+    results = []
+    to_summarize = []
+
+    def triage(batch: list[dict]) -> list[dict]:
+        pending = []
+        for result in batch:
+            decision = policy.decide(result)
+            if decision == "summarize":
+                pending.append(result)
+            else:
+                policy.apply(result, decision, focus)
+        return pending
+
+    if configurable.summarization_mode == "batch":
+        async for batch in batches:
+            results.extend(batch)
+            to_summarize.extend(triage(batch))
+        webpages = [policy.summarization_input(result, focus) for result in to_summarize]
+        if webpages:
+            try:
+                summaries = await summarize_webpages_with_batch_api(
+                    webpages,
+                    model=configurable.summarization_model,
+                    model_provider=configurable.summarization_model_provider,
+                    azure_config=azure_config,
+                )
+            except Exception as e:
+                logger.warning("Batch summarization failed: %s", e)
+                summaries = [None] * len(webpages)
+        else:
+            summaries = []
+        summaries = [
+            truncate_webpage_content(webpage) if summary is None else summary
+            for webpage, summary in zip(webpages, summaries)
+        ]
+    else:
+        # Retries are handled by the scheduler so that rate-limit errors reach its backoff
+        summarization_model = get_chat_model(
+            model=configurable.summarization_model,
+            model_provider=configurable.summarization_model_provider,
+            azure_config=azure_config,
+            max_retries=0,
+            **extra_kwargs
+        )
+        scheduler = get_summarization_scheduler(
+            configurable.summarization_model_provider,
+            configurable.summarization_model,
+            max_concurrency=configurable.summarization_max_concurrency,
+            batch_size=configurable.summarization_batch_size,
+            max_attempts=configurable.max_structured_output_retries + 1,
+        )
+        tasks = []
+        try:
+            async for batch in batches:
+                results.extend(batch)
+                pending = triage(batch)
+                if pending:
+                    to_summarize.extend(pending)
+                    tasks.append(asyncio.create_task(scheduler.summarize(
+                        summarization_model, [policy.summarization_input(result, focus) for result in pending]
+                    )))
+            summaries = [summary for batch_summaries in await asyncio.gather(*tasks) for summary in batch_summaries]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    for result, summary in zip(to_summarize, summaries):
+        result["content"] = summary
+        policy.record(result, "summarize")
+    return results
+
+
+async def rerank_search_results(batches: AsyncIterator[list[dict]], configurable: Configuration, config: Optional[RunnableConfig] = None) -> list[dict]:
+    """Replace the results with their most relevant chunks, stitched into one result per URL."""
+    results_by_query = defaultdict(list)
+    results_by_url = {}
+    async for batch in batches:
+        for result in batch:
+            results_by_query[result["query"]].append(result)
+            results_by_url[result["url"]] = result
+
+    # large pages are split off the event loop
+    chunks = await asplit_search_results(list(results_by_url.values()))
+    if configurable.process_search_results == "split_and_rerank":
+        embeddings = get_embeddings(configurable.embedding_model, configurable.embedding_cache_dir)
+        # all searches of the run share one index, so chunks seen before are not embedded again
+        index = get_run_index(config, embeddings)
+        reranked = await rerank_search_results_by_query(embeddings, results_by_query, index=index, chunks=chunks)
+    else:
+        # local BM25 / TF-IDF ranking, no model calls
+        reranked = lexical_rerank_search_results_by_query(results_by_query, method=configurable.lexical_rerank_method, chunks=chunks)
+
+    return [
+        {**results_by_url[doc.metadata["url"]], "content": doc.page_content, "raw_content": None}
+        for doc in stitch_documents_by_url(reranked.merged)
+    ]
+
+
+async def process_search_results_pipeline(
+    responses: AsyncIterator[dict],
+    config: Optional[RunnableConfig] = None,
+    queries: Optional[list[str]] = None,
+    max_char_to_include: int = 30_000,
+    focus: Optional[str] = None,
+) -> list[dict]:
+    """Run search responses through the shared post-processing pipeline.
+
+    Results are canonicalized, deduplicated by canonical URL, reduced to plain text,
+    optionally compressed extractively (``extractive_compression``) and then
+    summarized or reranked according to ``process_search_results``. Once most of
+    the report budget is spent, summaries give way to extractive compression
+    (see govern_budget).
+
+    Args:
+        responses: Search responses, as yielded by stream_search_responses
+        config: Runnable config carrying the search result processing configuration
+        queries: Original query order; results are returned grouped in this order
+        max_char_to_include: Maximum characters of raw content kept per result
+        focus: What the searches are for (e.g. the section description), used with the
+            query to pick sentences during extractive compression
+
+    Returns:
+        list[dict]: Processed results with title, url, content, raw_content and query
+    """
+    # summarization is scaled down with the report budget
+    configurable = govern_budget(Configuration.from_runnable_config(config), config)
+    batches = extract_search_results(
+        deduplicate_search_results(canonicalize_search_results(responses)),
+        max_char_to_include=max_char_to_include,
+    )
+
+    if configurable.process_search_results == "summarize":
+        # extractive compression is applied per result by the summarization policy
+        results = await summarize_search_results(batches, configurable, focus=focus)
+    elif configurable.process_search_results in ("split_and_rerank", "lexical_rerank"):
+        # reranked results are ordered by relevance
+        return await rerank_search_results(batches, configurable, config)
+    else:
+        if configurable.extractive_compression != "none":
+            batches = compress_search_results(batches, configurable.extractive_compression_max_tokens * 4, focus=focus)
+        results = [result async for batch in batches for result in batch]
+
+    if queries:
+        # responses arrive in completion order, return them in query order
+        query_order = {query: i for i, query in enumerate(queries)}
+        results.sort(key=lambda result: query_order.get(result["query"], len(query_order)))
+    return results
+
+
+async def search_and_process(
+    search_api: str,
+    query_list: list[str],
+    params_to_pass: dict,
+    config: Optional[RunnableConfig] = None,
+    focus: Optional[str] = None,
+) -> list[dict]:
+    """Search with a search API and run the responses through the post-processing pipeline.
+
+    The latency, number of queries and number of results are recorded in the usage
+    accounting of the run.
+    """
+    with track_search(config, search_api, query_list) as stats:
+        results = await process_search_results_pipeline(
+            stream_search_responses(search_api, query_list, params_to_pass),
+            config=config,
+            queries=query_list,
+            focus=focus,
+        )
+        stats.results = len(results)
+    return results
+
+
+def format_search_results(results: list[dict], max_char_to_include: int = 30_000) -> str:
+    """Format processed search results for the search tools."""
+    if not results:
+        return "No valid search results found. Please try different search queries or use a different search API."
+
+    formatted_output = f"Search results: \n\n"
+    for i, result in enumerate(results):
+        formatted_output += f"\n\n--- SOURCE {i+1}: {result['title']} ---\n"
+        formatted_output += f"URL: {result['url']}\n\n"
+        formatted_output += f"SUMMARY:\n{result['content']}\n\n"
+        if result.get('raw_content'):
+            formatted_output += f"FULL CONTENT:\n{result['raw_content'][:max_char_to_include]}"  # Limit content size
+        formatted_output += "\n\n" + "-" * 80 + "\n"
+    return formatted_output
+
+
+# Minimum growth of the streamed tool call arguments, in characters, before they are parsed again
+SECTION_STREAM_PARSE_INTERVAL = 32
+
+
+def get_section_stream_writer():
+    """Get the writer of custom graph stream events, a no-op outside of a graph run."""
+    try:
+        return get_stream_writer()
+    except RuntimeError:
+        return lambda chunk: None
+
+
+def _chunk_text(chunk: AIMessageChunk) -> str:
+    """Text of a message chunk, for providers that stream content blocks as well as strings."""
+    if isinstance(chunk.content, str):
+        return chunk.content
+    return "".join(
+        block.get("text", "") if isinstance(block, dict) else str(block)
+        for block in chunk.content
+        if isinstance(block, str) or block.get("type") == "text"
+    )
+
+
+def uses_response_cache(model: Any) -> bool:
+    """Whether the calls of a model go through a response cache, which streamed calls skip.
+
+    Bound models are looked through, and a router uses the cache if any of its deployments does.
+    """
+    while isinstance(model, RunnableBinding):
+        model = model.bound
+    if isinstance(model, RouterChatModel):
+        return any(uses_response_cache(deployment.model) for deployment in model.deployments)
+    return isinstance(getattr(model, "cache", None), BaseCache)
+
+
+async def astream_section(model: BaseChatModel, messages: list, section_name: str) -> AIMessage:
+    """Generate a section with a streaming call and emit its tokens as custom graph stream events.
+
+    A ``{"type": "section_start", "section": ...}`` event is written first, so clients
+    reset the section when it is rewritten, followed by one
+    ``{"type": "section_token", "section": ..., "content": ...}`` event per token.
+    The events are visible with ``stream_mode="custom"``. Models with a response cache
+    are called with ainvoke instead, so cached sections are reused, and the section is
+    emitted as a single token event.
+
+    Args:
+        model: Chat model that writes the section
+        messages: Prompt messages
+        section_name: Name of the section, attached to every event
+
+    Returns:
+        AIMessage: The complete response, as ainvoke would return it
+    """
+    write = get_section_stream_writer()
+    write({"type": "section_start", "section": section_name})
+    if uses_response_cache(model):
+        message = await model.ainvoke(messages)
+        text = _chunk_text(message)
+        if text:
+            write({"type": "section_token", "section": section_name, "content": text})
+        return message
+    message = None
+    async for chunk in model.astream(messages):
+        message = chunk if message is None else message + chunk
+        text = _chunk_text(chunk)
+        if text:
+            write({"type": "section_token", "section": section_name, "content": text})
+    return message_chunk_to_message(message) if message is not None else AIMessage(content="")
+
+
+async def astream_section_tool_call(
+    model: Any,
+    messages: list,
+    section_name: str,
+    tool_name: str,
+    field: str = "content",
+) -> AIMessage:
+    """Stream a model response and emit the text of one argument of a tool call as section events.
+
+    Used where the section is written as a tool call (e.g. the researcher's Section tool).
+    The arguments of the tool call are parsed as partial JSON while they stream, and the
+    new text of ``field`` is written as ``section_token`` events, preceded by a
+    ``section_start`` event once the tool call appears. Responses calling other tools
+    emit nothing. Models with a response cache are called with ainvoke instead (see
+    astream_section).
+
+    Args:
+        model: Chat model with the tool bound
+        messages: Prompt messages
+        section_name: Name of the section, attached to every event
+        tool_name: Name of the tool that carries the section
+        field: Tool argument holding the section text
+
+    Returns:
+        AIMessage: The complete response, with its parsed tool calls
+    """
+    write = get_section_stream_writer()
+    if uses_response_cache(model):
+        message = await model.ainvoke(messages)
+        section_call = next((call for call in message.tool_calls if call["name"] == tool_name), None)
+        if section_call is not None:
+            write({"type": "section_start", "section": section_name})
+            value = section_call["args"].get(field)
+            if isinstance(value, str) and value:
+                write({"type": "section_token", "section": section_name, "content": value})
+        return message
+    message = None
+    started = False
+    emitted = 0
+    parsed_length = 0
+
+    def emit_new_text(tool_call_chunk: dict):
+        nonlocal emitted, parsed_length
+        args = tool_call_chunk.get("args") or ""
+        parsed_length = len(args)
+        partial = parse_partial_json(args) if args else None
+        value = partial.get(field) if isinstance(partial, dict) else None
+        if isinstance(value, str) and len(value) > emitted:
+            write({"type": "section_token", "section": section_name, "content": value[emitted:]})
+            emitted = len(value)
+
+    section_call = None
+    async for chunk in model.astream(messages):
+        message = chunk if message is None else message + chunk
+        section_call = next(
+            (call for call in message.tool_call_chunks if call.get("name") == tool_name), None
+        )
+        if section_call is None:
+            continue
+        if not started:
+            write({"type": "section_start", "section": section_name})
+            started = True
+        if len(section_call.get("args") or "") - parsed_length >= SECTION_STREAM_PARSE_INTERVAL:
+            emit_new_text(section_call)
+    if section_call is not None:
+        emit_new_text(section_call)
+    return message_chunk_to_message(message) if message is not None else AIMessage(content="")
+
+
+async def astream_tool_call_list_items(model: Any, messages: list, tool_name: str, field: str) -> AsyncIterator[dict]:
+    """Stream a tool call and yield each item of one of its list arguments as soon as the item is complete.
+
+    The arguments are parsed as partial JSON while they stream; an item is complete
+    once the next one has started, and the last ones are yielded when the response
+    ends. Lets callers act on the first items of a long structured output (e.g. the
+    sections of a plan) while the model is still generating the rest. Models with a
+    response cache are called with ainvoke instead, all items coming at the end.
+
+    Args:
+        model: Chat model with the tool bound
+        messages: Prompt messages
+        tool_name: Name of the tool carrying the list
+        field: Tool argument holding the list
+
+    Yields:
+        dict: Raw arguments of each list item, in order
+    """
+    if uses_response_cache(model):
+        message = await model.ainvoke(messages)
+        tool_calls = [call for call in message.tool_calls if call["name"] == tool_name]
+        for item in (tool_calls[0]["args"].get(field) or [] if tool_calls else []):
+            yield item
+        return
+    message = None
+    yielded = 0
+    parsed_length = 0
+    async for chunk in model.astream(messages):
+        message = chunk if message is None else message + chunk
+        call = next((call for call in message.tool_call_chunks if call.get("name") == tool_name), None)
+        args = (call or {}).get("args") or ""
+        if len(args) - parsed_length < SECTION_STREAM_PARSE_INTERVAL:
+            continue
+        parsed_length = len(args)
+        partial = parse_partial_json(args)
+        items = partial.get(field) if isinstance(partial, dict) else None
+        if isinstance(items, list):
+            while yielded < len(items) - 1:
+                yield items[yielded]
+                yielded += 1
+    if message is None:
+        return
+    tool_calls = [call for call in message_chunk_to_message(message).tool_calls if call["name"] == tool_name]
+    items = tool_calls[0]["args"].get(field) or [] if tool_calls else []
+    for item in items[yielded:]:
+        yield item
+
+
+async def cascade_grade_section(
+    grader_llm: BaseChatModel,
+    planner_llm: BaseChatModel,
+    instructions: str,
+    inputs: str,
+    confidence_threshold: float,
+    config: Optional[RunnableConfig] = None,
+) -> Feedback:
+    """Grade a section with a small model first and escalate uncertain grades to the planner model.
+
+    The grader model returns its grade with a confidence. Grades at or above the
+    threshold are used as they are; below it, or if the grader fails, the section is
+    graded again by the planner model, whose grade is used. For escalated grades the
+    agreement of both models is counted in the usage of the report (see
+    RunUsage.record_grading).
+
+    Args:
+        grader_llm: Small, fast chat model
+        planner_llm: Chat model used for grading without the cascade
+        instructions: Static grading instructions (system prompt)
+        inputs: Section to grade and grading request (user message)
+        confidence_threshold: Minimum confidence for the grade of the grader model
+        config: Runnable config of the node, to find the report the grading is counted in
+
+    Returns:
+        Feedback: Grade and follow-up queries
+    """
+    usage = get_config_usage(config)
+    usage.record_grading("graded")
+    graded = None
+    try:
+        graded = await grader_llm.with_structured_output(GradedFeedback).ainvoke([
+            {"role": "system", "content": cacheable_prompt(grader_llm, instructions)},
+            {"role": "user", "content": inputs + "\n" + section_grader_confidence_message},
+        ])
+    except Exception as e:
+        logger.warning("Grader model failed, escalating to the planner model: %s", e)
+        usage.record_grading("grader_errors")
+
+    if graded is not None and graded.confidence >= confidence_threshold:
+        usage.record_grading(f"accepted_{graded.grade}")
+        return Feedback(grade=graded.grade, follow_up_queries=graded.follow_up_queries)
+
+    usage.record_grading("escalated")
+    feedback = await planner_llm.with_structured_output(Feedback).ainvoke([
+        {"role": "system", "content": cacheable_prompt(planner_llm, instructions)},
+        {"role": "user", "content": inputs},
+    ])
+    if graded is not None:
+        usage.record_grading("agreed" if feedback.grade == graded.grade else "disagreed")
+    return feedback
+
+
 def get_today_str() -> str:
     """Get current date in a human-readable format."""
     import platform
@@ -1689,24 +2894,66 @@ def init_azure_chat_model(
         **kwargs
     )
 
-def get_chat_model(
+# Providers whose clients accept shared httpx clients (http_client / http_async_client)
+SHARED_TRANSPORT_PROVIDERS = ("openai", "azure_openai")
+
+# Connection pool of the shared transports, sized for many concurrent section workers
+HTTP_POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60)
+
+
+class _NoEventLoop:
+    """Registry scope for models created outside of an event loop."""
+
+
+_NO_EVENT_LOOP = _NoEventLoop()
+
+# Models and async transports are kept per event loop, since httpx async connection
+# pools cannot be used from another loop. Scopes disappear with their loop.
+_CHAT_MODELS: "weakref.WeakKeyDictionary[Any, Dict[tuple, BaseChatModel]]" = weakref.WeakKeyDictionary()
+_ASYNC_HTTP_CLIENTS: "weakref.WeakKeyDictionary[Any, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_SYNC_HTTP_CLIENT: Optional[httpx.Client] = None
+
+
+def _registry_scope():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return _NO_EVENT_LOOP
+
+
+def _freeze(value: Any) -> Any:
+    """Turn keyword arguments into a hashable, order-independent cache key."""
+    if isinstance(value, dict):
+        return tuple(sorted((str(key), _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(repr(_freeze(item)) for item in value))
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+def get_shared_http_clients() -> tuple[httpx.Client, httpx.AsyncClient]:
+    """Get the keep-alive HTTP clients shared by the chat models of the current event loop."""
+    global _SYNC_HTTP_CLIENT
+    if _SYNC_HTTP_CLIENT is None or _SYNC_HTTP_CLIENT.is_closed:
+        _SYNC_HTTP_CLIENT = httpx.Client(limits=HTTP_POOL_LIMITS)
+    scope = _registry_scope()
+    async_client = _ASYNC_HTTP_CLIENTS.get(scope)
+    if async_client is None or async_client.is_closed:
+        async_client = _ASYNC_HTTP_CLIENTS[scope] = httpx.AsyncClient(limits=HTTP_POOL_LIMITS)
+    return _SYNC_HTTP_CLIENT, async_client
+
+
+def _create_chat_model(
     model: str,
     model_provider: str,
     azure_config: Optional[Dict[str, Any]] = None,
     **kwargs
 ) -> BaseChatModel:
-    """
-    Get a chat model based on provider and configuration.
-    
-    Args:
-        model: Model name or deployment name
-        model_provider: Provider name (e.g., "openai", "azure_openai", "anthropic")
-        azure_config: Azure OpenAI configuration dictionary
-        **kwargs: Additional keyword arguments for the model
-    
-    Returns:
-        BaseChatModel: Initialized chat model
-    """
     if model_provider.lower() == "azure_openai":
         azure_config = azure_config or {}
         # Only use Azure config if at least endpoint and key are provided
@@ -1731,4 +2978,136 @@ def get_chat_model(
             model=model,
             model_provider=model_provider,
             **kwargs
-        )
\ No newline at end of file
+        )
+
+def _create_router_chat_model(
+    route: str,
+    azure_config: Optional[Dict[str, Any]] = None,
+    response_cache_path: Optional[str] = None,
+    **kwargs
+) -> RouterChatModel:
+    """Build the router of a named route from the ``model_routes`` in the Azure configuration.
+
+    A route is a list of deployments, each a "provider:model" string or a dict with
+    ``model``, ``model_provider``, ``weight``, ``priority`` and ``name`` and optionally
+    its own ``azure_openai_endpoint``, ``azure_openai_api_key`` and
+    ``azure_openai_api_version``; further keys are passed to the deployment's model.
+    """
+    azure_config = azure_config or {}
+    routes = azure_config.get("model_routes") or {}
+    if isinstance(routes, str):
+        # set through the MODEL_ROUTES environment variable
+        routes = json.loads(routes)
+    if route not in routes:
+        raise ValueError(f"Unknown model route: {route}. Define it in the model_routes configuration.")
+
+    deployments = []
+    for spec in routes[route]:
+        spec = dict(spec) if isinstance(spec, dict) else {"model": spec}
+        deployment_model = spec.pop("model")
+        provider = spec.pop("model_provider", None)
+        if provider is None:
+            provider, deployment_model = deployment_model.split(":", 1) if ":" in deployment_model else ("openai", deployment_model)
+        weight = spec.pop("weight", 1.0)
+        priority = spec.pop("priority", 0)
+        name = spec.pop("name", None)
+        deployment_azure_config = {
+            key: spec.pop(key, None) or azure_config.get(key)
+            for key in ("azure_openai_endpoint", "azure_openai_api_key", "azure_openai_api_version")
+        }
+        if name is None:
+            endpoint = deployment_azure_config["azure_openai_endpoint"] if provider == "azure_openai" else None
+            name = f"{provider}:{deployment_model}" + (f"@{urlsplit(endpoint).hostname}" if endpoint else "")
+        chat_model = get_chat_model(deployment_model, provider, deployment_azure_config, response_cache_path, **{**kwargs, **spec})
+        deployments.append(RouteDeployment(
+            name=name,
+            model=chat_model,
+            weight=weight,
+            priority=priority,
+            cache_breakpoints=supports_cache_breakpoints(chat_model),
+        ))
+    return RouterChatModel(route=route, deployments=deployments)
+
+
+def get_chat_model(
+    model: str,
+    model_provider: str,
+    azure_config: Optional[Dict[str, Any]] = None,
+    response_cache_path: Optional[str] = None,
+    **kwargs
+) -> BaseChatModel:
+    """
+    Get a chat model based on provider and configuration.
+
+    Models are cached in a registry keyed by provider, model, keyword arguments and
+    Azure configuration, so nodes that run hundreds of times per report reuse one
+    client instead of building a new one each time. OpenAI and Azure OpenAI models
+    share keep-alive HTTP connection pools. Use aclose_chat_models to release them.
+    Calls of the model are recorded in the usage accounting of the run (see accounting).
+    
+    Args:
+        model: Model name or deployment name
+        model_provider: Provider name (e.g., "openai", "azure_openai", "anthropic"), or
+            "router" to spread calls over the deployments of the route named by model
+            (see RouterChatModel)
+        azure_config: Azure OpenAI configuration dictionary, with the ``model_routes``
+            used by the router provider
+        response_cache_path: SQLite file of the exact-match response cache; responses
+            are cached only if set and the model arguments are deterministic
+        **kwargs: Additional keyword arguments for the model
+    
+    Returns:
+        BaseChatModel: Initialized chat model
+    """
+    scope = _registry_scope()
+    if model_provider.lower() == "router":
+        # the deployments carry the response cache, rate limiting and usage callbacks of their own calls
+        key = ("router", model, _freeze(azure_config or {}), response_cache_path, _freeze(kwargs))
+        models = _CHAT_MODELS.setdefault(scope, {})
+        if key not in models:
+            models[key] = _create_router_chat_model(model, azure_config, response_cache_path, **kwargs)
+        return models[key]
+    if response_cache_path and "cache" not in kwargs and is_deterministic_call(kwargs):
+        kwargs["cache"] = get_response_cache(response_cache_path)
+    # every call waits for a slot of its deployment's limiter and is recorded per run, node and section,
+    # whatever callbacks the caller adds
+    callbacks = kwargs.get("callbacks") or []
+    callbacks = list(callbacks.handlers if isinstance(callbacks, BaseCallbackManager) else callbacks)
+    kwargs["callbacks"] = [
+        *(handler for handler in (RATE_LIMIT_CALLBACK_HANDLER, USAGE_CALLBACK_HANDLER) if handler not in callbacks),
+        *callbacks,
+    ]
+    key = (model_provider.lower(), model, _freeze(azure_config or {}), _freeze(kwargs))
+    models = _CHAT_MODELS.setdefault(scope, {})
+    if key not in models:
+        if model_provider.lower() in SHARED_TRANSPORT_PROVIDERS and "http_async_client" not in kwargs:
+            http_client, http_async_client = get_shared_http_clients()
+            kwargs = {"http_client": http_client, "http_async_client": http_async_client, **kwargs}
+        models[key] = _create_chat_model(model, model_provider, azure_config, **kwargs)
+    return models[key]
+
+
+async def aclose_chat_models():
+    """Forget the cached chat models of the current event loop and close their shared transport.
+
+    Call on shutdown, or before tearing down an event loop that is not closed right away.
+    """
+    scope = _registry_scope()
+    _CHAT_MODELS.pop(scope, None)
+    async_client = _ASYNC_HTTP_CLIENTS.pop(scope, None)
+    if async_client is not None:
+        await async_client.aclose()
+
+
+def clear_chat_model_cache():
+    """Forget all cached chat models, e.g. after rotating API keys in the environment.
+
+    Shared transports stay open and are reused by the models created next.
+    """
+    _CHAT_MODELS.clear()
+
+
+@atexit.register
+def _close_sync_http_client():
+    if _SYNC_HTTP_CLIENT is not None:
+        _SYNC_HTTP_CLIENT.close()
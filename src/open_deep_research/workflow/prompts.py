@@ -183,25 +183,12 @@ These are the messages that have been exchanged so far from the user asking for
 </Source material>
 """
 
-section_grader_instructions = """Review a report section relative to the specified topic:
-
-These are the messages that have been exchanged so far from the user asking for the report:
-<Messages>
-{messages}
-</Messages>
-
-<section topic>
-{section_topic}
-</section topic>
-
-<section content>
-{section}
-</section content>
+section_grader_instructions = """Review a report section relative to the specified topic. The report request, section topic and section content are given in the user message.
 
 <task>
 Evaluate whether the section content adequately addresses the section topic.
 
-If the section content does not adequately address the section topic, generate {number_of_follow_up_queries} follow-up search queries to gather missing information.
+If the section content does not adequately address the section topic, generate the number of follow-up search queries given in the user message to gather missing information.
 </task>
 
 <format>
@@ -216,24 +203,25 @@ follow_up_queries: List[SearchQuery] = Field(
 </format>
 """
 
-final_section_writer_instructions="""You are an expert technical writer crafting a section that synthesizes information from the rest of the report.
-
-These are the messages that have been exchanged so far from the user asking for the report:
+section_grader_inputs = """These are the messages that have been exchanged so far from the user asking for the report:
 <Messages>
 {messages}
 </Messages>
 
-<Section name>
-{section_name}
-</Section name>
-
-<Section topic> 
+<section topic>
 {section_topic}
-</Section topic>
+</section topic>
 
-<Available report content>
-{context}
-</Available report content>
+<section content>
+{section}
+</section content>
+
+<number of follow-up queries>
+{number_of_follow_up_queries}
+</number of follow-up queries>
+"""
+
+final_section_writer_instructions="""You are an expert technical writer crafting a section that synthesizes information from the rest of the report. The report request and the available report content are given in the user message, followed by the name and topic of the section to write.
 
 <Task>
 1. Section-Specific Approach:
@@ -281,6 +269,26 @@ For Conclusion/Summary:
 - Do NOT ever refer to yourself as the writer of the report. This should be a professional report without any self-referential language.
 </Quality Checks>"""
 
+# Shared by every final section, so it precedes the section-specific inputs
+final_section_writer_context = """These are the messages that have been exchanged so far from the user asking for the report:
+<Messages>
+{messages}
+</Messages>
+
+<Available report content>
+{context}
+</Available report content>
+"""
+
+final_section_writer_inputs = """<Section name>
+{section_name}
+</Section name>
+
+<Section topic>
+{section_topic}
+</Section topic>
+"""
+
 SUMMARIZATION_PROMPT = """You are tasked with summarizing the raw content of a webpage retrieved from a web search. Your goal is to create a concise summary that preserves the most important information from the original web page. This summary will be used by a downstream research agent, so it's crucial to maintain the key details without losing essential information.
 
 Here is the raw content of the webpage:
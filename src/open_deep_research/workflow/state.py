@@ -1,6 +1,8 @@
-from typing import Annotated, Optional
+from typing import Annotated, Optional, TypedDict
 from langgraph.graph import MessagesState
-from open_deep_research.state import Section, SearchQuery
+from open_deep_research.accounting import merge_report_usage
+from open_deep_research.payloads import SectionRecord, SharedText
+from open_deep_research.state import Section, SearchQuery, extend_or_reset, merge_or_reset
 import operator
 from pydantic import BaseModel, Field
 
@@ -20,31 +22,42 @@ class ReportStateInput(MessagesState):
     
 class ReportStateOutput(MessagesState):
     final_report: str
+    usage: dict # Token, cost and latency accounting of the run
     # for evaluation purposes only
     # this is included only if configurable.include_source_str is True
     source_str: str # String of formatted source content from web search
 
 class ReportState(MessagesState):
     already_clarified_topic: Optional[bool] = None # If the user has clarified the topic with the agent
-    feedback_on_report_plan: Annotated[list[str], operator.add] # List of feedback on the report plan
+    feedback_on_report_plan: Annotated[list[str], extend_or_reset] # List of feedback on the report plan, cleared at the start of each report
     sections: list[Section] # List of report sections 
-    completed_sections: Annotated[list, operator.add] # Send() API key
-    report_sections_from_research: str # String of any completed sections from research to write final sections
+    completed_sections: Annotated[list, extend_or_reset] # Send() API key, cleared at the start of each report
+    report_sections_from_research: SharedText # Completed sections from research to write final sections, shared by their Send() payloads
+    planning_source_str: str # Formatted sources of the planning searches, reused when the plan is revised after feedback
+    research_topic: str # First message of the conversation the section research kept in the state belongs to
+    section_research: Annotated[dict, merge_or_reset] # Queries, sources (shared text) and draft of each completed section by name, reused by the next reports of the conversation
     final_report: str # Final report
+    usage: dict # Token, cost and latency accounting of the run
+    report_usage: Annotated[dict, merge_report_usage] # Id, clock and spend totals of the current report (see track_report), replaced at the start of each report
     # for evaluation purposes only
     # this is included only if configurable.include_source_str is True
     source_str: Annotated[str, operator.add] # String of formatted source content from web search
 
-class SectionState(MessagesState):
-    section: Section # Report section  
+class SectionState(TypedDict):
+    messages_buffer: SharedText # Conversation with the user, formatted once and shared by every section
+    section: SectionRecord # Report section  
     search_iterations: int # Number of search iterations done
     search_queries: list[SearchQuery] # List of search queries
     source_str: str # String of formatted source content from web search
-    report_sections_from_research: str # String of any completed sections from research to write final sections
-    completed_sections: list[Section] # Final key we duplicate in outer state for Send() API
+    report_sections_from_research: SharedText # Completed sections from research to write final sections
+    completed_sections: list[SectionRecord] # Final key we duplicate in outer state for Send() API
+    section_research: dict # Queries, sources and draft of the completed section
+    report_usage: dict # Id, clock and spend totals of the report (see track_report)
 
-class SectionOutputState(MessagesState):
-    completed_sections: list[Section] # Final key we duplicate in outer state for Send() API
+class SectionOutputState(TypedDict):
+    completed_sections: list[SectionRecord] # Final key we duplicate in outer state for Send() API
+    section_research: dict # Queries, sources and draft of the completed section
+    report_usage: dict # Id, clock and spend totals of the report, with the spend of the section
     # for evaluation purposes only
     # this is included only if configurable.include_source_str is True
     source_str: str # String of formatted source content from web search
\ No newline at end of file
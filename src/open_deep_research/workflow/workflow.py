@@ -1,3 +1,5 @@
+import asyncio
+import logging
 from typing import Literal
 from langchain.chat_models import init_chat_model
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, get_buffer_string
@@ -7,6 +9,12 @@ from langgraph.graph import START, END, StateGraph
 from langgraph.types import interrupt, Command
 
 from open_deep_research.workflow.configuration import WorkflowConfiguration
+from open_deep_research.accounting import current_section, export_run_usage, start_config_usage, track_report
+from open_deep_research.budget import govern_budget
+from open_deep_research.deadline import fallback_plan, get_time_left, mark_incomplete, run_within
+from open_deep_research.checkpointing import get_checkpointer
+from open_deep_research.payloads import SectionRecord, share_text
+from open_deep_research.replanning import research_record, reuse_section_research
 from open_deep_research.workflow.state import (
     ReportStateInput,
     ReportStateOutput,
@@ -28,7 +36,10 @@ from open_deep_research.workflow.prompts import (
     query_writer_instructions, 
     section_writer_instructions,
     final_section_writer_instructions,
+    final_section_writer_context,
+    final_section_writer_inputs,
     section_grader_instructions,
+    section_grader_inputs,
     section_writer_inputs
 )
 from open_deep_research.utils import (
@@ -37,10 +48,33 @@ from open_deep_research.utils import (
     get_search_params, 
     select_and_execute_search,
     get_today_str,
-    get_chat_model
+    get_chat_model,
+    astream_section,
+    astream_section_tool_call,
+    cacheable_prompt,
+    cascade_grade_section,
 )
 
+logger = logging.getLogger(__name__)
+
 ## Nodes
+def start_report(state: ReportState, config: RunnableConfig):
+    """Clear the sections and plan feedback of the previous report of the thread on each new user message, and start its usage accounting.
+
+    Resumed runs (plan feedback, or no input after a failure) skip this node and keep them.
+    The id, clock and spend totals of the report are kept in report_usage (see track_report).
+    With reuse_earlier_reports, the section research is kept while the conversation,
+    identified by its first message, is the same: the next reports of the thread
+    reuse the research of matching sections. It is cleared otherwise.
+    """
+    update = {"report_usage": start_config_usage(config).snapshot(), "completed_sections": None, "feedback_on_report_plan": None,
+              "planning_source_str": None, "final_report": ""}
+    topic = next((message.text for message in state["messages"] if message.type == "human"), "")
+    if state.get("research_topic") != topic or not WorkflowConfiguration.from_runnable_config(config).reuse_earlier_reports:
+        update.update(research_topic=topic, section_research=None)
+    return update
+
+
 def initial_router(state: ReportState, config: RunnableConfig):
     configurable = WorkflowConfiguration.from_runnable_config(config)
     if configurable.clarify_with_user and not state.get("already_clarified_topic", False):
@@ -50,6 +84,7 @@ def initial_router(state: ReportState, config: RunnableConfig):
 
 
 async def clarify_with_user(state: ReportState, config: RunnableConfig):
+    track_report(state, config)
     messages = state["messages"]
     configurable = WorkflowConfiguration.from_runnable_config(config)
     writer_provider = get_config_value(configurable.writer_provider)
@@ -60,12 +95,14 @@ async def clarify_with_user(state: ReportState, config: RunnableConfig):
         "azure_openai_endpoint": configurable.azure_openai_endpoint,
         "azure_openai_api_key": configurable.azure_openai_api_key,
         "azure_openai_api_version": configurable.azure_openai_api_version,
+        "model_routes": configurable.model_routes,
     }
     
     writer_model = get_chat_model(
         model=writer_model_name, 
         model_provider=writer_provider, 
         azure_config=azure_config,
+        response_cache_path=configurable.response_cache_path,
         **writer_model_kwargs
     )
     
@@ -76,12 +113,13 @@ async def clarify_with_user(state: ReportState, config: RunnableConfig):
     return {"messages": [AIMessage(content=results.question)], "already_clarified_topic": True}
 
 
-async def generate_report_plan(state: ReportState, config: RunnableConfig) -> Command[Literal["human_feedback","build_section_with_web_research"]]:
+async def generate_report_plan(state: ReportState, config: RunnableConfig) -> Command[Literal["human_feedback","build_section_with_web_research","gather_completed_sections"]]:
+    usage = track_report(state, config)
     messages = state["messages"]
     feedback_list = state.get("feedback_on_report_plan", [])
     feedback = " /// ".join(feedback_list) if feedback_list else ""
 
-    configurable = WorkflowConfiguration.from_runnable_config(config)
+    configurable = govern_budget(WorkflowConfiguration.from_runnable_config(config), config)
     report_structure = configurable.report_structure
     number_of_queries = configurable.number_of_queries
     search_api = get_config_value(configurable.search_api)
@@ -100,12 +138,14 @@ async def generate_report_plan(state: ReportState, config: RunnableConfig) -> Co
         "azure_openai_endpoint": configurable.azure_openai_endpoint,
         "azure_openai_api_key": configurable.azure_openai_api_key,
         "azure_openai_api_version": configurable.azure_openai_api_version,
+        "model_routes": configurable.model_routes,
     }
     
     writer_model = get_chat_model(
         model=writer_model_name, 
         model_provider=writer_provider, 
         azure_config=azure_config,
+        response_cache_path=configurable.response_cache_path,
         **writer_model_kwargs
     )
     structured_llm = writer_model.with_structured_output(Queries)
@@ -116,11 +156,25 @@ async def generate_report_plan(state: ReportState, config: RunnableConfig) -> Co
         number_of_queries=number_of_queries,
         today=get_today_str()
     )
-    results = await structured_llm.ainvoke([SystemMessage(content=system_instructions_query),
-                                     HumanMessage(content="Generate search queries that will help with planning the sections of the report.")])
-    
-    query_list = [query.search_query for query in results.queries]
-    source_str = await select_and_execute_search(search_api, query_list, params_to_pass)
+    async def search_for_planning() -> str:
+        results = await structured_llm.ainvoke([SystemMessage(content=system_instructions_query),
+                                         HumanMessage(content="Generate search queries that will help with planning the sections of the report.")])
+
+        query_list = [query.search_query for query in results.queries]
+        return await select_and_execute_search(search_api, query_list, params_to_pass, config)
+
+    source_str = state.get("planning_source_str")
+    if source_str is not None and feedback_list and not configurable.replan_from_scratch:
+        # a plan revised after feedback reuses the sources of the first planning searches
+        logger.info("Reusing the planning searches")
+    elif number_of_queries:
+        try:
+            source_str = await run_within(search_for_planning(), get_time_left(config, configurable.deadline, "planning_search"))
+        except asyncio.TimeoutError:
+            logger.warning("Planning searches cut short by the report deadline")
+    # without sources (e.g. the report budget is spent), plan without searching
+    planning_update = {"planning_source_str": source_str} if source_str is not None else {}
+    source_str = source_str or ""
     system_instructions_sections = report_planner_instructions.format(messages=get_buffer_string(messages), report_organization=report_structure, context=source_str, feedback=feedback)
 
     planner_provider = get_config_value(configurable.planner_provider)
@@ -131,6 +185,7 @@ async def generate_report_plan(state: ReportState, config: RunnableConfig) -> Co
         "azure_openai_endpoint": configurable.azure_openai_endpoint,
         "azure_openai_api_key": configurable.azure_openai_api_key,
         "azure_openai_api_version": configurable.azure_openai_api_version,
+        "model_routes": configurable.model_routes,
     }
 
     planner_message = """Generate the sections of the report. Your response must include a 'sections' field containing a list of sections. 
@@ -142,6 +197,7 @@ async def generate_report_plan(state: ReportState, config: RunnableConfig) -> Co
             model=planner_model, 
             model_provider=planner_provider, 
             azure_config=azure_config,
+            response_cache_path=configurable.response_cache_path,
             max_tokens=20_000, 
             thinking={"type": "enabled", "budget_tokens": 16_000}
         )
@@ -151,26 +207,62 @@ async def generate_report_plan(state: ReportState, config: RunnableConfig) -> Co
             model=planner_model, 
             model_provider=planner_provider,
             azure_config=azure_config,
+            response_cache_path=configurable.response_cache_path,
             **planner_model_kwargs
         )
     
     structured_llm = planner_llm.with_structured_output(Sections)
-    report_sections = await structured_llm.ainvoke([SystemMessage(content=system_instructions_sections),
-                                             HumanMessage(content=planner_message)])
-    sections = report_sections.sections
+    try:
+        report_sections = await run_within(structured_llm.ainvoke([SystemMessage(content=system_instructions_sections),
+                                                                   HumanMessage(content=planner_message)]),
+                                           get_time_left(config, configurable.deadline, "planning"))
+        sections = report_sections.sections
+    except asyncio.TimeoutError:
+        logger.warning("Report planning cut short by the report deadline, researching the request as one section")
+        sections = fallback_plan(get_buffer_string(messages))
 
     if sections_user_approval:
-        return Command(goto="human_feedback", update={"sections": sections})
+        # the clock stops while the plan waits for review, recorded in the state for a report resumed in another process
+        usage.pause()
+        return Command(goto="human_feedback", update={"sections": sections, **planning_update, "report_usage": usage.snapshot()})
     else:
-        return Command(goto=[
-            Send("build_section_with_web_research", {"messages": messages, "section": s, "search_iterations": 0}) 
-            for s in sections 
-            if s.research
-        ], update={"sections": sections})
-
-
-async def human_feedback(state: ReportState, config: RunnableConfig) -> Command[Literal["generate_report_plan","build_section_with_web_research"]]:
-    messages = state["messages"]
+        # a resumed thread does not research its completed sections again
+        sends, reused = section_research_sends(state, sections, configurable)
+        return Command(goto=sends or "gather_completed_sections",
+                       update={"sections": sections, "completed_sections": reused, **planning_update})
+
+
+def section_research_sends(state: ReportState, sections: list, configurable: WorkflowConfiguration) -> tuple[list[Send], list[SectionRecord]]:
+    """Send each research section not completed yet to the section sub-graph.
+
+    The conversation is formatted once into a text shared by every branch, and each
+    section is handed over as a compact record. Unless replan_from_scratch is set,
+    sections matching the research of an earlier plan reuse its draft, or are
+    rewritten from its draft and sources (see reuse_section_research).
+
+    Returns:
+        The Send() of each section to research, and the sections completed by reusing earlier drafts
+    """
+    completed = {s.name for s in state.get("completed_sections", [])}
+    reused, seeds = [], {}
+    if not configurable.replan_from_scratch:
+        reused, seeds = reuse_section_research(sections, completed, state.get("section_research", {}))
+        completed |= {s.name for s in reused}
+    messages_buffer = share_text(get_buffer_string(state["messages"]))
+    sends = []
+    for s in sections:
+        if not s.research or s.name in completed:
+            continue
+        payload = {"messages_buffer": messages_buffer, "section": SectionRecord.from_section(s), "search_iterations": 0,
+                   "report_usage": state.get("report_usage")}
+        if research := seeds.get(s.name):
+            payload["section"].content = research["content"]
+            payload["source_str"] = str(research.get("source_str", ""))
+        sends.append(Send("build_section_with_web_research", payload))
+    return sends, reused
+
+
+async def human_feedback(state: ReportState, config: RunnableConfig) -> Command[Literal["generate_report_plan","build_section_with_web_research","gather_completed_sections"]]:
     sections = state['sections']
     sections_str = "\n\n".join(
         f"Section: {section.name}\n"
@@ -181,25 +273,34 @@ async def human_feedback(state: ReportState, config: RunnableConfig) -> Command[
     interrupt_message = f"""Please provide feedback on the following report plan. 
                         \n\n{sections_str}\n
                         \nDoes the report plan meet your needs?\nPass 'true' to approve the report plan.\nOr, provide feedback to regenerate the report plan:"""
+    usage = track_report(state, config)
+    usage.pause()
     feedback = interrupt(interrupt_message)
+    usage.resume()
     if (isinstance(feedback, bool) and feedback is True) or (isinstance(feedback, str) and feedback.lower() == "true"):
-        return Command(goto=[
-            Send("build_section_with_web_research", {"messages": messages, "section": s, "search_iterations": 0}) 
-            for s in sections 
-            if s.research
-        ])
+        sends, reused = section_research_sends(state, sections, WorkflowConfiguration.from_runnable_config(config))
+        return Command(goto=sends or "gather_completed_sections", update={"completed_sections": reused, "report_usage": usage.snapshot()})
     elif isinstance(feedback, str):
         return Command(goto="generate_report_plan", 
-                       update={"feedback_on_report_plan": [feedback]})
+                       update={"feedback_on_report_plan": [feedback], "report_usage": usage.snapshot()})
     else:
         raise TypeError(f"Interrupt value of type {type(feedback)} is not supported.")
 
 
 async def generate_queries(state: SectionState, config: RunnableConfig):
-    messages = state["messages"]
+    messages_buffer = str(state["messages_buffer"])
     section = state["section"]
-    configurable = WorkflowConfiguration.from_runnable_config(config)
+    current_section.set(section.name)
+    track_report(state, config)
+    configurable = govern_budget(WorkflowConfiguration.from_runnable_config(config), config)
     number_of_queries = configurable.number_of_queries
+    time_left = get_time_left(config, configurable.deadline, "research")
+    if state.get("source_str") and not state["search_iterations"]:
+        # seeded with the research of an earlier plan, the section is rewritten from its sources
+        return {"search_queries": []}
+    if not number_of_queries or time_left == 0:
+        # the report budget or the research slice of the deadline is spent, the section is written from the sources it has
+        return {"search_queries": []}
     writer_provider = get_config_value(configurable.writer_provider)
     writer_model_name = get_config_value(configurable.writer_model)
     writer_model_kwargs = get_config_value(configurable.writer_model_kwargs or {})
@@ -208,44 +309,62 @@ async def generate_queries(state: SectionState, config: RunnableConfig):
         "azure_openai_endpoint": configurable.azure_openai_endpoint,
         "azure_openai_api_key": configurable.azure_openai_api_key,
         "azure_openai_api_version": configurable.azure_openai_api_version,
+        "model_routes": configurable.model_routes,
     }
     
     writer_model = get_chat_model(
         model=writer_model_name, 
         model_provider=writer_provider, 
         azure_config=azure_config,
+        response_cache_path=configurable.response_cache_path,
         **writer_model_kwargs
     )
     structured_llm = writer_model.with_structured_output(Queries)
-    system_instructions = query_writer_instructions.format(messages=get_buffer_string(messages), 
+    system_instructions = query_writer_instructions.format(messages=messages_buffer, 
                                                            section_topic=section.description, 
                                                            number_of_queries=number_of_queries,
                                                            today=get_today_str())
 
-    queries = await structured_llm.ainvoke([SystemMessage(content=system_instructions),
-                                     HumanMessage(content="Generate search queries on the provided topic.")])
+    try:
+        queries = await run_within(structured_llm.ainvoke([SystemMessage(content=system_instructions),
+                                                           HumanMessage(content="Generate search queries on the provided topic.")]),
+                                   time_left)
+    except asyncio.TimeoutError:
+        logger.warning("Queries of section %s cut short by the report deadline", section.name)
+        return {"search_queries": []}
     return {"search_queries": queries.queries}
 
 
 async def search_web(state: SectionState, config: RunnableConfig):
     search_queries = state["search_queries"]
+    current_section.set(state["section"].name)
+    track_report(state, config)
     configurable = WorkflowConfiguration.from_runnable_config(config)
     search_api = get_config_value(configurable.search_api)
     search_api_config = configurable.search_api_config or {}
     params_to_pass = get_search_params(search_api, search_api_config)
 
     query_list = [query.search_query for query in search_queries]
-    source_str = await select_and_execute_search(search_api, query_list, params_to_pass)
+    if not query_list:
+        return {"source_str": state.get("source_str", ""), "search_iterations": state["search_iterations"] + 1}
+    try:
+        source_str = await run_within(select_and_execute_search(search_api, query_list, params_to_pass, config, focus=state["section"].description),
+                                      get_time_left(config, configurable.deadline, "research"))
+    except asyncio.TimeoutError:
+        logger.warning("Searches of section %s cut short by the report deadline", state['section'].name)
+        source_str = state.get("source_str", "")
 
     return {"source_str": source_str, "search_iterations": state["search_iterations"] + 1}
 
 
 async def write_section(state: SectionState, config: RunnableConfig):
-    messages = state["messages"]
+    messages_buffer = str(state["messages_buffer"])
     section = state["section"]
+    current_section.set(section.name)
+    usage = track_report(state, config)
     source_str = state["source_str"]
-    configurable = WorkflowConfiguration.from_runnable_config(config)
-    section_writer_inputs_formatted = section_writer_inputs.format(messages=get_buffer_string(messages), 
+    configurable = govern_budget(WorkflowConfiguration.from_runnable_config(config), config)
+    section_writer_inputs_formatted = section_writer_inputs.format(messages=messages_buffer, 
                                                              section_name=section.name, 
                                                              section_topic=section.description, 
                                                              context=source_str, 
@@ -258,29 +377,58 @@ async def write_section(state: SectionState, config: RunnableConfig):
         "azure_openai_endpoint": configurable.azure_openai_endpoint,
         "azure_openai_api_key": configurable.azure_openai_api_key,
         "azure_openai_api_version": configurable.azure_openai_api_version,
+        "model_routes": configurable.model_routes,
     }
     
-    writer_model = get_chat_model(
+    writer_llm = get_chat_model(
         model=writer_model_name,
         model_provider=writer_provider,
         azure_config=azure_config,
         max_retries=configurable.max_structured_output_retries,
         **writer_model_kwargs
-    ).with_structured_output(SectionOutput)
+    )
+    writer_model = writer_llm.bind_tools([SectionOutput], tool_choice="SectionOutput")
+
+    def publish_section() -> Command:
+        update = {"completed_sections": [section],
+                  "section_research": research_record(section, state.get("search_queries", []), source_str=share_text(source_str)),
+                  "report_usage": usage.snapshot()}
+        if configurable.include_source_str:
+            update["source_str"] = source_str
+        return Command(update=update, goto=END)
 
-    section_content = await writer_model.ainvoke([SystemMessage(content=section_writer_instructions),
-                                           HumanMessage(content=section_writer_inputs_formatted)])
+    # Stream the section_content argument of the forced tool call as it is written
+    try:
+        section_message = await run_within(astream_section_tool_call(writer_model,
+                                                                     [SystemMessage(content=cacheable_prompt(writer_llm, section_writer_instructions)),
+                                                                      HumanMessage(content=section_writer_inputs_formatted)],
+                                                                     section.name,
+                                                                     tool_name="SectionOutput",
+                                                                     field="section_content"),
+                                           get_time_left(config, configurable.deadline, "research"))
+    except asyncio.TimeoutError:
+        # past the research slice of the deadline, the previous draft, if any, is published as incomplete
+        logger.warning("Section %s cut short by the report deadline", section.name)
+        section.content = mark_incomplete(section.name, section.content)
+        return publish_section()
+    section_content = SectionOutput(**section_message.tool_calls[0]["args"]) if section_message.tool_calls else SectionOutput(section_content=section_message.text)
     
     section.content = section_content.section_content
 
+    # at the maximum search depth, or once the research slice of the deadline is over,
+    # the section is published whatever its grade
+    if (state["search_iterations"] >= configurable.max_search_depth
+            or get_time_left(config, configurable.deadline, "research") == 0):
+        return publish_section()
+
     section_grader_message = ("Grade the report and consider follow-up questions for missing information. "
                               "If the grade is 'pass', return empty strings for all follow-up queries. "
                               "If the grade is 'fail', provide specific search queries to gather missing information.")
     
-    section_grader_instructions_formatted = section_grader_instructions.format(messages=get_buffer_string(messages), 
-                                                                               section_topic=section.description,
-                                                                               section=section.content, 
-                                                                               number_of_follow_up_queries=configurable.number_of_queries)
+    section_grader_inputs_formatted = section_grader_inputs.format(messages=messages_buffer, 
+                                                                   section_topic=section.description,
+                                                                   section=section.content, 
+                                                                   number_of_follow_up_queries=configurable.number_of_queries)
 
     planner_provider = get_config_value(configurable.planner_provider)
     planner_model = get_config_value(configurable.planner_model)
@@ -290,34 +438,59 @@ async def write_section(state: SectionState, config: RunnableConfig):
         "azure_openai_endpoint": configurable.azure_openai_endpoint,
         "azure_openai_api_key": configurable.azure_openai_api_key,
         "azure_openai_api_version": configurable.azure_openai_api_version,
+        "model_routes": configurable.model_routes,
     }
 
     if planner_model == "claude-3-7-sonnet-latest":
         # Allocate a thinking budget for claude-3-7-sonnet-latest as the planner model
-        reflection_model = get_chat_model(
+        reflection_llm = get_chat_model(
             model=planner_model, 
             model_provider=planner_provider, 
             azure_config=azure_config,
+            response_cache_path=configurable.response_cache_path,
             max_tokens=20_000, 
             thinking={"type": "enabled", "budget_tokens": 16_000}
-        ).with_structured_output(Feedback)
+        )
     else:
-        reflection_model = get_chat_model(
+        reflection_llm = get_chat_model(
             model=planner_model, 
             model_provider=planner_provider,
             azure_config=azure_config,
+            response_cache_path=configurable.response_cache_path,
             max_retries=configurable.max_structured_output_retries,
             **planner_model_kwargs
-        ).with_structured_output(Feedback)
+        )
+
+    grader_model = get_config_value(configurable.grader_model)
+    if grader_model:
+        # Cascade: a small model grades first and only uncertain grades reach the planner model
+        grader_llm = get_chat_model(
+            model=grader_model,
+            model_provider=get_config_value(configurable.grader_provider or configurable.planner_provider),
+            azure_config=azure_config,
+            response_cache_path=configurable.response_cache_path,
+            **get_config_value(configurable.grader_model_kwargs or {})
+        )
+        grading = cascade_grade_section(grader_llm,
+                                        reflection_llm,
+                                        section_grader_instructions,
+                                        section_grader_inputs_formatted + "\n" + section_grader_message,
+                                        float(configurable.grader_confidence_threshold),
+                                        config)
+    else:
+        reflection_model = reflection_llm.with_structured_output(Feedback)
 
-    feedback = await reflection_model.ainvoke([SystemMessage(content=section_grader_instructions_formatted),
-                                        HumanMessage(content=section_grader_message)])
+        grading = reflection_model.ainvoke([SystemMessage(content=cacheable_prompt(reflection_llm, section_grader_instructions)),
+                                            HumanMessage(content=section_grader_inputs_formatted + "\n" + section_grader_message)])
 
-    if feedback.grade == "pass" or state["search_iterations"] >= configurable.max_search_depth:
-        update = {"completed_sections": [section]}
-        if configurable.include_source_str:
-            update["source_str"] = source_str
-        return Command(update=update, goto=END)
+    try:
+        feedback = await run_within(grading, get_time_left(config, configurable.deadline, "research"))
+    except asyncio.TimeoutError:
+        # the section is written, it is published ungraded
+        return publish_section()
+
+    if feedback.grade == "pass":
+        return publish_section()
     else:
         return Command(
             update={"search_queries": feedback.follow_up_queries, "section": section},
@@ -326,7 +499,8 @@ async def write_section(state: SectionState, config: RunnableConfig):
 
 
 async def write_final_sections(state: SectionState, config: RunnableConfig):
-    configurable = WorkflowConfiguration.from_runnable_config(config)
+    usage = track_report(state, config)
+    configurable = govern_budget(WorkflowConfiguration.from_runnable_config(config), config)
     writer_provider = get_config_value(configurable.writer_provider)
     writer_model_name = get_config_value(configurable.writer_model)
     writer_model_kwargs = get_config_value(configurable.writer_model_kwargs or {})
@@ -335,6 +509,7 @@ async def write_final_sections(state: SectionState, config: RunnableConfig):
         "azure_openai_endpoint": configurable.azure_openai_endpoint,
         "azure_openai_api_key": configurable.azure_openai_api_key,
         "azure_openai_api_version": configurable.azure_openai_api_version,
+        "model_routes": configurable.model_routes,
     }
     
     writer_model = get_chat_model(
@@ -344,24 +519,37 @@ async def write_final_sections(state: SectionState, config: RunnableConfig):
         **writer_model_kwargs
     ) 
 
-    messages = state["messages"]
+    messages_buffer = str(state["messages_buffer"])
     section = state["section"]
-    completed_report_sections = state["report_sections_from_research"]
-    system_instructions = final_section_writer_instructions.format(messages=get_buffer_string(messages), 
-                                                                   section_name=section.name, 
-                                                                   section_topic=section.description, 
-                                                                   context=completed_report_sections)
-    section_content = await writer_model.ainvoke([SystemMessage(content=system_instructions),
-                                           HumanMessage(content="Generate a report section based on the provided sources.")])   
-    section.content = section_content.content
-    return {"completed_sections": [section]}
+    current_section.set(section.name)
+    completed_report_sections = str(state["report_sections_from_research"])
+    context_formatted = final_section_writer_context.format(messages=messages_buffer, 
+                                                            context=completed_report_sections)
+    inputs_formatted = final_section_writer_inputs.format(section_name=section.name, 
+                                                          section_topic=section.description)
+    try:
+        section_content = await run_within(astream_section(writer_model,
+                                                           [SystemMessage(content=cacheable_prompt(writer_model, final_section_writer_instructions)),
+                                                            HumanMessage(content=cacheable_prompt(writer_model, context_formatted,
+                                                                                                  inputs_formatted + "\nGenerate a report section based on the provided sources."))],
+                                                           section.name),
+                                           get_time_left(config, configurable.deadline, "writing"))
+        section.content = section_content.content
+    except asyncio.TimeoutError:
+        # the report is compiled on time without this section
+        logger.warning("Section %s cut short by the report deadline", section.name)
+        section.content = mark_incomplete(section.name, None)
+    return {"completed_sections": [section], "report_usage": usage.snapshot()}
 
 
 async def gather_completed_sections(state: ReportState):
-    completed_sections = state["completed_sections"]
+    # sections completed under the name of an earlier plan are left out
+    planned = {s.name for s in state["sections"]}
+    completed_sections = [s for s in state["completed_sections"] if s.name in planned]
     completed_report_sections = format_sections(completed_sections)
 
-    return {"report_sections_from_research": completed_report_sections}
+    # shared by the final section writers instead of copied into each of them
+    return {"report_sections_from_research": share_text(completed_report_sections)}
 
 
 async def compile_final_report(state: ReportState, config: RunnableConfig):
@@ -369,21 +557,29 @@ async def compile_final_report(state: ReportState, config: RunnableConfig):
     sections = state["sections"]
     completed_sections = {s.name: s.content for s in state["completed_sections"]}
     for section in sections:
-        section.content = completed_sections[section.name]
+        section.content = completed_sections.get(section.name) or mark_incomplete(section.name, None)
     all_sections = "\n\n".join([s.content for s in sections])
+    track_report(state, config)
+    usage = export_run_usage(config, configurable.usage_export_dir)
+    if usage["grading"].get("graded"):
+        logger.info("Grader cascade of the report: %d grades, %.0f%% escalated, %.0f%% agreement on escalations",
+                    usage["grading"]["graded"], 100 * usage["grading"]["escalation_rate"], 100 * usage["grading"]["agreement_rate"])
 
     if configurable.include_source_str:
-        return {"final_report": all_sections, "source_str": state["source_str"], "messages": [AIMessage(content=all_sections)]}
+        return {"final_report": all_sections, "source_str": state["source_str"], "usage": usage, "messages": [AIMessage(content=all_sections)]}
     else:
-        return {"final_report": all_sections, "messages": [AIMessage(content=all_sections)]}
+        return {"final_report": all_sections, "usage": usage, "messages": [AIMessage(content=all_sections)]}
 
 
 async def initiate_final_section_writing(state: ReportState):
+    completed = {s.name for s in state["completed_sections"]}
+    messages_buffer = share_text(get_buffer_string(state["messages"]))
     return [
-        Send("write_final_sections", {"messages": state["messages"], "section": s, "report_sections_from_research": state["report_sections_from_research"]}) 
+        Send("write_final_sections", {"messages_buffer": messages_buffer, "section": SectionRecord.from_section(s), "report_sections_from_research": state["report_sections_from_research"],
+                                      "report_usage": state.get("report_usage")})
         for s in state["sections"] 
-        if not s.research
-    ]
+        if not s.research and s.name not in completed
+    ] or "compile_final_report"
 
 
 ## Graph
@@ -396,6 +592,7 @@ section_builder.add_edge("generate_queries", "search_web")
 section_builder.add_edge("search_web", "write_section")
 
 builder = StateGraph(ReportState, input=ReportStateInput, output=ReportStateOutput, config_schema=WorkflowConfiguration)
+builder.add_node("start_report", start_report)
 builder.add_node("clarify_with_user", clarify_with_user)
 builder.add_node("generate_report_plan", generate_report_plan)
 builder.add_node("human_feedback", human_feedback)
@@ -403,10 +600,11 @@ builder.add_node("build_section_with_web_research", section_builder.compile())
 builder.add_node("gather_completed_sections", gather_completed_sections)
 builder.add_node("write_final_sections", write_final_sections)
 builder.add_node("compile_final_report", compile_final_report)
-builder.add_conditional_edges(START, initial_router, ["clarify_with_user", "generate_report_plan"])
+builder.add_edge(START, "start_report")
+builder.add_conditional_edges("start_report", initial_router, ["clarify_with_user", "generate_report_plan"])
 builder.add_edge("clarify_with_user", END)
 builder.add_edge("build_section_with_web_research", "gather_completed_sections")
-builder.add_conditional_edges("gather_completed_sections", initiate_final_section_writing, ["write_final_sections"])
+builder.add_conditional_edges("gather_completed_sections", initiate_final_section_writing, ["write_final_sections", "compile_final_report"])
 builder.add_edge("write_final_sections", "compile_final_report")
 builder.add_edge("compile_final_report", END)
-workflow = builder.compile()
\ No newline at end of file
+workflow = builder.compile(checkpointer=get_checkpointer())
\ No newline at end of file
@@ -15,4 +15,8 @@ def pytest_addoption(parser):
     parser.addoption("--planner-model", action="store", help="Model for planning")
     parser.addoption("--writer-provider", action="store", help="Provider for writer model")
     parser.addoption("--writer-model", action="store", help="Model for writing")
-    parser.addoption("--max-search-depth", action="store", help="Maximum search depth")
\ No newline at end of file
+    parser.addoption("--grader-provider", action="store", help="Provider for the section grader model")
+    parser.addoption("--grader-model", action="store", help="Small model that grades sections before escalating to the planner model")
+    parser.addoption("--max-search-depth", action="store", help="Maximum search depth")
+    parser.addoption("--response-cache-path", action="store", help="SQLite file for caching structured LLM responses across runs")
+    parser.addoption("--checkpoint-db", action="store", help="SQLite file of a durable checkpointer used instead of the in-memory one")
@@ -33,8 +33,12 @@ def main():
     parser.add_argument("--planner-model", help="Model for planner in graph-based agent (e.g., 'claude-3-7-sonnet-latest')")
     parser.add_argument("--writer-provider", help="Provider for writer model (e.g., 'anthropic')")
     parser.add_argument("--writer-model", help="Model for writer in graph-based agent (e.g., 'claude-3-5-sonnet-latest')")
+    parser.add_argument("--grader-provider", help="Provider for the section grader model (e.g., 'anthropic')")
+    parser.add_argument("--grader-model", help="Small model grading sections before the planner model in graph-based agent (e.g., 'claude-3-5-haiku-latest')")
     parser.add_argument("--eval-model", help="Model for evaluating report quality (default: openai:claude-3-7-sonnet-latest)")
     parser.add_argument("--max-search-depth", help="Maximum search depth for graph agent")
+    parser.add_argument("--response-cache-path", help="SQLite file for caching structured LLM responses across runs")
+    parser.add_argument("--checkpoint-db", help="SQLite file of a durable checkpointer, to resume interrupted runs")
     
     # Search API configuration
     parser.add_argument("--search-api", choices=["tavily", "duckduckgo"], 
@@ -155,12 +159,20 @@ def add_model_configs(cmd, args):
         cmd.append(f"--writer-provider={args.writer_provider}")
     if args.writer_model:
         cmd.append(f"--writer-model={args.writer_model}")
+    if args.grader_provider:
+        cmd.append(f"--grader-provider={args.grader_provider}")
+    if args.grader_model:
+        cmd.append(f"--grader-model={args.grader_model}")
     if args.eval_model:
         cmd.append(f"--eval-model={args.eval_model}")
     if args.search_api:
         cmd.append(f"--search-api={args.search_api}")
     if args.max_search_depth:
         cmd.append(f"--max-search-depth={args.max_search_depth}")
+    if args.response_cache_path:
+        cmd.append(f"--response-cache-path={args.response_cache_path}")
+    if args.checkpoint_db:
+        cmd.append(f"--checkpoint-db={args.checkpoint_db}")
 
 if __name__ == "__main__":
     sys.exit(main() or 0)
\ No newline at end of file
@@ -0,0 +1,206 @@
+"""Unit tests of the LLM and search usage accounting."""
+
+import contextvars
+import uuid
+from collections import OrderedDict
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from open_deep_research import accounting
+from open_deep_research.accounting import (
+    RunUsage,
+    UsageCallbackHandler,
+    current_section,
+    get_config_usage,
+    get_model_price,
+    get_run_usage,
+    merge_report_usage,
+    start_config_usage,
+    start_run_usage,
+    track_report,
+    track_search,
+)
+from open_deep_research.response_cache import RESPONSE_CACHE_HIT_KEY
+
+
+def _response(model: str, input_tokens: int, output_tokens: int, cache_read: int = 0) -> LLMResult:
+    message = AIMessage(
+        content="ok",
+        usage_metadata={
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "input_token_details": {"cache_read": cache_read},
+        },
+        response_metadata={"model_name": model},
+    )
+    return LLMResult(generations=[[ChatGeneration(message=message)]])
+
+
+def test_model_prices_match_longest_name():
+    assert get_model_price("gpt-4o-mini-2024-07-18") == get_model_price("gpt-4o-mini")
+    assert get_model_price("my-gpt-4o-deployment") == get_model_price("gpt-4o")
+    assert get_model_price("unknown-model") is None
+
+
+def test_llm_calls_are_recorded_by_node_section_and_model():
+    handler = UsageCallbackHandler()
+    thread_id = f"test-{uuid.uuid4()}"
+    run_id = uuid.uuid4()
+    token = current_section.set("Introduction")
+    try:
+        handler.on_chat_model_start(
+            {}, [], run_id=run_id, metadata={"thread_id": thread_id, "langgraph_node": "write_section"},
+            invocation_params={"model": "gpt-4o"},
+        )
+    finally:
+        current_section.reset(token)
+    handler.on_llm_end(_response("gpt-4o", 1_000_000, 100_000, cache_read=200_000), run_id=run_id)
+
+    usage = get_run_usage(thread_id).to_dict()
+    assert usage["llm"]["calls"] == 1
+    assert usage["llm"]["cached_tokens"] == 200_000
+    # 800k uncached and 200k cached input tokens, 100k output tokens
+    assert usage["llm"]["cost"] == pytest.approx(0.8 * 2.50 + 0.2 * 1.25 + 0.1 * 10.00)
+    assert usage["llm_cache_hit_rate"] == pytest.approx(0.2)
+    assert usage["llm_by_node"]["write_section"]["calls"] == 1
+    assert usage["llm_by_section"]["Introduction"]["calls"] == 1
+    assert usage["llm_by_model"]["gpt-4o"]["calls"] == 1
+
+
+def test_failed_calls_and_searches_are_recorded():
+    handler = UsageCallbackHandler()
+    thread_id = f"test-{uuid.uuid4()}"
+    run_id = uuid.uuid4()
+    handler.on_chat_model_start({}, [], run_id=run_id, metadata={"thread_id": thread_id}, invocation_params={"model": "unpriced"})
+    handler.on_llm_error(RuntimeError("429"), run_id=run_id)
+
+    config = {"configurable": {"thread_id": thread_id}, "metadata": {"langgraph_node": "search_web"}}
+    with track_search(config, "tavily", ["a", "b"]) as stats:
+        stats.results = 5
+
+    usage = get_run_usage(thread_id).to_dict()
+    assert usage["llm"]["retries"] == 1
+    assert usage["llm"]["calls"] == 0
+    assert usage["search"]["queries"] == 2
+    assert usage["search"]["results"] == 5
+    assert usage["search_by_api"]["tavily"]["calls"] == 1
+    assert usage["search_by_node"]["search_web"]["calls"] == 1
+
+
+def test_response_cache_hits_cost_nothing():
+    handler = UsageCallbackHandler()
+    thread_id = f"test-{uuid.uuid4()}"
+    run_id = uuid.uuid4()
+    response = _response("gpt-4o", 1_000_000, 100_000)
+    response.generations[0][0].message.response_metadata[RESPONSE_CACHE_HIT_KEY] = True
+    handler.on_chat_model_start({}, [], run_id=run_id, metadata={"thread_id": thread_id}, invocation_params={"model": "gpt-4o"})
+    handler.on_llm_end(response, run_id=run_id)
+
+    usage = get_run_usage(thread_id).to_dict()
+    assert usage["llm"]["calls"] == 1
+    assert usage["llm"]["response_cache_hits"] == 1
+    assert usage["llm"]["input_tokens"] == 0
+    assert usage["llm"]["cost"] == 0
+
+
+def test_each_report_starts_a_new_usage_and_clock():
+    config = {"configurable": {"thread_id": f"test-{uuid.uuid4()}"}}
+    first = start_config_usage(config)
+    first.llm.cost = 1.0
+    first.started_at -= 100
+    assert get_config_usage(config) is first
+
+    second = start_config_usage(config)
+    assert get_config_usage(config) is second
+    assert second.report_id != first.report_id
+    assert second.llm.cost == 0
+    assert second.elapsed() < 1
+
+
+def test_paused_time_is_not_elapsed():
+    usage = RunUsage("test")
+    usage.started_at -= 1010
+    usage.pause()
+    usage.pause()
+    usage._paused_at -= 1000
+    usage.resume()
+    usage.resume()
+    assert usage.paused == pytest.approx(1000, abs=1)
+    assert usage.elapsed() == pytest.approx(10, abs=1)
+
+
+def _in_node(state: dict, call):
+    """Run a call the way a graph node does, in its own context, after track_report."""
+    def node():
+        track_report(state)
+        return call()
+    return contextvars.copy_context().run(node)
+
+
+def test_concurrent_reports_without_a_thread_id_keep_their_own_usage():
+    handler = UsageCallbackHandler()
+    first, second = (start_run_usage(None).snapshot() for _ in range(2))
+
+    def llm_call():
+        run_id = uuid.uuid4()
+        handler.on_chat_model_start({}, [], run_id=run_id, metadata={}, invocation_params={"model": "gpt-4o"})
+        handler.on_llm_end(_response("gpt-4o", 1_000_000, 0), run_id=run_id)
+        return get_config_usage({})
+
+    assert _in_node({"report_usage": first}, llm_call).report_id == first["report_id"]
+    assert _in_node({"report_usage": first}, llm_call).llm.calls == 2
+    assert _in_node({"report_usage": second}, llm_call).llm.calls == 1
+
+
+def test_report_resumed_in_a_new_process_gets_its_spend_and_clock_back(monkeypatch):
+    usage = start_run_usage(f"test-{uuid.uuid4()}")
+    usage.llm.cost = 0.5
+    usage.started_at -= 100
+    usage.paused = 40
+    snapshot = usage.snapshot()
+
+    # a new process holds no report
+    monkeypatch.setattr(accounting, "_RUN_USAGES", OrderedDict())
+    monkeypatch.setattr(accounting, "_THREAD_REPORTS", OrderedDict())
+    resumed = _in_node({"report_usage": snapshot}, lambda: get_config_usage({"configurable": {"thread_id": usage.thread_id}}))
+    assert resumed is not usage
+    assert resumed.report_id == usage.report_id
+    assert resumed.llm.cost == 0.5
+    assert resumed.elapsed() == pytest.approx(60, abs=1)
+
+
+def test_report_usage_snapshots_of_parallel_branches_are_merged():
+    usage = start_run_usage(None)
+    usage.llm.input_tokens = 100
+    first = usage.snapshot()
+    usage.llm.input_tokens = 300
+    usage.search.queries = 2
+    latest = usage.snapshot()
+
+    merged = merge_report_usage(merge_report_usage(first, latest), first)
+    assert (merged["llm"]["input_tokens"], merged["search"]["queries"]) == (300, 2)
+    assert merged["updated_at"] == latest["updated_at"]
+    # a new report replaces the snapshot, an empty update keeps it
+    new_report = start_run_usage(None).snapshot()
+    assert merge_report_usage(merged, new_report) == new_report
+    assert merge_report_usage(new_report, None) == new_report
+
+
+def test_grading_cascade_is_counted_per_report(monkeypatch):
+    first, second = start_run_usage(None), start_run_usage(None)
+    first.record_grading("graded", "escalated", "agreed")
+    first.record_grading("graded", "accepted_pass")
+    second.record_grading("graded", "grader_errors", "escalated")
+
+    stats = first.to_dict()["grading"]
+    assert (stats["graded"], stats["escalation_rate"], stats["agreement_rate"]) == (2, 0.5, 1.0)
+    assert second.grading_stats()["graded"] == 1
+
+    # the counters are kept in the snapshot of the report
+    monkeypatch.setattr(accounting, "_RUN_USAGES", OrderedDict())
+    monkeypatch.setattr(accounting, "_THREAD_REPORTS", OrderedDict())
+    resumed = _in_node({"report_usage": first.snapshot()}, lambda: get_config_usage({}))
+    assert resumed.grading == first.grading
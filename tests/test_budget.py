@@ -0,0 +1,89 @@
+"""Unit tests of the report budget governor."""
+
+import contextvars
+import uuid
+from collections import OrderedDict
+
+import pytest
+
+from open_deep_research import accounting
+from open_deep_research.accounting import RunUsage, get_config_usage, start_config_usage, track_report
+from open_deep_research.budget import get_budget_level, get_budget_pressure, govern_budget
+from open_deep_research.configuration import MultiAgentConfiguration, WorkflowConfiguration
+
+
+def _report(cost: float) -> dict:
+    """Config of a new report that already spent ``cost`` USD."""
+    config = {"configurable": {"thread_id": f"test-{uuid.uuid4()}"}}
+    start_config_usage(config).llm.cost = cost
+    return config
+
+
+def test_budget_levels_by_pressure():
+    assert [get_budget_level(p) for p in (0.0, 0.49, 0.5, 0.75, 0.9, 2.0)] == [0, 0, 1, 2, 3, 3]
+
+
+def test_largest_spent_share_is_the_pressure():
+    usage = RunUsage()
+    usage.llm.cost = 0.5
+    usage.llm.input_tokens = 900
+    assert get_budget_pressure(usage, token_budget=1000, cost_budget=1.0) == pytest.approx(0.9)
+    assert get_budget_pressure(usage) == 0.0
+
+
+def test_time_waiting_for_the_user_is_not_spent():
+    usage = RunUsage()
+    usage.started_at -= 60
+    usage.pause()
+    usage._paused_at -= 50
+    usage.resume()
+    assert get_budget_pressure(usage, time_budget=100) == pytest.approx(0.1, abs=0.01)
+
+
+def test_configuration_is_scaled_down_with_the_budget():
+    base = WorkflowConfiguration(cost_budget=1.0, number_of_queries=4, max_search_depth=3, economy_model="gpt-4o-mini")
+
+    assert govern_budget(base, _report(0.1)) is base
+
+    trimmed = govern_budget(base, _report(0.6))
+    assert (trimmed.number_of_queries, trimmed.max_search_depth) == (2, 1)
+    assert trimmed.planner_model == base.planner_model
+
+    economy = govern_budget(base, _report(0.8))
+    assert (economy.number_of_queries, economy.max_search_depth) == (1, 0)
+    assert economy.extractive_compression == "replace_summarization"
+    assert economy.writer_model == economy.planner_model == "gpt-4o-mini"
+
+    config = _report(0.95)
+    assert govern_budget(base, config).number_of_queries == 0
+    assert get_config_usage(config).budget["level"] == "exhausted"
+
+
+def test_multi_agent_economy_level_switches_both_agents():
+    base = MultiAgentConfiguration(cost_budget=1.0, economy_model="openai:gpt-4o-mini")
+    economy = govern_budget(base, _report(0.8))
+    assert economy.supervisor_model == economy.researcher_model == "openai:gpt-4o-mini"
+    assert economy.number_of_queries == 1
+
+
+def test_a_new_report_in_the_thread_has_its_full_budget():
+    base = WorkflowConfiguration(cost_budget=1.0)
+    config = _report(0.95)
+    assert govern_budget(base, config).number_of_queries == 0
+    start_config_usage(config)
+    assert govern_budget(base, config) is base
+
+
+def test_a_report_resumed_after_a_restart_keeps_its_spent_budget(monkeypatch):
+    base = WorkflowConfiguration(cost_budget=1.0)
+    config = _report(0.95)
+    state = {"report_usage": get_config_usage(config).snapshot()}
+
+    monkeypatch.setattr(accounting, "_RUN_USAGES", OrderedDict())
+    monkeypatch.setattr(accounting, "_THREAD_REPORTS", OrderedDict())
+
+    def node():
+        track_report(state, config)
+        return govern_budget(base, config)
+
+    assert contextvars.copy_context().run(node).number_of_queries == 0
@@ -0,0 +1,170 @@
+"""Unit tests of the SQLite checkpointer with small graphs (no model or search API calls)."""
+
+import asyncio
+import time
+from typing import Annotated, TypedDict
+
+from langgraph.graph import END, START, StateGraph
+from langgraph.types import Command, Send, interrupt
+
+from open_deep_research.checkpointing import SqliteCheckpointSaver
+from open_deep_research.payloads import SectionRecord, SharedText, share_text
+from open_deep_research.state import extend_or_reset
+
+
+class FanOutState(TypedDict):
+    context: SharedText
+    sections: list[SectionRecord]
+    completed: Annotated[list, extend_or_reset]
+
+
+def _fan_out_graph(checkpointer, calls, fail=()):
+    """Graph sending each section with a shared context to a writer, after a plan approval."""
+
+    def approve(state: FanOutState):
+        interrupt("approve?")
+        return Command(goto=[Send("write", {"context": state["context"], "sections": [s]}) for s in state["sections"]
+                             if s.name not in {c.name for c in state.get("completed", [])}] or END)
+
+    def write(state: FanOutState):
+        section = state["sections"][0]
+        calls.append(section.name)
+        if section.name in fail:
+            # fail once the other branches are done and checkpointed
+            time.sleep(0.2)
+            raise RuntimeError(f"{section.name} failed")
+        return {"completed": [SectionRecord(section.name, section.description, False, f"{section.name} of {state['context']}")]}
+
+    builder = StateGraph(FanOutState)
+    builder.add_node("start_report", lambda state: {"completed": None})
+    builder.add_node("approve", approve)
+    builder.add_node("write", write)
+    builder.add_edge(START, "start_report")
+    builder.add_edge("start_report", "approve")
+    return builder.compile(checkpointer=checkpointer)
+
+
+def _input(topic="solar power"):
+    return {
+        "context": share_text(f"context of {topic} " * 100),
+        "sections": [SectionRecord(name, "", True, "") for name in ("a", "b")],
+    }
+
+
+def test_checkpoints_round_trip_after_a_restart(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+    thread = {"configurable": {"thread_id": "1"}}
+    graph = _fan_out_graph(SqliteCheckpointSaver(path), [])
+    graph.invoke(_input(), thread)
+
+    # a new saver on the same file sees the interrupted run
+    state = _fan_out_graph(SqliteCheckpointSaver(path), []).get_state(thread)
+    assert state.next == ("approve",)
+    assert str(state.values["context"]).startswith("context of solar power")
+    assert state.values["sections"][1] == SectionRecord("b", "", True, "")
+    assert state.interrupts[0].value == "approve?"
+
+
+def test_failed_run_resumes_without_redoing_completed_sections(tmp_path):
+    saver = SqliteCheckpointSaver(str(tmp_path / "checkpoints.db"))
+    thread = {"configurable": {"thread_id": "1"}}
+    calls = []
+    graph = _fan_out_graph(saver, calls, fail={"b"})
+    graph.invoke(_input(), thread)
+    try:
+        graph.invoke(Command(resume=True), thread)
+    except RuntimeError:
+        pass
+    assert sorted(calls) == ["a", "b"]
+
+    calls.clear()
+    result = _fan_out_graph(saver, calls).invoke(None, thread)
+    # the successful branch was checkpointed and is not run again
+    assert calls == ["b"]
+    assert sorted(s.name for s in result["completed"]) == ["a", "b"]
+
+
+def test_new_report_in_a_thread_starts_without_completed_sections(tmp_path):
+    saver = SqliteCheckpointSaver(str(tmp_path / "checkpoints.db"))
+    thread = {"configurable": {"thread_id": "1"}}
+    calls = []
+    graph = _fan_out_graph(saver, calls)
+    graph.invoke(_input(), thread)
+    graph.invoke(Command(resume=True), thread)
+
+    calls.clear()
+    graph.invoke(_input("wind power"), thread)
+    assert graph.get_state(thread).values["completed"] == []
+    result = graph.invoke(Command(resume=True), thread)
+    assert sorted(calls) == ["a", "b"]
+    assert all("wind power" in s.content for s in result["completed"])
+
+
+def _count(saver, table):
+    return saver.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_async_runs_use_the_same_checkpoints(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+    thread = {"configurable": {"thread_id": "1"}}
+    asyncio.run(_fan_out_graph(SqliteCheckpointSaver(path), []).ainvoke(_input(), thread))
+
+    graph = _fan_out_graph(SqliteCheckpointSaver(path), [])
+    result = asyncio.run(graph.ainvoke(Command(resume=True), thread))
+    assert sorted(s.name for s in result["completed"]) == ["a", "b"]
+
+
+def test_prune_keeps_the_latest_checkpoints_of_each_thread(tmp_path):
+    saver = SqliteCheckpointSaver(str(tmp_path / "checkpoints.db"), max_checkpoints_per_thread=3)
+    for thread_id in ("1", "2"):
+        thread = {"configurable": {"thread_id": thread_id}}
+        graph = _fan_out_graph(saver, [])
+        graph.invoke(_input(), thread)
+        graph.invoke(Command(resume=True), thread)
+
+    # writing checkpoints never prunes
+    before = _count(saver, "checkpoints")
+    assert before > 6
+    deleted = saver.prune_storage()
+    assert deleted["checkpoints"] == before - 6
+    assert _count(saver, "checkpoints") == 6
+    # the latest state is still complete
+    values = _fan_out_graph(saver, []).get_state({"configurable": {"thread_id": "2"}}).values
+    assert sorted(s.name for s in values["completed"]) == ["a", "b"]
+
+
+def _age(saver, thread_id, days):
+    with saver.conn:
+        saver.conn.execute("UPDATE threads SET updated_at = updated_at - ? WHERE thread_id = ?", (days * 86400, thread_id))
+
+
+def test_prune_deletes_expired_threads(tmp_path):
+    saver = SqliteCheckpointSaver(str(tmp_path / "checkpoints.db"), max_age_days=1)
+    for thread_id in ("old", "new"):
+        _fan_out_graph(saver, []).invoke(_input(), {"configurable": {"thread_id": thread_id}})
+    _age(saver, "old", 2)
+
+    assert saver.prune_storage()["threads"] == 1
+    assert saver.get_tuple({"configurable": {"thread_id": "old"}}) is None
+    assert saver.get_tuple({"configurable": {"thread_id": "new"}}) is not None
+    assert _count(saver, "writes") == _count(saver, "writes WHERE thread_id = 'new'")
+
+
+def test_size_limit_keeps_recent_and_resumable_threads(tmp_path):
+    saver = SqliteCheckpointSaver(str(tmp_path / "checkpoints.db"), max_size_mb=0, max_age_days=None)
+    for thread_id in ("done", "interrupted", "recent"):
+        thread = {"configurable": {"thread_id": thread_id}}
+        graph = _fan_out_graph(saver, [])
+        graph.invoke(_input(), thread)
+        if thread_id != "interrupted":
+            graph.invoke(Command(resume=True), thread)
+    _age(saver, "done", 2)
+    _age(saver, "interrupted", 2)
+
+    assert saver.prune_storage()["threads"] == 1
+    assert saver.get_tuple({"configurable": {"thread_id": "done"}}) is None
+    # the run waiting for the plan approval can still be resumed
+    graph = _fan_out_graph(saver, [])
+    result = graph.invoke(Command(resume=True), {"configurable": {"thread_id": "interrupted"}})
+    assert sorted(s.name for s in result["completed"]) == ["a", "b"]
+    assert saver.get_tuple({"configurable": {"thread_id": "recent"}}) is not None
@@ -0,0 +1,69 @@
+"""Unit tests of the report deadline helpers."""
+
+import asyncio
+import contextvars
+import uuid
+from collections import OrderedDict
+
+import pytest
+
+from open_deep_research import accounting
+from open_deep_research.accounting import start_config_usage, track_report
+from open_deep_research.deadline import fallback_plan, get_time_left, run_within
+
+
+def test_time_left_counts_from_the_report_start_without_pauses():
+    config = {"configurable": {"thread_id": f"test-{uuid.uuid4()}"}}
+    usage = start_config_usage(config)
+    assert get_time_left(config, None, "planning") is None
+
+    usage.started_at -= 30
+    assert get_time_left(config, 100, "planning_search") == 0
+    assert get_time_left(config, 100, "research") == pytest.approx(45, abs=1)
+
+    # 20 seconds waiting for plan feedback are not counted
+    usage.pause()
+    usage._paused_at -= 20
+    usage.resume()
+    usage.started_at -= 20
+    assert get_time_left(config, 100, "research") == pytest.approx(45, abs=1)
+
+    # a new report in the thread gets the whole deadline
+    start_config_usage(config)
+    assert get_time_left(config, 100, "planning") == pytest.approx(20, abs=1)
+
+
+def test_deadline_of_a_report_resumed_in_a_new_process_excludes_the_plan_review(monkeypatch):
+    config = {"configurable": {"thread_id": f"test-{uuid.uuid4()}"}}
+    usage = start_config_usage(config)
+    usage.started_at -= 30
+    # the plan waits for review, as generate_report_plan records it in the state
+    usage.pause()
+    usage._paused_at -= 500
+    usage.started_at -= 500
+    state = {"report_usage": usage.snapshot()}
+
+    monkeypatch.setattr(accounting, "_RUN_USAGES", OrderedDict())
+    monkeypatch.setattr(accounting, "_THREAD_REPORTS", OrderedDict())
+
+    def human_feedback():
+        resumed = track_report(state, config)
+        resumed.resume()
+        return get_time_left(config, 100, "research")
+
+    assert contextvars.copy_context().run(human_feedback) == pytest.approx(45, abs=1)
+
+
+def test_run_within_cancels_late_calls():
+    async def slow():
+        await asyncio.sleep(1)
+        return "done"
+
+    assert asyncio.run(run_within(slow(), None)) == "done"
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(run_within(slow(), 0.01))
+
+
+def test_fallback_plan_researches_the_topic():
+    [section] = fallback_plan("solar power")
+    assert section.research and section.description == "solar power"
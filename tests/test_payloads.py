@@ -0,0 +1,45 @@
+"""Unit tests of the shared payloads of the section fan-outs and of their serializer."""
+
+import pytest
+from langgraph.types import Send
+
+from open_deep_research.payloads import (
+    COMPACT_TYPE,
+    CompactSerializer,
+    MissingSharedTextError,
+    SectionRecord,
+    share_text,
+)
+
+
+def test_compact_serializer_writes_shared_texts_once_by_id():
+    context = share_text("research context " * 200)
+    sends = [Send("write", {"context": context, "section": SectionRecord(name, "", True, "")}) for name in ("a", "b")]
+    serde = CompactSerializer()
+
+    type_, data, shared = serde.dumps_shared(sends)
+    assert type_ == COMPACT_TYPE
+    assert shared == {context.id: context.text}
+    assert len(data) < len(context.text)
+
+    restored = serde.loads_typed((type_, data))
+    assert restored[1].node == "write"
+    # the live shared text is reused, not a copy
+    assert restored[0].arg["context"] is context
+    assert restored[1].arg["section"] == SectionRecord("b", "", True, "")
+
+
+def test_compact_serializer_leaves_other_values_to_the_json_plus_serializer():
+    serde = CompactSerializer()
+    value = {"topic": "solar power", "queries": ["a", "b"]}
+    assert serde.dumps_typed(value)[0] == "msgpack"
+    assert serde.loads_typed(serde.dumps_typed(value)) == value
+    assert serde.loads_typed(serde.dumps_typed(None)) is None
+
+
+def test_missing_shared_texts_fail_loudly():
+    serde = CompactSerializer()
+    type_, data, _ = serde.dumps_shared({"context": share_text("context of a pruned thread " * 50)})
+    # the shared text is no longer alive, and no loader stores it
+    with pytest.raises(MissingSharedTextError):
+        serde.loads_typed((type_, data))
@@ -0,0 +1,95 @@
+"""Unit tests of the adaptive (AIMD) concurrency limiter of LLM calls."""
+
+import asyncio
+
+import pytest
+
+from open_deep_research.rate_limiting import AIMDLimiter, get_llm_limiter, is_rate_limit_error
+
+
+def test_limit_increases_by_one_per_window_of_successful_calls():
+    async def run():
+        limiter = AIMDLimiter(max_concurrency=8, initial_concurrency=4)
+        for _ in range(4):
+            await limiter.release(await limiter.acquire())
+        return limiter
+
+    limiter = asyncio.run(run())
+    # 4 + 1/4 + 1/4.25 + 1/4.49 + 1/4.71: about one slot more
+    assert limiter.limit == pytest.approx(4.92, abs=0.01)
+    assert limiter.metrics()["in_flight"] == 0
+    assert limiter.acquired == 4
+
+
+def test_burst_of_throttled_calls_halves_the_limit_once():
+    async def run():
+        limiter = AIMDLimiter(max_concurrency=8)
+        started = [await limiter.acquire() for _ in range(3)]
+        for started_at in started:
+            await limiter.release(started_at, throttled=True, success=False)
+        after_burst = limiter.limit
+        # a call started after the decrease is counted again
+        await limiter.release(await limiter.acquire(), throttled=True, success=False)
+        return limiter, after_burst
+
+    limiter, after_burst = asyncio.run(run())
+    assert after_burst == 4.0
+    assert limiter.limit == 2.0
+    assert limiter.throttled == 4
+
+
+def test_limit_stays_within_bounds():
+    async def run():
+        limiter = AIMDLimiter(max_concurrency=2, min_concurrency=1)
+        for _ in range(10):
+            await limiter.release(await limiter.acquire())
+        high = limiter.limit
+        for _ in range(5):
+            await limiter.release(await limiter.acquire(), throttled=True, success=False)
+        return high, limiter.limit
+
+    assert asyncio.run(run()) == (2.0, 1.0)
+
+
+def test_calls_wait_for_a_free_slot():
+    async def run():
+        limiter = AIMDLimiter(max_concurrency=2)
+        running = peak = 0
+
+        async def call():
+            nonlocal running, peak
+            started_at = await limiter.acquire()
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            await limiter.release(started_at, success=False)
+
+        await asyncio.gather(*(call() for _ in range(6)))
+        return peak
+
+    assert asyncio.run(run()) == 2
+
+
+def test_limiters_are_kept_per_event_loop():
+    async def get():
+        return get_llm_limiter(("test", "model", None), 4)
+
+    first = asyncio.run(get())
+    assert first is not asyncio.run(get())
+
+    async def use(limiter):
+        await limiter.release(await limiter.acquire())
+
+    asyncio.run(use(first))
+    with pytest.raises(RuntimeError):
+        asyncio.run(use(first))
+
+
+def test_rate_limit_errors_are_recognized():
+    class StatusError(Exception):
+        status_code = 429
+
+    assert is_rate_limit_error(StatusError())
+    assert is_rate_limit_error(RuntimeError("Rate limit reached for requests"))
+    assert not is_rate_limit_error(ValueError("invalid schema"))
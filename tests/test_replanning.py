@@ -0,0 +1,136 @@
+"""Unit tests of the reuse of section research when a report is planned again."""
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, START, StateGraph
+from langgraph.types import Command
+
+from open_deep_research.deadline import INCOMPLETE_SECTION_MARKER
+from open_deep_research.graph import human_feedback, start_report
+from open_deep_research.payloads import SectionRecord
+from open_deep_research.replanning import match_sections, research_record, reuse_section_research
+from open_deep_research.state import ReportState, Section
+from open_deep_research.workflow import workflow
+
+
+def _section(name: str, description: str, content: str = "") -> Section:
+    return Section(name=name, description=description, research=True, content=content)
+
+
+SOLAR = _section("Solar power", "Cost and efficiency of photovoltaic panels", "## Solar power\n\nPanels are cheap.")
+WIND = _section("Wind power", "Onshore and offshore wind turbines and their capacity factors", "## Wind power\n\nTurbines.")
+
+
+def _research(*sections: Section) -> dict:
+    research = {}
+    for section in sections:
+        research.update(research_record(section, ["query"], source_refs=[f"ref-{section.name}"]))
+    return research
+
+
+def test_identical_sections_reuse_their_draft_under_the_new_name():
+    planned = [_section("Solar power costs", SOLAR.description), _section("Geothermal", "Heat pumps and deep wells")]
+    reused, seeds = reuse_section_research(planned, set(), _research(SOLAR, WIND))
+
+    assert reused == [SectionRecord("Solar power costs", SOLAR.description, True, "## Solar power costs\n\nPanels are cheap.")]
+    assert seeds == {}
+
+
+def test_similar_and_incomplete_sections_are_rewritten_from_their_research():
+    incomplete = _section(WIND.name, WIND.description, f"{WIND.content}\n\n{INCOMPLETE_SECTION_MARKER}")
+    planned = [
+        _section("Solar power", "Cost of photovoltaic panels and their efficiency over time"),
+        _section(WIND.name, WIND.description),
+    ]
+    reused, seeds = reuse_section_research(planned, set(), _research(SOLAR, incomplete))
+
+    assert reused == []
+    assert seeds["Solar power"]["source_refs"] == ["ref-Solar power"]
+    assert seeds["Solar power"]["search_queries"] == ["query"]
+    assert seeds[WIND.name]["content"] == WIND.content
+
+
+def test_sections_are_matched_one_to_one_and_kept_sections_are_not_reused():
+    planned = [_section("Solar A", SOLAR.description), _section("Solar B", SOLAR.description)]
+    assert len(match_sections(planned, _research(SOLAR))) == 1
+
+    # Solar power is still in the plan and completed, its research is not reused for another section
+    reused, seeds = reuse_section_research([SOLAR, _section("Solar B", SOLAR.description)], {SOLAR.name}, _research(SOLAR))
+    assert reused == [] and seeds == {}
+
+
+def _report_graph(plans: list, researched: list):
+    """Report graph with the real start_report and human_feedback nodes and stub planning and research."""
+
+    def generate_report_plan(state: ReportState):
+        return Command(goto="human_feedback", update={"sections": plans.pop(0)})
+
+    def build_section_with_web_research(state: dict):
+        section = state["section"]
+        researched.append((section.name, bool(state.get("source_refs"))))
+        section = SectionRecord(section.name, section.description, True, section.content or f"## {section.name}\n\nNew.")
+        return {"completed_sections": [section], "section_research": research_record(section, [], source_refs=[section.name])}
+
+    builder = StateGraph(ReportState)
+    builder.add_node("start_report", start_report)
+    builder.add_node("generate_report_plan", generate_report_plan)
+    builder.add_node("human_feedback", human_feedback)
+    builder.add_node("build_section_with_web_research", build_section_with_web_research)
+    builder.add_node("gather_completed_sections", lambda state: {})
+    builder.add_edge(START, "start_report")
+    builder.add_edge("start_report", "generate_report_plan")
+    builder.add_edge("build_section_with_web_research", "gather_completed_sections")
+    builder.add_edge("gather_completed_sections", END)
+    return builder.compile(checkpointer=MemorySaver())
+
+
+def test_next_report_on_the_same_topic_reuses_matching_sections():
+    plans = [
+        [SOLAR, WIND],
+        [_section("Solar power", SOLAR.description), _section("Grid storage", "Batteries and pumped hydro")],
+        [SOLAR],
+    ]
+    researched = []
+    graph = _report_graph(plans, researched)
+    thread = {"configurable": {"thread_id": "1", "reuse_earlier_reports": True}}
+
+    graph.invoke({"topic": "renewables"}, thread)
+    graph.invoke(Command(resume=True), thread)
+    assert sorted(researched) == [("Solar power", False), ("Wind power", False)]
+
+    # a report on the same topic only researches the new section
+    researched.clear()
+    graph.invoke({"topic": "renewables"}, thread)
+    result = graph.invoke(Command(resume=True), thread)
+    assert researched == [("Grid storage", False)]
+    assert {s.name for s in result["completed_sections"]} == {"Solar power", "Grid storage"}
+
+    # a report on another topic does not reuse anything
+    researched.clear()
+    graph.invoke({"topic": "nuclear power"}, thread)
+    graph.invoke(Command(resume=True), thread)
+    assert researched == [("Solar power", False)]
+
+
+def test_next_report_does_not_reuse_sections_unless_enabled():
+    plans = [[SOLAR, WIND], [SOLAR]]
+    researched = []
+    graph = _report_graph(plans, researched)
+    thread = {"configurable": {"thread_id": "1"}}
+
+    for _ in range(2):
+        graph.invoke({"topic": "renewables"}, thread)
+        graph.invoke(Command(resume=True), thread)
+    assert sorted(researched) == [("Solar power", False), ("Solar power", False), ("Wind power", False)]
+
+
+def test_workflow_keeps_section_research_for_the_same_conversation_only():
+    config = {"configurable": {"reuse_earlier_reports": True}}
+    conversation = [HumanMessage(content="renewables"), AIMessage(content="report")]
+    state = {"messages": conversation + [HumanMessage(content="more on solar")], "research_topic": "renewables"}
+    assert "section_research" not in workflow.start_report(state, config)
+
+    update = workflow.start_report({**state, "messages": [HumanMessage(content="nuclear power")]}, config)
+    assert (update["research_topic"], update["section_research"]) == ("nuclear power", None)
+    # without reuse_earlier_reports every report starts without section research
+    assert workflow.start_report(state, {"configurable": {}})["section_research"] is None
@@ -17,8 +17,10 @@ from langgraph.checkpoint.memory import MemorySaver
 from langgraph.types import Command
 
 # Import the report generation agents
+from open_deep_research.checkpointing import get_checkpointer
 from open_deep_research.graph import builder
 from open_deep_research.multi_agent import supervisor_builder
+from open_deep_research.response_cache import get_response_cache_stats
 
 # Initialize rich console with force_terminal to ensure output even when pytest captures stdout
 console = Console(force_terminal=True, width=120)
@@ -95,6 +97,16 @@ def eval_model(request):
     """Get the evaluation model from command line or environment variable."""
     return request.config.getoption("--eval-model") or os.environ.get("EVAL_MODEL", "anthropic:claude-3-7-sonnet-latest")
 
+@pytest.fixture
+def response_cache_path(request):
+    """Get the LLM response cache file from command line or environment variable (disabled if unset)."""
+    return request.config.getoption("--response-cache-path") or os.environ.get("RESPONSE_CACHE_PATH")
+
+@pytest.fixture
+def checkpoint_db(request):
+    """Get the SQLite file of the durable checkpointer from command line or environment variable (in-memory if unset)."""
+    return request.config.getoption("--checkpoint-db") or os.environ.get("CHECKPOINT_DB_PATH")
+
 @pytest.fixture
 def models(request, research_agent):
     """Get model configurations based on agent type."""
@@ -131,13 +143,21 @@ def models(request, research_agent):
                 request.config.getoption("--max-search-depth") or 
                 os.environ.get("MAX_SEARCH_DEPTH", "2")
             ),
+            "grader_provider": (
+                request.config.getoption("--grader-provider") or 
+                os.environ.get("GRADER_PROVIDER")
+            ),
+            "grader_model": (
+                request.config.getoption("--grader-model") or 
+                os.environ.get("GRADER_MODEL")
+            ),
         }
 
 # Note: Command line options are defined in conftest.py
 # These fixtures still work with options defined there
 
 @pytest.mark.langsmith
-def test_response_criteria_evaluation(research_agent, search_api, models, eval_model):
+def test_response_criteria_evaluation(research_agent, search_api, models, eval_model, response_cache_path, checkpoint_db):
     """Test if a report meets the specified quality criteria."""
     console.print(Panel.fit(
         f"[bold blue]Testing {research_agent} report generation with {search_api} search[/bold blue]",
@@ -166,13 +186,14 @@ def test_response_criteria_evaluation(research_agent, search_api, models, eval_m
     })
  
     # Run the appropriate agent based on the parameter
+    grader_stats = {}
     if research_agent == "multi_agent":
 
         # Initial messages
         initial_msg = [{"role": "user", "content": "Give me a high-level overview of MCP (model context protocol). Keep the report to 3 main body sections. One section on the origins of MPC, one section on interesting examples of MCP servers, and one section on the future roadmap for MCP. Report should be written for a developer audience."}]
 
         # Checkpointer for the multi-agent approach
-        checkpointer = MemorySaver()
+        checkpointer = get_checkpointer(checkpoint_db) if checkpoint_db else MemorySaver()
         graph = supervisor_builder.compile(checkpointer=checkpointer)
 
         # Create configuration with the provided parameters
@@ -183,6 +204,7 @@ def test_response_criteria_evaluation(research_agent, search_api, models, eval_m
             "researcher_model": models.get("researcher_model"),
             "ask_for_clarification": False, # Don't ask for clarification from the user and proceed to write the report
             "process_search_results": "summarize", # Optionally summarize 
+            "response_cache_path": response_cache_path,
         }
         
         thread_config = {"configurable": config}
@@ -201,7 +223,7 @@ def test_response_criteria_evaluation(research_agent, search_api, models, eval_m
         topic_query = "Give me a high-level overview of MCP (model context protocol). Keep the report to 3 main body sections. One section on the origins of MPC, one section on interesting examples of MCP servers, and one section on the future roadmap for MCP. Report should be written for a developer audience."
    
         # Checkpointer for the graph approach
-        checkpointer = MemorySaver()
+        checkpointer = get_checkpointer(checkpoint_db) if checkpoint_db else MemorySaver()
         graph = builder.compile(checkpointer=checkpointer)
         
         # Configuration for the graph agent with provided parameters
@@ -213,6 +235,9 @@ def test_response_criteria_evaluation(research_agent, search_api, models, eval_m
             "writer_provider": models.get("writer_provider", "anthropic"),
             "writer_model": models.get("writer_model", "claude-3-5-sonnet-latest"),
             "max_search_depth": models.get("max_search_depth", 2),
+            "grader_provider": models.get("grader_provider"),
+            "grader_model": models.get("grader_model"),
+            "response_cache_path": response_cache_path,
         }}
         
         async def run_graph_agent(thread):    
@@ -232,6 +257,17 @@ def test_response_criteria_evaluation(research_agent, search_api, models, eval_m
             return report
     
         report = asyncio.run(run_graph_agent(thread))
+        # Grading cascade counters of the report, kept in its usage
+        grader_stats = graph.get_state(thread).values.get("usage", {}).get("grading", {})
+
+    # Report how many structured LLM calls were answered from the response cache
+    cache_stats = get_response_cache_stats()
+    for path, stats in cache_stats.items():
+        console.print(f"[dim]Response cache {path}: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)[/dim]")
+
+    # Report how often the section grader escalated to the planner model and how often both agreed
+    if grader_stats.get("graded"):
+        console.print(f"[dim]Grader cascade: {grader_stats['graded']} grades, {grader_stats['escalation_rate']:.0%} escalated, {grader_stats['agreement_rate']:.0%} agreement on escalations[/dim]")
 
     # Get evaluation LLM using the specified model
     criteria_eval_structured_llm = get_evaluation_llm(eval_model)
@@ -288,6 +324,8 @@ def test_response_criteria_evaluation(research_agent, search_api, models, eval_m
         "report_length": len(report),
         "section_count": len(section_headers),
         "section_headers": section_headers,
+        "response_cache_stats": cache_stats,
+        "grader_cascade_stats": grader_stats,
     })
     
     # Test passes if the evaluation criteria are met
@@ -0,0 +1,221 @@
+"""Unit tests of the local retrieval helpers (no model or search API calls)."""
+
+import asyncio
+import threading
+from typing import List
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from open_deep_research.retrieval import (
+    CachedEmbeddings,
+    ChunkIndex,
+    EmbeddingCache,
+    LexicalIndex,
+    content_hash,
+    extractive_compress,
+    select_top_chunks,
+    split_sentences,
+)
+from open_deep_research.utils import stitch_documents_by_url
+
+
+class CountingEmbeddings(Embeddings):
+    """Deterministic embeddings recording the texts they were asked to embed."""
+
+    def __init__(self):
+        self.embedded: List[str] = []
+
+    def _vector(self, text: str) -> List[float]:
+        return [float(len(text)), float(sum(map(ord, text)) % 97), 1.0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self.embedded.append(text)
+        return self._vector(text)
+
+
+def test_embedding_cache_round_trip_on_disk(tmp_path):
+    cache = EmbeddingCache("test-model", str(tmp_path))
+    cache.put_many(["a", "b"], np.array([[1, 2], [3, 4]], dtype=np.float32))
+    cache.put_many(["b", "c"], np.array([[9, 9], [5, 6]], dtype=np.float32))
+
+    reloaded = EmbeddingCache("test-model", str(tmp_path))
+    assert len(reloaded) == 3
+    found = reloaded.get_many(["a", "b", "c", "missing"])
+    assert set(found) == {"a", "b", "c"}
+    # vectors already cached are not overwritten
+    assert found["b"].tolist() == [3, 4]
+    assert found["c"].tolist() == [5, 6]
+
+
+def test_embedding_cache_writers_sharing_a_directory_stay_aligned(tmp_path):
+    # two caches on one directory, as two processes would open it
+    writers = [EmbeddingCache("test-model", str(tmp_path)) for _ in range(2)]
+
+    def write(cache, offset):
+        for i in range(100):
+            keys = [f"key-{(i + offset + j) % 150}" for j in range(3)]
+            cache.put_many(keys, np.array([[int(key[4:]), 1] for key in keys], dtype=np.float32))
+
+    threads = [threading.Thread(target=write, args=(cache, 50 * n)) for n, cache in enumerate(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    reloaded = EmbeddingCache("test-model", str(tmp_path))
+    assert len(reloaded) == 150
+    # each writer stored only the keys the other had not written yet
+    assert (tmp_path / "test-model" / "vectors.f32").stat().st_size == 150 * 2 * 4
+    found = reloaded.get_many([f"key-{i}" for i in range(150)])
+    assert all(found[f"key-{i}"].tolist() == [i, 1] for i in range(150))
+    # a writer reads the rows of the others when it writes
+    writers[0].put_many(["new"], np.array([[0, 0]], dtype=np.float32))
+    assert writers[0].get_many(["key-149"])["key-149"].tolist() == [149, 1]
+
+
+def test_in_memory_embedding_cache_keeps_the_latest_entries():
+    cache = EmbeddingCache("test-model", max_entries=4)
+    for i in range(6):
+        cache.put_many([str(i)], np.array([[i, i]], dtype=np.float32))
+
+    assert len(cache) == 4
+    assert set(cache.get_many([str(i) for i in range(6)])) == {"2", "3", "4", "5"}
+    assert cache.get_many(["5"])["5"].tolist() == [5, 5]
+
+
+def test_cached_embeddings_only_embed_new_texts():
+    model = CountingEmbeddings()
+    embeddings = CachedEmbeddings(model, EmbeddingCache("test-model"))
+
+    first = embeddings.embed_documents_array(["alpha", "beta", "alpha"])
+    second = embeddings.embed_documents_array(["beta", "gamma"])
+
+    assert model.embedded == ["alpha", "beta", "gamma"]
+    assert first.shape == (3, 3)
+    assert np.array_equal(first[1], second[0])
+    # queries are cached under their own key
+    embeddings.embed_query("alpha")
+    assert model.embedded[-1] == "alpha"
+
+
+def test_chunk_index_deduplicates_by_url_and_content():
+    model = CountingEmbeddings()
+    index = ChunkIndex(model)
+    chunks = [
+        Document(page_content="solar panels", metadata={"url": "https://a"}),
+        Document(page_content="solar panels", metadata={"url": "https://a"}),
+        Document(page_content="solar panels", metadata={"url": "https://b"}),
+    ]
+
+    assert index.add_documents(chunks) == 2
+    assert index.add_documents([Document(page_content="solar panels", metadata={"url": "https://b"})]) == 0
+    assert len(index) == 2
+    assert model.embedded == ["solar panels", "solar panels"]
+    assert index.documents[0].metadata["chunk_hash"] == content_hash("solar panels")
+
+
+def test_chunk_index_adds_and_reranks_asynchronously():
+    model = CountingEmbeddings()
+    index = ChunkIndex(CachedEmbeddings(model, EmbeddingCache("test-model")))
+    chunks = [
+        Document(page_content="solar panels", metadata={"url": "https://a"}),
+        Document(page_content="wind turbines offshore", metadata={"url": "https://b"}),
+    ]
+
+    async def search():
+        # two searches of the run adding the same chunks at once
+        added = await asyncio.gather(index.aadd_documents(chunks), index.aadd_documents(list(chunks)))
+        return added, await index.arerank(["solar panels"], k=1)
+
+    added, result = asyncio.run(search())
+    assert sorted(added) == [0, 2]
+    assert len(index) == 2
+    assert [doc.page_content for doc in result.per_query["solar panels"]] == ["solar panels"]
+    assert result.merged == index.rerank(["solar panels"], k=1).merged
+
+
+def test_select_top_chunks_merges_queries_by_best_score():
+    documents = [Document(page_content=str(i), metadata={"url": f"https://{i % 2}"}) for i in range(4)]
+    scores = np.array([[0.9, 0.1, 0.5, 0.2], [0.3, 0.8, 0.95, 0.0]])
+
+    result = select_top_chunks(documents, ["q1", "q2"], scores, k=2)
+    assert [doc.page_content for doc in result.per_query["q1"]] == ["0", "2"]
+    assert [doc.page_content for doc in result.per_query["q2"]] == ["2", "1"]
+    assert [doc.page_content for doc in result.merged] == ["2", "0", "1"]
+    assert result.scores == sorted(result.scores, reverse=True)
+
+    # q1 restricted to the chunks of https://1
+    restricted = select_top_chunks(documents, ["q1", "q2"], scores, k=2, urls_by_query=[{"https://1"}, None], max_total=2)
+    assert [doc.page_content for doc in restricted.per_query["q1"]] == ["3", "1"]
+    assert len(restricted.merged) == 2
+
+
+def test_lexical_rerank_keeps_chunks_sharing_query_terms():
+    documents = [
+        Document(page_content="Solar panels convert sunlight into electricity.", metadata={"url": "https://a"}),
+        Document(page_content="Wind turbines spin in the wind and wind farms grow.", metadata={"url": "https://b"}),
+        Document(page_content="The history of the printing press.", metadata={"url": "https://c"}),
+    ]
+    for method in ("bm25", "tfidf"):
+        result = LexicalIndex(documents, method=method).rerank(["wind power", "solar electricity"], k=3)
+        assert [doc.metadata["url"] for doc in result.per_query["wind power"]] == ["https://b"]
+        assert [doc.metadata["url"] for doc in result.per_query["solar electricity"]] == ["https://a"]
+        assert {doc.metadata["url"] for doc in result.merged} == {"https://a", "https://b"}
+
+    assert LexicalIndex(documents).score(["the of"]).tolist() == [[0.0, 0.0, 0.0]]
+
+
+def test_stitch_merges_overlapping_and_adjacent_chunks():
+    text = "0123456789abcdefghij"
+    chunks = [
+        Document(page_content=text[8:14], metadata={"url": "https://a", "start_index": 8}),
+        Document(page_content=text[0:10], metadata={"url": "https://a", "start_index": 0}),
+        Document(page_content="other page", metadata={"url": "https://b", "start_index": 0}),
+        Document(page_content=text[15:20], metadata={"url": "https://a", "start_index": 15}),
+        Document(page_content=text[0:10], metadata={"url": "https://a", "start_index": 0}),
+    ]
+
+    stitched = stitch_documents_by_url(chunks)
+    assert [doc.metadata["url"] for doc in stitched] == ["https://a", "https://b"]
+    # overlapping chunks are joined once, the adjacent one after a line break
+    assert stitched[0].page_content == "...0123456789abcd\nfghij..."
+    assert stitched[0].metadata["start_index"] == 8
+
+
+def test_stitch_keeps_distant_chunks_as_separate_spans():
+    chunks = [
+        Document(page_content="late", metadata={"url": "https://a", "start_index": 100}),
+        Document(page_content="early", metadata={"url": "https://a", "start_index": 0}),
+        Document(page_content="unplaced", metadata={"url": "https://a"}),
+    ]
+    assert stitch_documents_by_url(chunks)[0].page_content == "...early...\n\n...late...\n\n...unplaced..."
+
+
+def test_extractive_compress_keeps_relevant_sentences_within_budget():
+    text = (
+        "Cats sleep most of the day. "
+        "Battery storage smooths the output of solar farms. "
+        "Dogs enjoy long walks. "
+        "Grid operators pay for battery storage capacity. "
+        "Parrots can mimic speech."
+    )
+    compressed = extractive_compress(text, ["battery storage"], max_chars=110, separator=" ... ")
+
+    assert len(compressed) <= 110
+    assert "Battery storage smooths the output of solar farms." in compressed
+    assert "Grid operators pay for battery storage capacity." in compressed
+    assert "Parrots" not in compressed
+    # picked sentences stay in page order
+    assert compressed.index("Battery") < compressed.index("Grid")
+
+
+def test_extractive_compress_returns_short_text_unchanged():
+    text = "One sentence. Another one."
+    assert extractive_compress(text, ["anything"], max_chars=100) == text
+    assert [text[start:end] for start, end in split_sentences(text)] == ["One sentence.", "Another one."]
@@ -0,0 +1,104 @@
+"""Unit tests of the failover router over several chat model deployments."""
+
+from typing import Any, List, Optional, Sequence
+
+import pytest
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import BaseModel
+
+from open_deep_research.router import DeploymentHealth, RouteDeployment, RouterChatModel
+from open_deep_research.utils import cacheable_prompt
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class FakeDeployment(BaseChatModel):
+    """Chat model answering with a fixed tool call, or failing with a given error."""
+
+    error: Optional[Exception] = None
+    tools: List[Any] = []
+    calls: int = 0
+    received: List[List[BaseMessage]] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        self.calls += 1
+        self.received = [*self.received, messages]
+        if self.error is not None:
+            raise self.error
+        tool_calls = [{"name": "Answer", "args": {"text": "routed"}, "id": "call-1"}] if self.tools else []
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="", tool_calls=tool_calls))])
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "FakeDeployment":
+        bound = self.model_copy(update={"tools": list(tools)})
+        bound.calls = 0
+        return bound
+
+
+class Answer(BaseModel):
+    """Answer of the model."""
+
+    text: str
+
+
+def _router(*models: FakeDeployment, with_cache_breakpoints: Sequence[int] = ()) -> RouterChatModel:
+    return RouterChatModel(
+        route="test",
+        deployments=[
+            RouteDeployment(name=f"fake-{i}", model=model, priority=i, health=DeploymentHealth(),
+                            cache_breakpoints=i in with_cache_breakpoints)
+            for i, model in enumerate(models)
+        ],
+    )
+
+
+def test_failover_to_the_next_deployment_on_rate_limit():
+    failing, healthy = FakeDeployment(error=RateLimitError("429")), FakeDeployment()
+    router = _router(failing, healthy)
+
+    assert router.invoke("hi").content == ""
+    assert (failing.calls, healthy.calls) == (1, 1)
+    failing_health = router.deployments[0].health
+    assert failing_health.failures == 1
+    assert not failing_health.available(failing_health.cooldown_until - 1)
+    # the failing deployment cools down, the next call goes to the healthy one
+    router.invoke("hi again")
+    assert (failing.calls, healthy.calls) == (1, 2)
+
+
+def test_other_errors_are_raised():
+    router = _router(FakeDeployment(error=ValueError("bad request")), FakeDeployment())
+    with pytest.raises(ValueError):
+        router.invoke("hi")
+
+
+def test_structured_output_binds_the_schema_on_every_deployment():
+    router = _router(FakeDeployment(error=RateLimitError("429")), FakeDeployment())
+    structured = router.with_structured_output(Answer)
+
+    assert structured.invoke("hi") == Answer(text="routed")
+    steps = structured.steps if hasattr(structured, "steps") else [structured]
+    bound_router = steps[0]
+    assert isinstance(bound_router, RouterChatModel)
+    assert all(deployment.model.tools for deployment in bound_router.deployments)
+
+
+def test_cache_breakpoints_only_reach_the_deployments_taking_them():
+    anthropic, openai = FakeDeployment(error=RateLimitError("429")), FakeDeployment()
+    router = _router(anthropic, openai, with_cache_breakpoints=[0])
+    content = cacheable_prompt(router, "static instructions", "dynamic inputs")
+    assert content[0]["cache_control"] == {"type": "ephemeral"}
+
+    router.invoke([SystemMessage(content=content)])
+    assert anthropic.received[0][0].content[0]["cache_control"] == {"type": "ephemeral"}
+    assert openai.received[0][0].content == [{"type": "text", "text": "static instructions"},
+                                              {"type": "text", "text": "dynamic inputs"}]
+    # without a deployment taking them, the prompt is a plain string
+    assert cacheable_prompt(_router(FakeDeployment()), "static instructions") == "static instructions"
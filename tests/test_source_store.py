@@ -0,0 +1,105 @@
+"""Unit tests of the content-addressed source store."""
+
+import sqlite3
+from typing import TypedDict
+
+import pytest
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph import END, START, StateGraph
+
+from open_deep_research import checkpointing
+from open_deep_research.checkpointing import CHECKPOINT_DB_ENV, SqliteCheckpointSaver
+from open_deep_research.source_store import (
+    MissingSourceError,
+    SourceStore,
+    add_source_refs,
+    get_source_store,
+    source_ref,
+)
+
+
+def _source(i: int) -> dict:
+    return {"title": f"Page {i}", "url": f"https://example.com/{i}", "content": f"summary {i}", "raw_content": None, "score": 0.5}
+
+
+def test_sources_are_stored_once_by_content():
+    store = SourceStore()
+    refs = store.put_many([_source(1), _source(2), _source(1)])
+    assert refs[0] == refs[2] == source_ref(_source(1))
+    assert store.put_many([_source(2)]) == [refs[1]]
+    assert store.stats()["writes"] == 2
+    assert store.stats()["duplicates"] == 1
+    # only the record fields are kept
+    assert store.get_many(refs[:2]) == [{k: v for k, v in _source(i).items() if k != "score"} for i in (1, 2)]
+
+
+def test_sources_outlive_the_process_in_sqlite(tmp_path):
+    path = str(tmp_path / "sources.db")
+    refs = SourceStore(path).put_many([_source(1), _source(2)])
+    assert [record["url"] for record in SourceStore(path).get_many(refs[::-1])] == ["https://example.com/2", "https://example.com/1"]
+
+
+def test_in_memory_records_are_bounded():
+    store = SourceStore(max_records=2)
+    refs = store.put_many([_source(i) for i in range(3)])
+    assert store.stats()["records"] == 2
+    assert store.stats()["evictions"] == 1
+    assert len(store.get_many(refs[1:])) == 2
+    with pytest.raises(MissingSourceError):
+        store.get_many(refs)
+
+
+def test_evicted_records_are_read_back_from_sqlite(tmp_path):
+    store = SourceStore(str(tmp_path / "sources.db"), max_records=1)
+    refs = store.put_many([_source(1), _source(2)])
+    assert [record["title"] for record in store.get_many(refs)] == ["Page 1", "Page 2"]
+
+
+def test_default_store_is_the_checkpoint_database(tmp_path, monkeypatch):
+    monkeypatch.setenv(CHECKPOINT_DB_ENV, str(tmp_path / "checkpoints.db"))
+    assert get_source_store().path == str(tmp_path / "checkpoints.db")
+    monkeypatch.delenv(CHECKPOINT_DB_ENV)
+    assert get_source_store().path is None
+
+
+def test_refs_reducer_keeps_order_and_resets_on_none():
+    assert add_source_refs(["a", "b"], ["b", "c"]) == ["a", "b", "c"]
+    assert add_source_refs(None, ["a"]) == ["a"]
+    assert add_source_refs(["a"], None) == []
+
+
+class SearchState(TypedDict):
+    sources: list[int]
+    refs: list[str]
+
+
+def test_sources_of_pruned_threads_are_deleted_unless_still_referenced(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+    saver = SqliteCheckpointSaver(path, max_age_days=1)
+    store = SourceStore(path)
+
+    def search(state: SearchState, config: RunnableConfig):
+        return {"refs": store.put_many([_source(i) for i in state["sources"]], config["configurable"]["thread_id"])}
+
+    builder = StateGraph(SearchState)
+    builder.add_node("search", search)
+    builder.add_edge(START, "search")
+    builder.add_edge("search", END)
+    graph = builder.compile(checkpointer=saver)
+    refs = {
+        thread_id: graph.invoke({"sources": sources}, {"configurable": {"thread_id": thread_id}})["refs"]
+        for thread_id, sources in (("old", [1, 2]), ("new", [1, 3]))
+    }
+    with sqlite3.connect(path) as connection:
+        # the sources are part of the stored size of the checkpoints
+        size = checkpointing._stored_size(connection)
+        connection.execute("DELETE FROM sources")
+        assert checkpointing._stored_size(connection) < size
+        connection.rollback()
+        connection.execute("UPDATE threads SET updated_at = updated_at - 2 * 86400 WHERE thread_id = 'old'")
+
+    assert saver.prune_storage()["threads"] == 1
+    reloaded = SourceStore(path)
+    assert [record["title"] for record in reloaded.get_many(refs["new"])] == ["Page 1", "Page 3"]
+    with pytest.raises(MissingSourceError):
+        reloaded.get_many(refs["old"][1:])